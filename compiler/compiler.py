@@ -1,6 +1,5 @@
 from timeit import default_timer as timer
 
-import colorlog
 import networkx as nx
 from antlr4 import *
 from z3 import Solver
@@ -8,6 +7,7 @@ from z3 import Solver
 import compiler.config.config as config
 from compiler.data_structures.program import Program
 from compiler.data_structures.symbol_table import SymbolTable
+from compiler.data_structures.variable import VolumeMap
 from compiler.data_structures.writable import Writable, WritableType
 from compiler.passes.pass_manager import PassManager
 from compiler.semantics.header_visitor import HeaderVisitor
@@ -18,13 +18,14 @@ from compiler.semantics.type_visitor import TypeCheckVisitor
 from compiler.targets.target_selector import TargetSelector
 from grammar.parsers.python.BSLexer import BSLexer
 from grammar.parsers.python.BSParser import BSParser
+from shared.lazy_logger import LazyLogger
 
 
 class BSCompiler(object):
+    log = LazyLogger()
 
     def __init__(self, configuration: config.Config):
         self.config = configuration
-        self.log = colorlog.getLogger(self.__class__.__name__)
         if self.config.debug:
             self.log.debug(self.config.input)
         # The symbol table is built in phases,
@@ -35,6 +36,7 @@ class BSCompiler(object):
 
     def compile(self):
         times = {"sa": 0, "opts": 0, "target": 0, "tc": 0}
+        VolumeMap.reset_stats()
 
         start = timer()
         ir = self.translate(self.config.input)
@@ -43,6 +45,9 @@ class BSCompiler(object):
         start = timer()
         prog = self.optimizations(self.program)
         times['opts'] = timer() - start
+        self.program.stats['Volume maps shared'] = VolumeMap.shared
+        self.program.stats['Volume maps copied'] = VolumeMap.copied
+        self.program.stats['Volume copies saved'] = VolumeMap.shared - VolumeMap.copied
 
         start = timer()
         target = self.target(prog)
@@ -76,6 +81,8 @@ class BSCompiler(object):
             stats += "Target Gen:\t\t\t{}\n".format(round(times['target'], 4))
             stats += "Writing to disk:\t{}\n".format(round(times['write'], 4))
             stats += "Total:\t\t\t\t{}".format(round(sum(times.values()), 4))
+            for key, value in self.program.stats.items():
+                stats += "\n{}:\t{}".format(key, value)
             self.log.debug(stats)
 
         if not target:
@@ -131,8 +138,7 @@ class BSCompiler(object):
         :return:
         """
         passes = PassManager(self.program)
-        passes.run_analysis()
-        passes.run_transformations()
+        passes.run()
         return passes.program
 
     def target(self, program: Program):
@@ -22,6 +22,8 @@ class CompilerCLI(BaseCLI):
                                  help="Write the CFG to dot file", default=False, action='store_true')
         self.parser.add_argument('-inline', '--inline', help="Inline all, non-recursive functions", default=False,
                                  action='store_true')
+        self.parser.add_argument('-it', '--inline-threshold', help="The most instructions inlining a call may add",
+                                 default=32, type=int)
         self.parser.add_argument('-stats', '--stats', help="Print the stats", default=False,
                                  action='store_true')
 
@@ -29,6 +31,19 @@ class CompilerCLI(BaseCLI):
 
         self.parser.add_argument('-lu', '--loopunroll', help="Perform loop unrolling",
                                  default=False, action='store_true')
+        self.parser.add_argument('-ub', '--unroll-budget', help="The most instructions an unrolled loop may grow to",
+                                 default=256, type=int)
+        self.parser.add_argument('-sccp', '--constant-propagation', help="Fold constants, and the branches they decide",
+                                 default=False, action='store_true')
+        self.parser.add_argument('-gvn', '--value-numbering', help="Remove the numbers that are computed twice",
+                                 default=False, action='store_true')
+        self.parser.add_argument('-cd', '--coalesce-dispenses', help="Dispense the droplets of the same reagent "
+                                                                     "in a block as one array",
+                                 default=False, action='store_true')
+        self.parser.add_argument('-dce', '--dead-code', help="Remove dead code, and the droplets nothing uses",
+                                 default=False, action='store_true')
+        self.parser.add_argument('-passes', '--passes', help="A comma separated list of the passes to run, in order, "
+                                                             "e.g. def_use,split_edges,out_of_ssa", default=None)
 
         chemistry = self.parser.add_argument_group('chemistry', 'Chemistry specific arguments')
         chemistry.add_argument('-sim', '--simulate', help='Simulate chemistry.', default=False,
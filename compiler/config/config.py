@@ -1,8 +1,6 @@
 import os
 import sys
 
-import colorlog
-
 import chemicals.chemtypes as ct
 import chemicals.combiner as combiner
 import chemicals.identifier as identifier
@@ -10,12 +8,13 @@ import compiler.semantics.type_visitor as tv
 import compiler.targets.target_selector as targets
 from compiler.data_structures.properties import BSVolume
 from shared.components import FlowType
+from shared.lazy_logger import LazyLogger
 
 
 class Config(object):
+    log = LazyLogger()
 
     def __init__(self, args=None):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         """
         General Stuff
         """
@@ -53,7 +52,14 @@ class Config(object):
         self.supports_nesting = False
         self.write_cfg = args.write_cfg
         self.inline = False
+        self.inline_threshold = 32
         self.loopunroll = False
+        self.unroll_budget = 256
+        self.constant_propagation = False
+        self.value_numbering = False
+        self.coalesce_dispenses = False
+        self.dead_code = False
+        self.passes = None
         """
         Necessary for identify
         """
@@ -93,6 +99,7 @@ class Config(object):
         # Converts: /path/to/bioscript.bs => bioscript
         self.input_file = args.input.split("/")[-1].split(".")[0]
         self.inline = args.inline
+        self.inline_threshold = max(0, args.inline_threshold)
         # self.log.info(self.input_file)
         self.db['name'] = args.dbname
         self.db['user'] = args.dbuser
@@ -105,6 +112,14 @@ class Config(object):
 
         if args.loopunroll:
             self.loopunroll = True
+        self.unroll_budget = max(0, args.unroll_budget)
+        self.constant_propagation = args.constant_propagation
+        self.value_numbering = args.value_numbering
+        self.coalesce_dispenses = args.coalesce_dispenses
+        self.dead_code = args.dead_code
+
+        if args.passes:
+            self.passes = tuple(name.strip() for name in args.passes.split(',') if name.strip())
 
         if args.typechecklevel.lower() == "none":
             self.error_level = ct.ReportingLevel.NONE
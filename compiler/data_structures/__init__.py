@@ -1,4 +1,5 @@
 from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
 from compiler.data_structures.ir import *
 from compiler.data_structures.program import Program
 from compiler.data_structures.scope import *
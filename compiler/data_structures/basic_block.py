@@ -1,7 +1,6 @@
-import colorlog
-
 # import compiler.data_structures.ir as ir
 from compiler.data_structures.ir import *
+from shared.lazy_logger import LazyLogger
 
 
 # import compiler.data_structures.variable as variable
@@ -9,10 +8,10 @@ from compiler.data_structures.ir import *
 
 class BasicBlock(object):
     id_counter = 1
+    log = LazyLogger()
 
     def __init__(self, name: str = ""):
         self.nid = BasicBlock.get_next_id()
-        self.log = colorlog.getLogger(name=BasicBlock.__name__)
         self.name = name
         # The list of BB ids this block can reach.
         self.jumps = list()
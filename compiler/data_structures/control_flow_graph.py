@@ -0,0 +1,256 @@
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Set
+
+import networkx as nx
+
+
+class CSR(NamedTuple):
+    """
+    The compressed sparse row form of a graph.
+    Block i's successors are succ_targets[succ_offsets[i]:succ_offsets[i + 1]],
+    and likewise for its predecessors.  Targets are indices, not block ids.
+    """
+    nodes: List[int]
+    index: Dict[int, int]
+    succ_offsets: array
+    succ_targets: array
+    pred_offsets: array
+    pred_targets: array
+
+
+class ControlFlowGraph(object):
+    """
+    A compact, integer indexed control flow graph of basic blocks.
+    The graph is edited through the usual graph operations, and the
+    CSR arrays are (re)built lazily the first time they are needed
+    after a change.  Every change bumps the version, so analyses
+    can cache results against a version of the graph.  A block
+    belongs to the function its 'function' attribute names, and
+    each function also has a version, which only the changes to its
+    own blocks, and the edges between them, bump.
+    """
+
+    def __init__(self):
+        # Block id -> node attributes; this also keeps the insertion order.
+        self._attrs = dict()
+        self._succ = dict()
+        self._pred = dict()
+        self.version = 0
+        # Block id -> the function it belongs to.
+        self._owner = dict()
+        # Function -> its version.
+        self._function_versions = dict()
+        self._csr = None
+
+    @classmethod
+    def from_networkx(cls, graph: nx.DiGraph) -> 'ControlFlowGraph':
+        cfg = cls()
+        for nid, data in graph.nodes(data=True):
+            cfg.add_node(nid, **data)
+        for source, destination in graph.edges():
+            cfg.add_edge(source, destination)
+        return cfg
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        This should only be used for dot output and planarity checks;
+        changes to the returned graph are not reflected in this graph.
+        :return: A networkx copy of this graph.
+        """
+        graph = nx.DiGraph()
+        for nid, data in self._attrs.items():
+            graph.add_node(nid, **data)
+        graph.add_edges_from(self.edges())
+        return graph
+
+    def __getstate__(self):
+        # The CSR arrays are rebuilt on demand; don't ship them.
+        state = dict(self.__dict__)
+        state['_csr'] = None
+        return state
+
+    def _changed(self, *functions: str):
+        """
+        :param functions: The functions whose graphs changed.
+        """
+        self.version += 1
+        self._csr = None
+        for function in functions:
+            if function is not None:
+                self._function_versions[function] = self._function_versions.get(function, 0) + 1
+
+    def _shared_owner(self, source: int, destination: int) -> str:
+        """
+        :return: The function an edge is within, or None if it goes between functions.
+        """
+        owner = self._owner.get(source)
+        return owner if owner == self._owner.get(destination) else None
+
+    def function_version(self, function: str) -> int:
+        """
+        :param function: The function.
+        :return: The version of the function's part of the graph.
+        """
+        return self._function_versions.get(function, 0)
+
+    def own(self, nid: int, function: str):
+        """
+        Makes a block part of a function.  The block doesn't have to be
+        a node of the graph (e.g.: the block a call returns to, which
+        no edge reaches); until it is one, it has no edges and isn't
+        listed with the nodes, but its function's subgraph has it.
+        :param nid: The block id.
+        :param function: The function.
+        :return: None
+        """
+        self._succ.setdefault(nid, list())
+        self._pred.setdefault(nid, list())
+        previous = self._owner.get(nid)
+        if previous != function:
+            self._owner[nid] = function
+            self._changed(previous, function)
+
+    def add_node(self, nid: int, **attrs):
+        if nid not in self._attrs:
+            self._attrs[nid] = dict()
+            self._succ.setdefault(nid, list())
+            self._pred.setdefault(nid, list())
+            self._changed(self._owner.get(nid))
+        self._attrs[nid].update(attrs)
+        if 'function' in attrs:
+            self.own(nid, attrs['function'])
+
+    def add_edge(self, source: int, destination: int):
+        self.add_node(source)
+        self.add_node(destination)
+        if destination not in self._succ[source]:
+            self._succ[source].append(destination)
+            self._pred[destination].append(source)
+            self._changed(self._shared_owner(source, destination))
+
+    def add_edges_from(self, edges: Iterable):
+        for source, destination in edges:
+            self.add_edge(source, destination)
+
+    def remove_edge(self, source: int, destination: int):
+        self._succ[source].remove(destination)
+        self._pred[destination].remove(source)
+        self._changed(self._shared_owner(source, destination))
+
+    def remove_node(self, nid: int):
+        for succ in self._succ[nid]:
+            self._pred[succ].remove(nid)
+        for pred in self._pred[nid]:
+            if pred != nid:
+                self._succ[pred].remove(nid)
+        del self._succ[nid]
+        del self._pred[nid]
+        self._attrs.pop(nid, None)
+        self._changed(self._owner.pop(nid, None))
+
+    def __contains__(self, nid: int) -> bool:
+        return nid in self._attrs
+
+    def __iter__(self):
+        return iter(self._attrs)
+
+    def __len__(self) -> int:
+        return len(self._attrs)
+
+    def nodes(self, data: bool = False) -> List:
+        if data:
+            return list(self._attrs.items())
+        return list(self._attrs)
+
+    def node_attrs(self, nid: int) -> Dict:
+        return self._attrs[nid]
+
+    def edges(self) -> List:
+        return [(source, destination) for source, succs in self._succ.items() for destination in succs]
+
+    def number_of_edges(self) -> int:
+        return sum(len(succs) for succs in self._succ.values())
+
+    def successors(self, nid: int) -> List[int]:
+        """
+        The returned list belongs to the graph, don't modify it.
+        :param nid: The block id.
+        :return: The successors of the block, in insertion order.
+        """
+        return self._succ[nid]
+
+    def predecessors(self, nid: int) -> List[int]:
+        """
+        The returned list belongs to the graph, don't modify it.
+        :param nid: The block id.
+        :return: The predecessors of the block, in insertion order.
+        """
+        return self._pred[nid]
+
+    def in_degree(self, nid: int) -> int:
+        return len(self._pred[nid])
+
+    def out_degree(self, nid: int) -> int:
+        return len(self._succ[nid])
+
+    def csr(self) -> CSR:
+        """
+        Builds (or gets the cached) CSR arrays for the current version of the graph.
+        :return: The CSR form of the graph.
+        """
+        if self._csr is None:
+            nodes = list(self._attrs)
+            index = {nid: i for i, nid in enumerate(nodes)}
+            succ_offsets, succ_targets = array('i', [0]), array('i')
+            pred_offsets, pred_targets = array('i', [0]), array('i')
+            for nid in nodes:
+                succ_targets.extend(index[succ] for succ in self._succ[nid])
+                succ_offsets.append(len(succ_targets))
+                pred_targets.extend(index[pred] for pred in self._pred[nid])
+                pred_offsets.append(len(pred_targets))
+            self._csr = CSR(nodes, index, succ_offsets, succ_targets, pred_offsets, pred_targets)
+        return self._csr
+
+    def reachable(self, source: int) -> Set[int]:
+        """
+        Breadth first search over the CSR arrays.
+        :param source: The block to start from.
+        :return: The blocks reachable from source, not including source itself.
+        """
+        if source not in self._attrs:
+            return set()
+        csr = self.csr()
+        offsets, targets = csr.succ_offsets, csr.succ_targets
+        start = csr.index[source]
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            for j in targets[offsets[i]:offsets[i + 1]]:
+                if j not in seen:
+                    seen.add(j)
+                    queue.append(j)
+        seen.discard(start)
+        return {csr.nodes[i] for i in seen}
+
+    def subgraph(self, nids: Iterable[int]) -> 'ControlFlowGraph':
+        """
+        The successors and predecessors of each block keep
+        their order, so phi operands line up with either graph.
+        :param nids: The blocks to keep, in the order the new graph has them.
+        :return: A new graph induced by the given blocks.
+        """
+        keep = [nid for nid in nids if nid in self._succ]
+        members = set(keep)
+        sub = ControlFlowGraph()
+        for nid in keep:
+            sub.add_node(nid, **self._attrs.get(nid, dict()))
+        for nid in keep:
+            sub._succ[nid] = [succ for succ in self._succ[nid] if succ in members]
+            sub._pred[nid] = [pred for pred in self._pred[nid] if pred in members]
+        sub._changed()
+        return sub
+
+    def copy(self) -> 'ControlFlowGraph':
+        return self.subgraph(self._attrs)
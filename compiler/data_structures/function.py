@@ -14,7 +14,7 @@ class Function(object):
         # elsewhere into the correct state.
         self._temp_args = arguments
         # This is the actual argument list for the method.
-        self._args = copy.deepcopy(arguments)
+        self._args = list(arguments)
 
     @property
     def args(self):
@@ -24,7 +24,13 @@ class Function(object):
     def args(self, element: Dict):
         if len(self._args) == self._temp_args:
             return
-        arg = copy.deepcopy(element['var'])
+        arg = copy.copy(element['var'])
+        # The argument is a symbol of its own, so it mustn't share
+        # the caller's containers, or its interned id.
+        arg.types = set(arg.types)
+        arg.volumes = arg.volumes.fork()
+        arg.value = copy.deepcopy(arg.value)
+        arg.sid = -1
         arg.scope = self.name
         arg.name = self._temp_args[len(self._args) - 1]
         self._args.append(arg)
@@ -35,6 +35,7 @@ class IRInstruction(IntEnum):
     TIME = 21
     TEMPERATURE = 22
     MATH = 23
+    COPY = 24
 
 
 class BinaryOps(IntEnum):
@@ -91,7 +92,8 @@ class InstructionSet(metaclass=ABCMeta):
                     IRInstruction.GRADIENT}
 
     assignment = {IRInstruction.MIX, IRInstruction.SPLIT, IRInstruction.DISPENSE, IRInstruction.PHI,
-                  IRInstruction.CALL, IRInstruction.MATH, IRInstruction.GRADIENT, IRInstruction.DETECT}
+                  IRInstruction.CALL, IRInstruction.MATH, IRInstruction.GRADIENT, IRInstruction.DETECT,
+                  IRInstruction.COPY}
 
     numeric_assignment = {IRInstruction.CONSTANT, IRInstruction.MATH}
 
@@ -468,6 +470,34 @@ class Store(Statement):
         return "STORE:\t {} = {}".format(self.defs, self.uses)
 
 
+class Copy(Statement):
+    """
+    Moves a value from one name to another.
+    These come from lowering phi nodes out of SSA form.
+    """
+    def __init__(self, out: Dict, use: Dict):
+        super().__init__(IRInstruction.COPY, out)
+        self.uses.append(use)
+
+    def expand(self) -> List:
+        ret = list()
+        if self.defs['size'] > 1 and self.defs['offset'] == -1:
+            for x in range(self.defs['size']):
+                ret.append(Copy({'name': self.defs['name'], 'offset': x,
+                                 'size': self.defs['size'], 'var': self.defs['var']},
+                                {'name': self.uses[0]['name'], 'offset': x,
+                                 'size': self.uses[0]['size'], 'var': self.uses[0]['var']}))
+                # Always save the meta operations.
+                ret[-1].meta = self.meta
+        else:
+            ret.append(self)
+        return ret
+
+    def __str__(self):
+        return "{}[{}] = copy({}[{}])".format(self.defs['name'], self.defs['offset'],
+                                             self.uses[0]['name'], self.uses[0]['offset'])
+
+
 """
 ========================================================
 Control IR:
@@ -0,0 +1,137 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Any, List, NamedTuple
+
+
+class Span(NamedTuple):
+    """
+    A contiguous run of lanes, [start, stop), of a droplet array.
+    """
+    name: str
+    start: int
+    stop: int
+
+    @property
+    def width(self) -> int:
+        return self.stop - self.start
+
+    def overlaps(self, other: 'Span') -> bool:
+        return self.name == other.name and self.start < other.stop and other.start < self.stop
+
+    def __str__(self):
+        if self.width == 1:
+            return f"{self.name}_{self.start}"
+        return f"{self.name}_{self.start}-{self.stop - 1}"
+
+
+class LaneMap(object):
+    """
+    Maps the lanes of droplet arrays to values, one span at a time.
+    For each array, this keeps a sorted list of disjoint
+    (start, stop, value) intervals, so binding or looking up an
+    n-wide span doesn't cost n operations.
+    """
+
+    def __init__(self):
+        self._lanes = defaultdict(list)
+
+    def bind(self, span: Span, value: Any):
+        """
+        Binds the lanes of the span that aren't bound yet.
+        :param span: The lanes to bind.
+        :param value: The value to bind them to.
+        :return: None
+        """
+        intervals = self._lanes[span.name]
+        cursor = span.start
+        gaps = list()
+        for start, stop, _ in intervals:
+            if stop <= cursor:
+                continue
+            if start >= span.stop:
+                break
+            if start > cursor:
+                gaps.append((cursor, start, value))
+            cursor = stop
+        if cursor < span.stop:
+            gaps.append((cursor, span.stop, value))
+        if gaps:
+            intervals.extend(gaps)
+            intervals.sort(key=lambda interval: interval[0])
+
+    def rebind(self, span: Span, value: Any):
+        """
+        Binds all the lanes of the span, replacing any previous binding.
+        :param span: The lanes to bind.
+        :param value: The value to bind them to.
+        :return: None
+        """
+        kept = list()
+        for start, stop, old in self._lanes[span.name]:
+            if stop <= span.start or start >= span.stop:
+                kept.append((start, stop, old))
+                continue
+            if start < span.start:
+                kept.append((start, span.start, old))
+            if stop > span.stop:
+                kept.append((span.stop, stop, old))
+        kept.append((span.start, span.stop, value))
+        kept.sort(key=lambda interval: interval[0])
+        self._lanes[span.name] = kept
+
+    def get(self, name: str, lane: int) -> Any:
+        for start, stop, value in self._lanes.get(name, []):
+            if start <= lane < stop:
+                return value
+        raise KeyError(f"{name}_{lane}")
+
+    def values(self, span: Span) -> List[Any]:
+        """
+        :param span: The lanes to look up.
+        :return: The distinct values bound to the span, in lane order.
+        """
+        found = list()
+        for start, stop, value in self._lanes.get(span.name, []):
+            if start < span.stop and span.start < stop and not any(value is f for f in found):
+                found.append(value)
+        return found
+
+
+class LaneUses(object):
+    """
+    The spans of droplet arrays that instructions use.
+    For each array, this keeps the uses sorted by their first lane,
+    so finding the uses that overlap a span is a bisect, and a scan
+    of the uses that start no more than the widest use before it,
+    instead of a scan of every use of the array.
+    """
+
+    def __init__(self):
+        # Array -> sorted list of (start, order, stop, value).
+        self._uses = defaultdict(list)
+        # Array -> the width of its widest use.
+        self._widest = defaultdict(int)
+        self._order = 0
+
+    def add(self, span: Span, value: Any):
+        """
+        :param span: The lanes used.
+        :param value: What uses them.
+        :return: None
+        """
+        insort(self._uses[span.name], (span.start, self._order, span.stop, value))
+        self._widest[span.name] = max(self._widest[span.name], span.width)
+        self._order += 1
+
+    def users(self, span: Span) -> List[Any]:
+        """
+        :param span: The lanes to look for.
+        :return: What uses any of the lanes, in the order they were added.
+        """
+        uses = self._uses.get(span.name, [])
+        # A use that starts before this can't reach the span.
+        low = bisect_left(uses, (span.start - self._widest[span.name] + 1,))
+        high = bisect_left(uses, (span.stop,))
+        found = [(order, value) for start, order, stop, value in uses[low:high] if stop > span.start]
+        found.sort(key=lambda use: use[0])
+        return [value for _, value in found]
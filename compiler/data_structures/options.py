@@ -0,0 +1,52 @@
+from typing import NamedTuple
+
+from compiler.data_structures.properties import BSVolume
+from shared.components import FlowType
+
+
+class Options(NamedTuple):
+    """
+    The immutable subset of the compiler configuration
+    that a program (and everything that works on it) needs.
+    Unlike Config, this is small and cheap to pickle.
+    """
+    debug: bool = False
+    input: str = None
+    input_file: str = None
+    output: str = './'
+    write_out: bool = False
+    write_cfg: bool = False
+    print_stats: bool = False
+    units: BSVolume = BSVolume.MICROLITRE
+    inline: bool = False
+    # The most instructions inlining a call may add, beyond those it removes.
+    inline_threshold: int = 32
+    loopunroll: bool = False
+    # The most instructions an unrolled loop may grow to.
+    unroll_budget: int = 256
+    constant_propagation: bool = False
+    value_numbering: bool = False
+    # Whether value numbering turns dispenses of the same reagent into one dispense of an array.
+    coalesce_dispenses: bool = False
+    dead_code: bool = False
+    # The names of the passes to run, in order; None runs the default pipeline.
+    passes: tuple = None
+    # A TargetSelector; it's kept as an int to avoid importing the targets here.
+    target: int = 0
+    # Inkwell options.
+    library: str = './resources/flow/components.json'
+    flow_type: FlowType = FlowType.PASSIVE
+    use_local_db: bool = True
+    schema: str = './resources/flow/parchmint_schema.json'
+    validate_schema: bool = False
+
+    @classmethod
+    def from_config(cls, config) -> 'Options':
+        """
+        Builds the options from a Config (or anything with the same attributes).
+        :param config: The configuration.
+        :return: The options; anything missing from config keeps its default.
+        """
+        if isinstance(config, cls):
+            return config
+        return cls(**{field: getattr(config, field, default) for field, default in cls._field_defaults.items()})
@@ -1,5 +1,9 @@
 from typing import Dict
 
+import networkx as nx
+
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
+from compiler.data_structures.options import Options
 from compiler.data_structures.symbol_table import SymbolTable
 
 
@@ -19,7 +23,12 @@ class Program(object):
         # The symbol table for the program
         self.symbol_table = symbol_table
         # The basic block based control flow graph
-        self.bb_graph = bb_graph
+        self.cfg = ControlFlowGraph.from_networkx(bb_graph) if bb_graph is not None else ControlFlowGraph()
+        # The per function control flow graphs, keyed by function name.
+        self._function_cfgs = dict()
+        self._own_blocks()
+        # The networkx view of the control flow graph.
+        self._bb_graph = None
         # The name of the graph
         self.name = name
         # Is this program in SSA form?
@@ -30,10 +39,69 @@ class Program(object):
         self.globalz = globalz if globalz else self.symbol_table.globals
         # keep the call graph.
         self.calls = calls
-        # The config object
-        self.config = config
+        # The options the program is compiled with; this is
+        # an immutable snapshot of the config object.
+        self.config = Options.from_config(config) if config is not None else Options()
         # The data that needs writing.
         self.write = dict()
+        # Counters collected during compilation, reported with -stats.
+        self.stats = dict()
         # for source, destinations in calls.items():
         #     for destination in destinations:
         #         self.bb_graph.add_edge(self.functions[source]['entry'], self.functions[destination]['entry'])
+
+    def __getstate__(self):
+        # The cached graph views are rebuilt on demand; don't ship them.
+        state = dict(self.__dict__)
+        state['_bb_graph'] = None
+        state['_function_cfgs'] = dict()
+        return state
+
+    def _own_blocks(self):
+        # Not every block is a node of the graph the front end builds, e.g.:
+        # the block a call returns to; its function's graph still has it.
+        for root, function in self.functions.items():
+            for nid in function['blocks']:
+                self.cfg.own(nid, root)
+
+    @property
+    def bb_graph(self) -> nx.DiGraph:
+        """
+        A networkx view of the control flow graph.
+        This is only for dot output and planarity checks;
+        changes to it are not reflected in the control flow graph.
+        :return: The view, rebuilt only when the control flow graph changes.
+        """
+        if self._bb_graph is None or self._bb_graph[0] is not self.cfg or self._bb_graph[1] != self.cfg.version:
+            self._bb_graph = (self.cfg, self.cfg.version, self.cfg.to_networkx())
+        return self._bb_graph[2]
+
+    @bb_graph.setter
+    def bb_graph(self, graph: nx.DiGraph):
+        self.cfg = ControlFlowGraph.from_networkx(graph)
+        self._function_cfgs = dict()
+        self._bb_graph = None
+        self._own_blocks()
+
+    def function_cfg(self, root: str) -> ControlFlowGraph:
+        """
+        The control flow graph of a single function,
+        i.e. without the edges into and out of other functions.
+        Control carries on from a call to the block it returns
+        to, so the function's graph has an edge between them,
+        which the program's graph doesn't (see: 'returns').
+        It's only rebuilt when the function's part of the graph
+        changes; changes to other functions leave it be.
+        :param root: The name of the function.
+        :return: The function's control flow graph.
+        """
+        cached = self._function_cfgs.get(root)
+        version = self.cfg.function_version(root)
+        if cached is None or cached[0] is not self.cfg or cached[1] != version:
+            cfg = self.cfg.subgraph(self.functions[root]['blocks'])
+            for call, after in self.functions[root].get('returns', dict()).items():
+                if call in cfg and after in cfg:
+                    cfg.add_edge(call, after)
+            cached = (self.cfg, version, cfg)
+            self._function_cfgs[root] = cached
+        return cached[2]
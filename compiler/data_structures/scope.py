@@ -15,16 +15,17 @@ class Scope(object):
         self.name = name
         self.locals = dict()
 
-    def add_local(self, local: Symbol):
+    def add_local(self, local: Symbol) -> Symbol:
         """
         Adds a local variable to the scope.
         :param local: Variable that belongs to this scope.
-        :return: None
+        :return: The symbol bound to the name in this scope.
         """
         if local.name not in self.locals:
             self.locals[local.name] = local
         else:
             self.locals[local.name].types.update(local.types)
+        return self.locals[local.name]
 
     def __str__(self):
         output = ""
@@ -1,13 +1,15 @@
-import colorlog
+from collections import defaultdict
+from typing import Dict, Tuple
 
 from compiler.data_structures.scope import Scope
-from compiler.data_structures.variable import Symbol
+from compiler.data_structures.variable import Symbol, RenamedSymbol
+from shared.lazy_logger import LazyLogger
 
 
 class SymbolTable(object):
+    log = LazyLogger()
 
     def __init__(self, name="main"):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         # Name of global scope
         self.global_scope = "global"
         self.current_scope = Scope(name)
@@ -16,6 +18,112 @@ class SymbolTable(object):
         self.functions = dict()
         self.globals = dict()
         self.scope_map[self.current_scope.name] = self.current_scope
+        # Every symbol (global, local, or SSA version) is interned
+        # here; the index of a symbol in this list is its sid.
+        self.symbols = list()
+        # (base sid, SSA version) -> sid of the versioned symbol.
+        self.versions = dict()
+        # (base sid, SSA version) -> name of the versioned symbol.
+        self.version_names = dict()
+        # sid -> name of the scope the symbol was added to.
+        self.homes = dict()
+        # Scope name -> version name -> (base sid, SSA version),
+        # for the versions a function can name; see scope_versions.
+        self.scope_version_index = defaultdict(dict)
+        # Version name -> (base sid, SSA version), for versions of globals.
+        self.global_versions = dict()
+
+    def intern(self, symbol: Symbol, scope_name: str = None) -> int:
+        """
+        Gives a symbol its integer id, if it doesn't have one.
+        :param symbol: The symbol to intern.
+        :param scope_name: The scope the symbol was added to, if any.
+        :return: The sid of the symbol.
+        """
+        if symbol.sid < 0:
+            symbol.sid = len(self.symbols)
+            self.symbols.append(symbol)
+        if scope_name is not None and symbol.sid not in self.homes:
+            self.homes[symbol.sid] = scope_name
+        return symbol.sid
+
+    def get_symbol_by_id(self, sid: int) -> Symbol:
+        return self.symbols[sid]
+
+    def get_symbol_id(self, name: str, scope_name: str = False) -> int:
+        """
+        String shim for the interned symbols.
+        :param name: The name of the symbol.
+        :param scope_name: The scope name to look in.
+        :return: The sid of the symbol, -1 if it doesn't exist.
+        """
+        symbol = self.get_symbol(name, scope_name)
+        return -1 if symbol is None else symbol.sid
+
+    def version_name(self, base: int, version: int) -> str:
+        """
+        Builds the name of an SSA version of a symbol,
+        e.g.: (a, 2) -> 'a2'.  The names are cached,
+        so each version's name is built only once.
+        :param base: sid of the un-renamed symbol.
+        :param version: The SSA version.
+        :return: The name of the version.
+        """
+        key = (base, version)
+        if key not in self.version_names:
+            symbol = self.symbols[base]
+            name = f"{symbol.name}{version}"
+            self.version_names[key] = name
+            if self.globals.get(symbol.name) is symbol:
+                self.global_versions[name] = key
+            elif base in self.homes:
+                self.scope_version_index[self.homes[base]][name] = key
+        return self.version_names[key]
+
+    def get_version(self, base: int, version: int) -> Symbol:
+        key = (base, version)
+        if key in self.versions:
+            return self.symbols[self.versions[key]]
+        return None
+
+    def add_version(self, symbol: RenamedSymbol, scope_name: str) -> Symbol:
+        """
+        Add an SSA version of a symbol to a scope.
+        :param symbol: The renamed symbol.
+        :param scope_name: The name of the scope to add the version.
+        :return: The interned version of the symbol.
+        """
+        key = (symbol.base, symbol.version)
+        if key in self.versions:
+            return self.symbols[self.versions[key]]
+        local = self.scope_map[scope_name].add_local(symbol)
+        self.versions[key] = self.intern(local, scope_name)
+        self.scope_version_index[scope_name][symbol.name] = key
+        return local
+
+    def scope_versions(self, scope_name: str) -> Dict[str, Tuple[int, int]]:
+        """
+        The SSA versions a function can name.  Locals of different functions
+        can share a name, and so the names of their versions, e.g.: a1,
+        so version names only mean something within a function.
+        :param scope_name: The name of the function's scope.
+        :return: Version name -> (base sid, SSA version), for the versions of
+            the globals, of the function's locals, and those added to its scope.
+        """
+        versions = dict(self.global_versions)
+        versions.update(self.scope_version_index.get(scope_name, {}))
+        return versions
+
+    def get_versioned(self, sid: int) -> Tuple[int, int]:
+        """
+        The versioned representation of a symbol.
+        :param sid: The interned id of a symbol.
+        :return: (base sid, SSA version)
+        """
+        symbol = self.symbols[sid]
+        if isinstance(symbol, RenamedSymbol):
+            return symbol.base, symbol.version
+        return symbol.sid, symbol.version
 
     def new_scope(self, name: str) -> None:
         self.scope_stack.append(self.current_scope)
@@ -30,6 +138,7 @@ class SymbolTable(object):
 
     def update_symbol(self, symbol: Symbol) -> Symbol:
         self.current_scope.locals[symbol.name] = symbol
+        self.intern(symbol, self.current_scope.name)
         return symbol
 
     def get_local(self, name: str, scope_name: str = False) -> Symbol:
@@ -49,7 +158,7 @@ class SymbolTable(object):
         :param symbol: Variable to be added.
         :return: None.
         """
-        self.current_scope.add_local(symbol)
+        self.intern(self.current_scope.add_local(symbol), self.current_scope.name)
 
     def add_local_to_scope(self, symbol: Symbol, scope_name: str):
         """
@@ -58,7 +167,7 @@ class SymbolTable(object):
         :param scope_name: The name of scope to add the variable.
         :return: None.
         """
-        self.scope_map[scope_name].add_local(symbol)
+        self.intern(self.scope_map[scope_name].add_local(symbol), scope_name)
 
     def get_global(self, name: str) -> Symbol:
         if name in self.globals:
@@ -68,6 +177,7 @@ class SymbolTable(object):
 
     def add_global(self, symbol: Symbol) -> None:
         self.globals[symbol.name] = symbol
+        self.intern(symbol)
 
     def is_global(self, var: str) -> bool:
         return var in self.globals
@@ -1,11 +1,106 @@
 from abc import ABCMeta, abstractmethod
-from copy import deepcopy
-from typing import Set, Any, Tuple
-
-import colorlog
+from typing import Set, Any, Tuple, Dict
 
 from chemicals.chemtypes import ChemTypes
 from compiler.data_structures.properties import *
+from shared.lazy_logger import LazyLogger
+
+
+class VolumeMap(object):
+    """
+    A copy-on-write map of instruction id -> volume(s).
+    A fork shares the underlying data with the map it came
+    from; the data is only copied once either map is written to.
+    The maps sharing the data count their owners, so the last
+    owner left writes in place rather than copying again.
+    Values must be updated through the map (see: add),
+    never mutated in place.
+    """
+
+    # Program wide counts of forks and the copies they required.
+    shared = 0
+    copied = 0
+
+    def __init__(self, data: Dict = None):
+        self._data = data if data is not None else dict()
+        # The number of maps referencing _data, shared by all of them.
+        self._owners = [1]
+
+    @staticmethod
+    def reset_stats():
+        VolumeMap.shared = 0
+        VolumeMap.copied = 0
+
+    def fork(self) -> 'VolumeMap':
+        """
+        Creates a map that shares this map's data.
+        :return: The new map.
+        """
+        fork = VolumeMap(self._data)
+        fork._owners = self._owners
+        self._owners[0] += 1
+        VolumeMap.shared += 1
+        return fork
+
+    def _detach(self):
+        if self._owners[0] > 1:
+            self._data = {iid: list(vol) if isinstance(vol, list) else vol for iid, vol in self._data.items()}
+            self._owners[0] -= 1
+            self._owners = [1]
+            VolumeMap.copied += 1
+
+    def add(self, iid: int, volume: float):
+        """
+        Appends a volume to the volumes of an instruction.
+        :param iid: The instruction id.
+        :param volume: The volume to add.
+        :return: None
+        """
+        self._detach()
+        if iid in self._data:
+            self._data[iid].append(volume)
+        else:
+            self._data[iid] = [volume]
+
+    def __setitem__(self, iid: int, volume):
+        self._detach()
+        self._data[iid] = volume
+
+    def __delitem__(self, iid: int):
+        self._detach()
+        del self._data[iid]
+
+    def __getitem__(self, iid: int):
+        return self._data[iid]
+
+    def __contains__(self, iid: int) -> bool:
+        return iid in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, iid: int, default=None):
+        return self._data.get(iid, default)
+
+    def items(self):
+        return self._data.items()
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, VolumeMap):
+            return self._data == other._data
+        return self._data == other
+
+    def __repr__(self):
+        return repr(self._data)
 
 
 class Symbol(object):
@@ -20,7 +115,11 @@ class Symbol(object):
         self.scope = scope
         self.types = types
         self.value = None
-        self.volumes = dict()
+        self.volumes = VolumeMap()
+        # The interned id of this symbol, see: SymbolTable.intern.
+        self.sid = -1
+        # The SSA version of this symbol; 0 is the un-renamed symbol.
+        self.version = 0
 
     def __repr__(self):
         return "[{}]\t{}\t{}".format(self.scope, self.name, self.types)
@@ -28,20 +127,30 @@ class Symbol(object):
 
 class RenamedSymbol(Symbol):
 
-    def __init__(self, name: str, symbol: Symbol):
+    def __init__(self, name: str, symbol: Symbol, version: int = 0):
         self.name = name
         self.scope = symbol.scope
         self.types = symbol.types
         self.points_to = symbol
         self.value = symbol.value
-        self.volumes = deepcopy(symbol.volumes)
+        # Versions share the volumes of the symbol until they diverge.
+        self.volumes = symbol.volumes.fork()
+        self.sid = -1
+        self.version = version
 
+    @property
+    def base(self) -> int:
+        """
+        The interned id of the symbol this is a version of.
+        :return: sid of the original symbol.
+        """
+        return self.points_to.sid
 
 
 class Variable(metaclass=ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, name: str):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.name = name
         # Used for timing annotations.
         self._annotations = dict()
@@ -1,14 +1,13 @@
 from abc import ABCMeta, abstractmethod
 
-import colorlog
-
 from compiler.data_structures.program import Program
+from shared.lazy_logger import LazyLogger
 
 
 class Analyzer(metaclass=ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, name: str):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.name = name
 
     @abstractmethod
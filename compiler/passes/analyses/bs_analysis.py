@@ -1,14 +1,18 @@
 from abc import ABCMeta, abstractmethod
 
-import colorlog
-
 from compiler.data_structures.program import Program
+from shared.lazy_logger import LazyLogger
 
 
 class BSAnalysis(metaclass=ABCMeta):
+    log = LazyLogger()
+    # The (pass manager names of the) analyses this one uses.
+    requires = ()
+    # Is the result cached on each function, under the analysis' pass manager name,
+    # rather than computed for the whole program?  Such analyses provide get(program, root).
+    per_function = False
 
     def __init__(self, pass_name: str):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.name = pass_name
 
     @abstractmethod
@@ -1,19 +1,120 @@
+from typing import Callable, Dict, FrozenSet, List, Set
+
 import networkx as nx
 
+from compiler.data_structures.ir import IRInstruction
 from compiler.data_structures.program import Program
 from compiler.passes.analyses.bs_analysis import BSAnalysis
 
 
+class CallGraphInfo(object):
+    """
+    The call graph of a program, condensed into its strongly connected
+    components (the groups of mutually recursive functions).  Components
+    are numbered bottom up, so a component's callees come before it,
+    and grouped into levels: a component's level is one more than the
+    highest level of its callees, so components in the same level
+    don't call each other, and don't depend on each other's results.
+    """
+
+    def __init__(self, graph: nx.DiGraph):
+        # Caller -> callee.
+        self.graph = graph
+        condensed = nx.condensation(graph)
+        order = list(nx.topological_sort(condensed))
+        order.reverse()
+        # Keep the program's order of the functions within, and between, components.
+        position = {function: at for at, function in enumerate(graph.nodes)}
+        # Component -> its members.
+        self.components = list()
+        # Function -> its component.
+        self.component = dict()
+        renumber = dict()
+        for old in order:
+            renumber[old] = len(self.components)
+            members = frozenset(condensed.nodes[old]['members'])
+            self.components.append(members)
+            for function in members:
+                self.component[function] = renumber[old]
+        # Component -> the components it calls.
+        self.calls = [sorted({renumber[callee] for callee in condensed.successors(old)}) for old in order]
+        # Level -> its components.
+        self.levels = list()
+        level = list()
+        for number, callees in enumerate(self.calls):
+            level.append(1 + max((level[callee] for callee in callees), default=-1))
+            while len(self.levels) <= level[number]:
+                self.levels.append(list())
+            self.levels[level[number]].append(number)
+        for components in self.levels:
+            components.sort(key=lambda number: min(position[f] for f in self.components[number]))
+        self._position = position
+        self._recursive = {function for function in graph.nodes
+                           if graph.has_edge(function, function) or len(self.components[self.component[function]]) > 1}
+
+    def callees(self, function: str) -> Set[str]:
+        return set(self.graph.successors(function))
+
+    def callers(self, function: str) -> Set[str]:
+        return set(self.graph.predecessors(function))
+
+    def is_recursive(self, function: str) -> bool:
+        """
+        :param function: The function.
+        :return: Can function (indirectly) call itself?
+        """
+        return function in self._recursive
+
+    def members(self, number: int) -> List[str]:
+        """
+        :param number: The component.
+        :return: Its functions, in program order.
+        """
+        return sorted(self.components[number], key=self._position.get)
+
+    def bottom_up(self) -> List[str]:
+        """
+        :return: The functions, with every callee before its callers
+            (except within a group of mutually recursive functions).
+        """
+        return [function for number in range(len(self.components)) for function in self.members(number)]
+
+    def schedule(self, work: Callable[[FrozenSet[str], Dict], Dict]) -> Dict:
+        """
+        Runs work once for each component, bottom up, one at a time.
+        The components of a level (see: levels) could run together.
+        :param work: Given a component and the results so far (those of all of
+            its callees included), returns function -> result for its members.
+        :return: Function -> result, in program order.
+        """
+        results = dict()
+        for number in range(len(self.components)):
+            results.update(work(self.components[number], results))
+        return {function: results[function] for function in self.graph.nodes if function in results}
+
+
 class CallGraph(BSAnalysis):
+    """
+    Builds the call graph from the call instructions of each function,
+    along with its strongly connected components and a bottom up schedule.
+    """
 
     def __init__(self):
         super().__init__("CallGraph")
 
     def analyze(self, program: Program) -> dict:
         graph = nx.DiGraph()
+        owner = dict()
+        for root in program.functions:
+            graph.add_node(root)
+            for nid, block in program.functions[root]['blocks'].items():
+                owner[nid] = root
+                for instruction in block.instructions:
+                    if instruction.op == IRInstruction.CALL and instruction.name in program.functions:
+                        graph.add_edge(root, instruction.name)
+        # The calls the front end recorded, by the block they're made from.
         for source, destinations in program.calls.items():
-            graph.add_node(source)
             for destination in destinations:
-                graph.add_node(destination)
-                graph.add_cycle([source, destination])
-        return {"name": self.name, "result": graph}
+                if source in owner and destination in program.functions:
+                    graph.add_edge(owner[source], destination)
+        return {"name": self.name, "result": CallGraphInfo(graph)}
@@ -1,29 +1,226 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, Optional
+
+import networkx as nx
+
 from compiler.data_structures import Program
+from compiler.data_structures.ir import InstructionSet, IRInstruction
 from compiler.passes.analyses.bs_analysis import BSAnalysis
 
 
 class Chain(object):
+    """
+    Where a dispensed droplet is disposed of:
+    the block and instruction of the disposal, and
+    the variable the droplet had become part of by then.
+    """
 
     def __init__(self, block: int, instruction: int, subsumed: str):
-        self.block = -1
-        self.instruction = -1
-        self.subsumed_by = -1
+        self.block = block
+        self.instruction = instruction
+        self.subsumed_by = subsumed
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Chain) and (self.block, self.instruction, self.subsumed_by) == \
+            (other.block, other.instruction, other.subsumed_by)
+
+    def __hash__(self) -> int:
+        return hash((self.block, self.instruction, self.subsumed_by))
+
+    def __repr__(self):
+        return "Chain({}, {}, {})".format(self.block, self.instruction, self.subsumed_by)
+
+
+class DefUseInfo(object):
+    """
+    The def-use chains of a program in SSA form.
+    Instructions are numbered in order, function by function and block
+    by block, so the instructions of a block are a range of numbers.
+    Names are numbered as they are seen, function by function, as locals of
+    different functions can share a name (and so can their SSA versions).
+    The chains are integer arrays indexed by these numbers; the queries
+    take and return instruction ids.
+    """
+
+    def __init__(self):
+        # Instruction number -> instruction id, and the block it is in.
+        self.iids = array('i')
+        self.blocks = array('i')
+        # Instruction id -> instruction number.
+        self.index = dict()
+        # Instruction number -> the name number it defines, or -1.
+        self.defined = array('i')
+        # Block id -> the range of its instruction numbers, and the function it is in.
+        self.block_range = dict()
+        self.block_root = dict()
+        # Name number -> (function, name), and back.
+        self.names = list()
+        self.name_index = dict()
+        # Name number -> the instruction number defining it, or -1 if it's defined elsewhere.
+        self.def_site = array('i')
+        # Name number -> the instruction numbers using it, in order, in CSR form.
+        self.use_offsets = array('i', [0])
+        self.use_targets = array('i')
+        # Dispense id -> the chains of its disposals.
+        self.dispose_dispense_chain = dict()
+
+    def number(self, root: str, name: str) -> int:
+        key = (root, name)
+        if key not in self.name_index:
+            self.name_index[key] = len(self.names)
+            self.names.append(key)
+            self.def_site.append(-1)
+        return self.name_index[key]
+
+    def _users(self, number: int) -> array:
+        if number < 0:
+            return array('i')
+        return self.use_targets[self.use_offsets[number]:self.use_offsets[number + 1]]
+
+    def definition(self, name: str, root: str) -> Optional[int]:
+        """
+        :param name: The (SSA) name.
+        :param root: The function it is named in.
+        :return: The id of the instruction defining name, or None if it's defined elsewhere.
+        """
+        number = self.name_index.get((root, name), -1)
+        if number < 0 or self.def_site[number] < 0:
+            return None
+        return self.iids[self.def_site[number]]
+
+    def users(self, name: str, root: str) -> List[int]:
+        """
+        :param name: The (SSA) name.
+        :param root: The function it is named in.
+        :return: The ids of the instructions that use name, in program order.
+        """
+        return [self.iids[user] for user in self._users(self.name_index.get((root, name), -1))]
+
+    def users_of(self, iid: int) -> List[int]:
+        """
+        The users of the value an instruction defines.
+        :param iid: The id of the defining instruction.
+        :return: The ids of the instructions that use the value.
+        """
+        return [self.iids[user] for user in self._users(self.defined[self.index[iid]])]
+
+    def last_use(self, block: int, name: str) -> Optional[int]:
+        """
+        :param block: The block id.
+        :param name: The (SSA) name.
+        :return: The id of the last instruction in block that uses name, or None if none does.
+        """
+        first, end = self.block_range[block]
+        users = self._users(self.name_index.get((self.block_root[block], name), -1))
+        at = bisect_left(users, end) - 1
+        if at < 0 or users[at] < first:
+            return None
+        return self.iids[users[at]]
+
+    def disposals(self, iid: int) -> List[Chain]:
+        """
+        :param iid: The id of a dispense.
+        :return: Where the dispensed droplet ends up being disposed of.
+        """
+        return self.dispose_dispense_chain.get(iid, list())
 
 
 class DefUseChains(BSAnalysis):
+    """
+    Builds sparse def-use chains over the SSA form, where every
+    name has a single definition, and from them the chains of
+    each dispense to the disposals it needs; a droplet that is
+    mixed or split is followed into the variable it became part of.
+    https://en.wikipedia.org/wiki/Use-define_chain
+    """
+
+    # The instructions whose result holds (part of) the droplets they use.
+    carries = {IRInstruction.MIX, IRInstruction.SPLIT, IRInstruction.PHI, IRInstruction.COPY}
 
     def __init__(self):
         super().__init__("Def/Use Chains")
-        # This maps any dispense to any necessary disposals
-        self.dispose_dispense_chain = dict()
-        # this maps any variables to any
-        self.def_use_chain = dict()
-        # https://github.com/lilott8/ChemCompiler-Deprecated-/blob/master/src/main/java/compilation/datastructures/basicblock/DependencySlicedBasicBlock.java
-        # https://en.wikipedia.org/wiki/Use-define_chain
 
     def analyze(self, program: Program) -> dict:
-        # for root in program.functions:
-        #     for nid, block in program.functions[root]['blocks'].items():
-        #         for instruction in block.instructions:
-        # self.log.info(instruction)
-        return {'name': self.name, 'result': None}
+        info = DefUseInfo()
+        users = defaultdict(list)
+        instructions = list()
+
+        for root in program.functions:
+            for nid, block in program.functions[root]['blocks'].items():
+                first = len(info.iids)
+                for instruction in block.instructions:
+                    number = len(info.iids)
+                    info.iids.append(instruction.iid)
+                    info.blocks.append(nid)
+                    info.index[instruction.iid] = number
+                    instructions.append(instruction)
+                    for use in instruction.uses:
+                        used = info.number(root, use['name'] if isinstance(use, dict) else use)
+                        # Don't count an instruction twice, e.g. mix a with a.
+                        if not users[used] or users[used][-1] != number:
+                            users[used].append(number)
+                    if self.defines(instruction):
+                        defined = info.number(root, instruction.defs['name'])
+                        info.def_site[defined] = number
+                        info.defined.append(defined)
+                    else:
+                        info.defined.append(-1)
+                info.block_range[nid] = (first, len(info.iids))
+                info.block_root[nid] = root
+
+        for number in range(len(info.names)):
+            info.use_targets.extend(users[number])
+            info.use_offsets.append(len(info.use_targets))
+
+        self.chain_disposals(info, instructions)
+        return {'name': self.name, 'result': info}
+
+    @staticmethod
+    def defines(instruction) -> bool:
+        # Heat and dispose don't define a new value.
+        return instruction.defs is not None and \
+            (instruction.op in InstructionSet.assignment or instruction.op in InstructionSet.numeric_assignment)
+
+    def chain_disposals(self, info: DefUseInfo, instructions: List):
+        """
+        Follows each dispensed droplet to its disposals.
+        Droplets flow around loops through phi nodes, so this
+        works on the strongly connected components of the flow.
+        :param info: The chains built so far.
+        :param instructions: The instructions, by instruction number.
+        :return: None
+        """
+        # (Function, name) -> the names its droplets flow into.
+        flow = nx.DiGraph()
+        # (Function, name) -> the disposals of it.
+        disposed = defaultdict(set)
+        for number, instruction in enumerate(instructions):
+            root = info.block_root[info.blocks[number]]
+            if instruction.op == IRInstruction.DISPOSE:
+                name = instruction.uses[0]['name']
+                disposed[(root, name)].add(Chain(info.blocks[number], instruction.iid, name))
+                flow.add_node((root, name))
+            elif instruction.op in DefUseChains.carries and self.defines(instruction):
+                for use in instruction.uses:
+                    flow.add_edge((root, use['name'] if isinstance(use, dict) else use),
+                                  (root, instruction.defs['name']))
+            elif instruction.op == IRInstruction.DISPENSE:
+                flow.add_node((root, instruction.defs['name']))
+
+        components = nx.condensation(flow)
+        reached = dict()
+        for component in reversed(list(nx.topological_sort(components))):
+            chains = set()
+            for member in components.nodes[component]['members']:
+                chains |= disposed[member]
+            for successor in components.successors(component):
+                chains |= reached[successor]
+            reached[component] = frozenset(chains)
+
+        mapping = components.graph['mapping']
+        for number, instruction in enumerate(instructions):
+            if instruction.op == IRInstruction.DISPENSE:
+                chains = reached[mapping[(info.block_root[info.blocks[number]], instruction.defs['name'])]]
+                info.dispose_dispense_chain[instruction.iid] = sorted(chains, key=lambda c: info.index[c.instruction])
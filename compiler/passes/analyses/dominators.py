@@ -0,0 +1,176 @@
+from typing import Dict, List, Set
+
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.bs_analysis import BSAnalysis
+
+
+class DominatorInfo(object):
+    """
+    The dominator structures of a single function.
+    Only blocks reachable from the entry are present.
+    """
+
+    def __init__(self, cfg: ControlFlowGraph, entry: int, order: List[int], idoms: Dict[int, int],
+                 tree: Dict[int, List[int]], frontier: Dict[int, Set[int]]):
+        # The graph (and version of it) these were computed on.
+        self.cfg = cfg
+        self.version = cfg.version
+        self.entry = entry
+        # The blocks in reverse post order.
+        self.order = order
+        # Block -> immediate dominator; the entry is its own.
+        self.idoms = idoms
+        # Block -> the blocks it immediately dominates.
+        self.tree = tree
+        # Block -> its dominance frontier.
+        self.frontier = frontier
+
+    def dominates(self, a: int, b: int) -> bool:
+        """
+        :param a: The (possible) dominator.
+        :param b: The block.
+        :return: Does a dominate b?
+        """
+        while b != a:
+            if b == self.entry or b not in self.idoms:
+                return False
+            b = self.idoms[b]
+        return True
+
+    def natural_loops(self) -> Dict[int, Set[int]]:
+        """
+        A back edge is an edge into a block that dominates its source;
+        the natural loop of a header is the header and every block that
+        reaches one of its back edges without going through the header.
+        :return: Loop header -> the blocks of its loop.
+        """
+        loops = dict()
+        for nid in self.order:
+            for successor in self.cfg.successors(nid):
+                if successor in self.idoms and self.dominates(successor, nid):
+                    body = loops.setdefault(successor, {successor})
+                    stack = [nid]
+                    while stack:
+                        member = stack.pop()
+                        if member not in body:
+                            body.add(member)
+                            stack.extend(pred for pred in self.cfg.predecessors(member) if pred in self.idoms)
+        return loops
+
+
+class Dominators(BSAnalysis):
+    """
+    This is the iterative algorithm described in
+    Cooper, Harvey, and Kennedy's "A Simple, Fast Dominance Algorithm."
+    It runs over the CSR arrays of each function's control flow graph.
+    """
+
+    per_function = True
+
+    def __init__(self):
+        super().__init__("Dominators")
+
+    def analyze(self, program: Program) -> dict:
+        return {'name': self.name, 'result': {root: Dominators.get(program, root) for root in program.functions}}
+
+    @staticmethod
+    def get(program: Program, root: str) -> DominatorInfo:
+        """
+        Gets the dominator structures of a function.
+        These are cached on the function until its control flow graph changes.
+        :param program: The program.
+        :param root: The function.
+        :return: The dominator structures.
+        """
+        cfg = program.function_cfg(root)
+        info = program.functions[root].get('dominators')
+        if info is None or info.cfg is not cfg or info.version != cfg.version:
+            info = Dominators.compute(cfg, program.functions[root]['entry'])
+            program.functions[root]['dominators'] = info
+        return info
+
+    @staticmethod
+    def compute(cfg: ControlFlowGraph, entry: int) -> DominatorInfo:
+        csr = cfg.csr()
+        succ_offsets, succ_targets = csr.succ_offsets, csr.succ_targets
+        pred_offsets, pred_targets = csr.pred_offsets, csr.pred_targets
+        size = len(csr.nodes)
+        start = csr.index[entry]
+
+        # Number the blocks in post order, without recursion.
+        post = [-1] * size
+        order = list()
+        visited = bytearray(size)
+        visited[start] = 1
+        stack = [[start, succ_offsets[start]]]
+        while stack:
+            top = stack[-1]
+            node, edge = top
+            if edge < succ_offsets[node + 1]:
+                top[1] += 1
+                successor = succ_targets[edge]
+                if not visited[successor]:
+                    visited[successor] = 1
+                    stack.append([successor, succ_offsets[successor]])
+            else:
+                stack.pop()
+                post[node] = len(order)
+                order.append(node)
+        order.reverse()
+
+        idom = [-1] * size
+        idom[start] = start
+        changed = True
+        while changed:
+            changed = False
+            for node in order:
+                if node == start:
+                    continue
+                new_idom = -1
+                for pred in pred_targets[pred_offsets[node]:pred_offsets[node + 1]]:
+                    if idom[pred] == -1:
+                        continue
+                    if new_idom == -1:
+                        new_idom = pred
+                        continue
+                    # Intersect the two paths up the dominator tree.
+                    finger1, finger2 = pred, new_idom
+                    while finger1 != finger2:
+                        while post[finger1] < post[finger2]:
+                            finger1 = idom[finger1]
+                        while post[finger2] < post[finger1]:
+                            finger2 = idom[finger2]
+                    new_idom = finger1
+                if idom[node] != new_idom:
+                    idom[node] = new_idom
+                    changed = True
+
+        nodes = csr.nodes
+        frontier = {nodes[node]: set() for node in order}
+        for node in order:
+            preds = pred_targets[pred_offsets[node]:pred_offsets[node + 1]]
+            # A lone predecessor is the immediate dominator,
+            # unless this is the entry.
+            if len(preds) < 2 and node != start:
+                continue
+            for pred in preds:
+                if idom[pred] == -1:
+                    continue
+                # Nothing strictly dominates the entry, so a walk
+                # to it runs past the root of the dominator tree.
+                stop = idom[node] if node != start else -1
+                runner = pred
+                while runner != stop:
+                    frontier[nodes[runner]].add(nodes[node])
+                    runner = idom[runner] if runner != start else -1
+
+        idoms = {nodes[node]: nodes[idom[node]] for node in order}
+        tree = {nodes[node]: list() for node in order}
+        for node in order:
+            if node != start:
+                tree[nodes[idom[node]]].append(nodes[node])
+        for children in tree.values():
+            children.sort()
+
+        return DominatorInfo(cfg, entry, [nodes[node] for node in order], idoms, tree, frontier)
@@ -0,0 +1,248 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.bs_analysis import BSAnalysis
+from compiler.passes.analyses.call_graph import CallGraph
+from compiler.passes.analyses.liveness import Liveness
+
+INFINITE = float('inf')
+
+
+class FunctionSummary(object):
+    """
+    What a call to a function does, as far as its caller is concerned.
+    Volumes are in the units of the program, and counts cover every
+    instruction of the function once (so a loop body counts once);
+    the callees' summaries are folded in at each call.
+    """
+
+    def __init__(self, name: str, arguments: List[str]):
+        self.name = name
+        # The names the parameters have on entry to the function.
+        self.arguments = arguments
+        # Argument position -> the volume a call takes from it; INFINITE if the call uses it up.
+        self.consumed = [0.0] * len(arguments)
+        # The volume of the fluid returned, or None if a fluid isn't returned (or its volume isn't known).
+        self.produced = None
+        # Reagent -> the volume of it that's dispensed.
+        self.dispensed = defaultdict(float)
+        # The most droplets (lanes of arrays included) on the board at once during a call.
+        self.max_droplets = 0
+        # Op -> the number of them.
+        self.ops = Counter()
+        # Does the function (indirectly) call itself?
+        # The counts then only cover the calls that don't.
+        self.recursive = False
+
+    def __repr__(self):
+        return "FunctionSummary({}, consumed={}, produced={}, dispensed={}, max_droplets={}, ops={})".format(
+            self.name, self.consumed, self.produced, dict(self.dispensed), self.max_droplets, dict(self.ops))
+
+
+class FunctionSummaries(BSAnalysis):
+    """
+    Summarizes each function once, bottom up over the call graph,
+    so a call site is handled by applying the callee's summary instead
+    of walking the callee's body again.  A group of mutually recursive
+    functions is summarized together; calls within the group are assumed
+    to use up what they're passed and to return nothing that's known.
+    This works on the SSA form.
+    """
+
+    requires = ('call_graph',)
+    # The instructions whose operands are fluids.
+    fluidic = {IRInstruction.MIX, IRInstruction.SPLIT, IRInstruction.DISPOSE, IRInstruction.HEAT,
+               IRInstruction.DETECT}
+    # The instructions that aren't operations.
+    meta = {IRInstruction.LABEL, IRInstruction.NOP, IRInstruction.PHI, IRInstruction.JUMP, IRInstruction.RETURN}
+
+    def __init__(self):
+        super().__init__("Function Summaries")
+        self.units = None
+
+    def analyze(self, program: Program) -> dict:
+        self.units = program.config.units
+        calls = program.analysis.get('call_graph')
+        if calls is None:
+            calls = CallGraph().analyze(program)['result']
+
+        def work(component, done: Dict[str, FunctionSummary]) -> Dict[str, FunctionSummary]:
+            summaries = dict()
+            for root in component:
+                summaries[root] = self.summarize(program, root, done)
+                summaries[root].recursive = calls.is_recursive(root)
+            return summaries
+
+        return {'name': self.name, 'result': calls.schedule(work)}
+
+    @staticmethod
+    def operand_name(operand) -> str:
+        return operand['name'] if isinstance(operand, dict) else operand
+
+    def quantity(self, instruction, position: int = 0) -> float:
+        """
+        :param instruction: A dispense or mix.
+        :param position: For a mix, the operand.
+        :return: The volume the instruction takes (from the operand), INFINITE if it isn't known.
+        """
+        volumes = instruction.defs['var'].volumes.get(instruction.iid) if instruction.defs.get('var') else None
+        if not volumes:
+            return INFINITE
+        if instruction.op == IRInstruction.DISPENSE:
+            return self.units.normalize(min(volumes))
+        return self.units.normalize(volumes[position]) if position < len(volumes) else INFINITE
+
+    def summarize(self, program: Program, root: str, summaries: Dict[str, FunctionSummary]) -> FunctionSummary:
+        """
+        :param program: The program.
+        :param root: The function.
+        :param summaries: The summaries of its callees; the callees without one are in its recursive group.
+        :return: The function's summary.
+        """
+        table = program.symbol_table
+        function = table.functions.get(root)
+        parameters = [arg if isinstance(arg, str) else arg.name for arg in function.args] if function else list()
+        arguments = list()
+        for parameter in parameters:
+            symbol = table.get_local(parameter, root)
+            arguments.append(table.version_name(symbol.sid, 0) if symbol is not None else parameter)
+        summary = FunctionSummary(root, arguments)
+
+        instructions = [instruction for block in program.functions[root]['blocks'].values()
+                        for instruction in block.instructions]
+        defining = dict()
+        # Name -> the names its droplet is passed on to, by phi nodes and copies.
+        passed = defaultdict(list)
+        for instruction in instructions:
+            if isinstance(instruction.defs, (dict, str)) and instruction.op not in {IRInstruction.HEAT,
+                                                                                    IRInstruction.DISPOSE,
+                                                                                    IRInstruction.RETURN}:
+                defining[self.operand_name(instruction.defs)] = instruction
+            if instruction.op in {IRInstruction.PHI, IRInstruction.COPY}:
+                for use in instruction.uses:
+                    passed[self.operand_name(use)].append(self.operand_name(instruction.defs))
+
+        # Name -> the argument (position) its droplet is.
+        argument = dict()
+        work_list = [(name, position) for position, name in enumerate(arguments)]
+        while work_list:
+            name, position = work_list.pop()
+            if name not in argument:
+                argument[name] = position
+                work_list.extend((successor, position) for successor in passed[name])
+
+        for instruction in instructions:
+            if instruction.op in FunctionSummaries.meta:
+                continue
+            summary.ops[instruction.op] += 1
+            uses = [self.operand_name(use) for use in instruction.uses]
+            if instruction.op == IRInstruction.DISPENSE:
+                size = max(instruction.defs.get('size', 1), 1)
+                summary.dispensed[uses[0]] += self.quantity(instruction) * size
+            elif instruction.op == IRInstruction.MIX:
+                for position, name in enumerate(uses):
+                    if name in argument:
+                        summary.consumed[argument[name]] += self.quantity(instruction, position)
+            elif instruction.op in {IRInstruction.SPLIT, IRInstruction.DISPOSE}:
+                if uses and uses[0] in argument:
+                    summary.consumed[argument[uses[0]]] = INFINITE
+            elif instruction.op == IRInstruction.CALL:
+                callee = summaries.get(instruction.name)
+                if callee is not None:
+                    summary.ops.update(callee.ops)
+                    for reagent, volume in callee.dispensed.items():
+                        summary.dispensed[reagent] += volume
+                for position, name in enumerate(uses):
+                    if name in argument:
+                        taken = callee.consumed[position] if callee is not None and \
+                            position < len(callee.consumed) else INFINITE
+                        summary.consumed[argument[name]] += taken
+
+        produced = [self.volume(self.operand_name(instruction.uses[0]), defining, summaries, set())
+                    for instruction in instructions if instruction.op == IRInstruction.RETURN and instruction.uses]
+        if produced and None not in produced:
+            summary.produced = min(produced)
+
+        summary.max_droplets = self.max_droplets(program, root, instructions, defining, arguments, summaries)
+        return summary
+
+    def volume(self, name: str, defining: Dict, summaries: Dict[str, FunctionSummary], seen: set) -> Optional[float]:
+        """
+        :param name: An (SSA) name.
+        :param defining: Name -> the instruction defining it.
+        :param summaries: The summaries of the callees.
+        :param seen: The names already being worked out (around loops).
+        :return: The volume of the fluid name holds, or None if it isn't known (or isn't a fluid).
+        """
+        instruction = defining.get(name)
+        if instruction is None or name in seen:
+            return None
+        seen.add(name)
+        volume = None
+        if instruction.op == IRInstruction.DISPENSE:
+            volume = self.quantity(instruction)
+        elif instruction.op == IRInstruction.MIX:
+            volume = sum(self.quantity(instruction, position) for position in range(len(instruction.uses)))
+        elif instruction.op == IRInstruction.SPLIT:
+            source = self.volume(self.operand_name(instruction.uses[0]), defining, summaries, seen)
+            volume = source / instruction.defs['size'] if source is not None else None
+        elif instruction.op in {IRInstruction.PHI, IRInstruction.COPY}:
+            volumes = [self.volume(self.operand_name(use), defining, summaries, seen) for use in instruction.uses]
+            volume = min(volumes) if volumes and None not in volumes else None
+        elif instruction.op == IRInstruction.CALL and instruction.name in summaries:
+            volume = summaries[instruction.name].produced
+        seen.discard(name)
+        return volume if volume != INFINITE else None
+
+    def max_droplets(self, program: Program, root: str, instructions: List, defining: Dict, arguments: List[str],
+                     summaries: Dict[str, FunctionSummary]) -> int:
+        """
+        Walks each block backwards from what's live out of it, counting the droplets live at each point.
+        :return: The most droplets live at once, including those on the board during calls.
+        """
+        # Name -> the number of droplets (lanes) it holds.
+        droplets = dict()
+        for name, instruction in defining.items():
+            if instruction.op in {IRInstruction.DISPENSE, IRInstruction.MIX, IRInstruction.SPLIT} or \
+                    (instruction.op == IRInstruction.CALL and instruction.name in summaries and
+                     summaries[instruction.name].produced is not None):
+                droplets[name] = max(instruction.defs.get('size', 1), 1)
+        for instruction in instructions:
+            if instruction.op in FunctionSummaries.fluidic:
+                for use in instruction.uses:
+                    if self.operand_name(use) in arguments:
+                        droplets[self.operand_name(use)] = max(use.get('size', 1), 1) if isinstance(use, dict) else 1
+        # Phi nodes and copies of droplets are droplets.
+        changed = True
+        while changed:
+            changed = False
+            for name, instruction in defining.items():
+                if name not in droplets and instruction.op in {IRInstruction.PHI, IRInstruction.COPY} and \
+                        any(self.operand_name(use) in droplets for use in instruction.uses):
+                    droplets[name] = max(droplets.get(self.operand_name(use), 0) for use in instruction.uses)
+                    changed = True
+
+        liveness = Liveness.get(program, root)
+        peak = 0
+        for nid, block in program.functions[root]['blocks'].items():
+            live = {name for name in liveness.live_out_names(nid) if name in droplets}
+            count = sum(droplets[name] for name in live)
+            peak = max(peak, count)
+            for instruction in reversed(block.instructions):
+                deff = Liveness.killed(instruction)
+                if deff in live:
+                    live.discard(deff)
+                    count -= droplets[deff]
+                if instruction.op == IRInstruction.CALL and instruction.name in summaries:
+                    # The arguments still live after the call are counted by the callee too.
+                    shared = sum(droplets[name] for name in set(Liveness.used(instruction)) if name in live)
+                    peak = max(peak, count - shared + summaries[instruction.name].max_droplets)
+                if instruction.op != IRInstruction.PHI:
+                    for name in Liveness.used(instruction):
+                        if name in droplets and name not in live:
+                            live.add(name)
+                            count += droplets[name]
+                peak = max(peak, count)
+        return peak
@@ -0,0 +1,218 @@
+from collections import defaultdict, deque
+from typing import Dict, List, Set, Tuple
+
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
+from compiler.data_structures.ir import InstructionSet, IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.bs_analysis import BSAnalysis
+from compiler.passes.analyses.dominators import Dominators
+
+
+class LivenessInfo(object):
+    """
+    The liveness of the variables of a single function.
+    Each name is given a bit, and a set of names is an int
+    with their bits set, so the dataflow is a few int operations
+    per block no matter how many names there are.
+    """
+
+    def __init__(self, cfg: ControlFlowGraph, blocks: Dict):
+        # The graph (and version of it) these were computed on.
+        self.cfg = cfg
+        self.version = cfg.version
+        self.blocks = blocks
+        # Bit -> name, and back.
+        self.names = list()
+        self.index = dict()
+        # Block -> the bits of the names live into, and out of, the block.
+        self.live_in = dict()
+        self.live_out = dict()
+        # Name -> block -> (first, last) instruction it is live over; built when first needed.
+        self._ranges = None
+        # Block -> the most names live at once in the block.
+        self._pressure = None
+
+    def bit(self, name: str) -> int:
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return 1 << self.index[name]
+
+    def to_names(self, bits: int) -> Set[str]:
+        names = set()
+        while bits:
+            low = bits & -bits
+            names.add(self.names[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+    def is_live_in(self, block: int, name: str) -> bool:
+        return name in self.index and bool(self.live_in.get(block, 0) >> self.index[name] & 1)
+
+    def is_live_out(self, block: int, name: str) -> bool:
+        return name in self.index and bool(self.live_out.get(block, 0) >> self.index[name] & 1)
+
+    def live_in_names(self, block: int) -> Set[str]:
+        return self.to_names(self.live_in.get(block, 0))
+
+    def live_out_names(self, block: int) -> Set[str]:
+        return self.to_names(self.live_out.get(block, 0))
+
+    def live_range(self, name: str) -> Dict[int, Tuple[int, int]]:
+        """
+        Where a variable (e.g. a droplet) is live.
+        :param name: The variable.
+        :return: Block -> (first, last) index of the instructions of the block
+            it is live over; the last is the length of the block if it is live out.
+        """
+        if self._ranges is None:
+            self._build_ranges()
+        return self._ranges.get(name, dict())
+
+    def pressure(self, block: int) -> int:
+        """
+        :param block: The block.
+        :return: The most variables live at the same time in the block.
+        """
+        if self._pressure is None:
+            self._build_ranges()
+        return self._pressure.get(block, 0)
+
+    def _build_ranges(self):
+        self._ranges = defaultdict(dict)
+        self._pressure = dict()
+        for nid, block in self.blocks.items():
+            if nid not in self.live_out:
+                continue
+            instructions = block.instructions
+            live = self.live_out[nid]
+            last = {name: len(instructions) for name in self.to_names(live)}
+            first = dict()
+            pressure = bin(live).count('1')
+            for at in range(len(instructions) - 1, -1, -1):
+                instruction = instructions[at]
+                deff = Liveness.killed(instruction)
+                if deff is not None and deff in self.index:
+                    first[deff] = at
+                    last.setdefault(deff, at)
+                    live &= ~self.bit(deff)
+                if instruction.op != IRInstruction.PHI:
+                    for name in Liveness.used(instruction):
+                        if name in self.index and not live & self.bit(name):
+                            last.setdefault(name, at)
+                            live |= self.bit(name)
+                pressure = max(pressure, bin(live).count('1'))
+            for name in self.to_names(live):
+                first[name] = 0
+            for name, end in last.items():
+                self._ranges[name][nid] = (first.get(name, 0), end)
+            self._pressure[nid] = pressure
+
+
+class Liveness(BSAnalysis):
+    """
+    Block level liveness, as a backwards dataflow problem over bitsets.
+    A phi node's operands are live out of the predecessor they come
+    from, not into the phi node's block.  Writes to a single lane
+    of an array don't kill it, so this errs on the side of liveness.
+    """
+
+    requires = ('dominators',)
+    per_function = True
+
+    def __init__(self):
+        super().__init__("Liveness")
+
+    def analyze(self, program: Program) -> dict:
+        return {'name': self.name, 'result': {root: Liveness.get(program, root) for root in program.functions}}
+
+    @staticmethod
+    def get(program: Program, root: str) -> LivenessInfo:
+        """
+        Gets the liveness of a function.
+        This is cached on the function until its control flow graph changes;
+        a pass that changes the instructions must drop it (see: invalidate).
+        :param program: The program.
+        :param root: The function.
+        :return: The liveness.
+        """
+        cfg = program.function_cfg(root)
+        info = program.functions[root].get('liveness')
+        if info is None or info.cfg is not cfg or info.version != cfg.version:
+            info = Liveness.compute(program, root)
+            program.functions[root]['liveness'] = info
+        return info
+
+    @staticmethod
+    def invalidate(program: Program, root: str):
+        program.functions[root].pop('liveness', None)
+
+    @staticmethod
+    def killed(instruction) -> str:
+        """
+        :param instruction: The instruction.
+        :return: The name the instruction (entirely) defines, or None.
+        """
+        if instruction.op == IRInstruction.PHI:
+            return instruction.defs['name'] if isinstance(instruction.defs, dict) else instruction.defs
+        if instruction.op in InstructionSet.assignment or instruction.op in InstructionSet.numeric_assignment:
+            deff = instruction.defs
+            if deff['offset'] < 0 or deff.get('size', 1) == 1:
+                return deff['name']
+        return None
+
+    @staticmethod
+    def used(instruction) -> List[str]:
+        return [use['name'] if isinstance(use, dict) else use for use in instruction.uses]
+
+    @staticmethod
+    def compute(program: Program, root: str) -> LivenessInfo:
+        table = program.symbol_table
+        blocks = program.functions[root]['blocks']
+        cfg = program.function_cfg(root)
+        info = LivenessInfo(cfg, blocks)
+
+        # The upward exposed uses and the definitions of each block,
+        # and the phi operands each block passes to its successors.
+        gen = dict()
+        kill = dict()
+        passed = defaultdict(int)
+        for nid, block in blocks.items():
+            gen[nid] = 0
+            kill[nid] = 0
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    for pred, name in zip(cfg.predecessors(nid), Liveness.used(instruction)):
+                        passed[pred] |= info.bit(name)
+                else:
+                    for name in Liveness.used(instruction):
+                        if not table.is_global(name):
+                            bit = info.bit(name)
+                            if not kill[nid] & bit:
+                                gen[nid] |= bit
+                deff = Liveness.killed(instruction)
+                if deff is not None:
+                    kill[nid] |= info.bit(deff)
+
+        live_in = dict(gen)
+        live_out = {nid: passed[nid] for nid in blocks}
+        # Post order converges fastest for a backwards problem.
+        work_list = deque(reversed(Dominators.get(program, root).order))
+        queued = set(work_list)
+        while work_list:
+            nid = work_list.popleft()
+            queued.discard(nid)
+            out = passed[nid]
+            for successor in cfg.successors(nid):
+                out |= live_in[successor]
+            live_out[nid] = out
+            new = gen[nid] | (out & ~kill[nid])
+            if new != live_in[nid]:
+                live_in[nid] = new
+                for pred in cfg.predecessors(nid):
+                    if pred not in queued:
+                        queued.add(pred)
+                        work_list.append(pred)
+        info.live_in = live_in
+        info.live_out = live_out
+        return info
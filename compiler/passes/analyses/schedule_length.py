@@ -0,0 +1,271 @@
+from typing import Dict, List, Optional, Set
+
+from compiler.data_structures.ir import IRInstruction, TimeConstraint
+from compiler.data_structures.program import Program
+from compiler.data_structures.writable import Writable, WritableType
+from compiler.passes.analyses.bs_analysis import BSAnalysis
+from compiler.passes.analyses.call_graph import CallGraph
+from compiler.passes.analyses.dominators import Dominators
+
+
+class BlockSchedule(object):
+    """
+    The schedule of a block's instructions with unlimited resources:
+    each instruction starts as soon as the instructions it depends on finish.
+    Times are in seconds from the start of the block.
+    """
+
+    def __init__(self):
+        # Instruction id -> its duration.
+        self.duration = dict()
+        # Instruction id -> its earliest, and latest, start.
+        self.asap = dict()
+        self.alap = dict()
+        # The length of the critical path.
+        self.length = 0.0
+        # The instructions on the critical path, in order.
+        self.critical = list()
+
+    def slack(self, iid: int) -> float:
+        """
+        :param iid: The instruction id.
+        :return: How long the instruction can be put off without making the block longer.
+        """
+        return self.alap[iid] - self.asap[iid]
+
+    def to_json(self) -> Dict:
+        return {'length': self.length, 'critical': self.critical,
+                'instructions': {str(iid): {'duration': self.duration[iid], 'asap': self.asap[iid],
+                                            'alap': self.alap[iid], 'slack': self.slack(iid)}
+                                 for iid in self.asap}}
+
+
+class FunctionSchedule(object):
+    """
+    The block schedules of a function, and a lower bound on how long a call to it takes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # Block id -> its schedule.
+        self.blocks = dict()
+        # The shortest time any run of the function can take: REPEAT loops run
+        # their count, other loops don't run, and calls take the callee's bound.
+        self.lower_bound = 0.0
+        # Loop header -> the number of times the loop runs, if it's known.
+        self.trip_counts = dict()
+
+    def longest_block(self) -> Optional[int]:
+        """
+        :return: The block with the longest critical path, or None if there are none.
+        """
+        return max(self.blocks, key=lambda nid: self.blocks[nid].length, default=None)
+
+    def to_json(self) -> Dict:
+        return {'lower_bound': self.lower_bound,
+                'trip_counts': {str(nid): count for nid, count in self.trip_counts.items()},
+                'blocks': {str(nid): block.to_json() for nid, block in self.blocks.items()}}
+
+
+class ScheduleLength(BSAnalysis):
+    """
+    Estimates how long an assay takes, statically.
+    Each block's instructions form a DAG over their data dependencies
+    (an instruction that heats, detects or disposes of a droplet holds
+    on to it, so it is also ordered with the instructions around it on
+    that droplet); its critical path, and the ASAP/ALAP start and slack
+    of each instruction, come from a forward and a backward pass over it.
+    The function's lower bound then comes from its control flow graph,
+    with each loop collapsed into its header, innermost first.
+    """
+
+    requires = ('call_graph', 'dominators')
+    # The seconds an operation takes when it isn't given a time; these are MFSim's defaults.
+    durations = {IRInstruction.MIX: 10.0, IRInstruction.SPLIT: 2.0, IRInstruction.DETECT: 10.0,
+                 IRInstruction.HEAT: 10.0}
+    # The instructions that hold on to the droplet they use.
+    holds = {IRInstruction.HEAT, IRInstruction.DETECT, IRInstruction.DISPOSE}
+    # The instructions that aren't scheduled.
+    ignored = {IRInstruction.LABEL, IRInstruction.NOP, IRInstruction.PHI, IRInstruction.JUMP,
+               IRInstruction.CONDITIONAL, IRInstruction.RETURN}
+
+    def __init__(self):
+        super().__init__("Schedule Length")
+
+    def analyze(self, program: Program) -> dict:
+        calls = program.analysis.get('call_graph')
+        if calls is None:
+            calls = CallGraph().analyze(program)['result']
+
+        def work(component, done: Dict[str, FunctionSchedule]) -> Dict[str, FunctionSchedule]:
+            return {root: self.schedule_function(program, root, done) for root in component}
+
+        schedules = calls.schedule(work)
+
+        # The functions nobody calls are where the program starts.
+        entries = [root for root in schedules if not calls.callers(root)] or list(schedules)
+        program.stats['Schedule lower bound (s)'] = max((schedules[root].lower_bound for root in entries), default=0)
+        program.stats['Longest block critical path (s)'] = max(
+            (schedule.blocks[schedule.longest_block()].length for schedule in schedules.values() if schedule.blocks),
+            default=0)
+        program.write['schedule'] = Writable("{}_schedule".format(program.name),
+                                             "{}/{}_schedule.json".format(program.config.output, program.name),
+                                             {root: schedule.to_json() for root, schedule in schedules.items()},
+                                             WritableType.JSON)
+        return {'name': self.name, 'result': schedules}
+
+    def duration(self, instruction, schedules: Dict[str, FunctionSchedule]) -> float:
+        """
+        :param instruction: The instruction.
+        :param schedules: The schedules of the functions called.
+        :return: How long the instruction takes, in seconds.
+        """
+        if instruction.op == IRInstruction.CALL:
+            callee = schedules.get(instruction.name)
+            return callee.lower_bound if callee is not None else 0.0
+        times = [meta.quantity for meta in instruction.meta if isinstance(meta, TimeConstraint)
+                 and meta.op in {instruction.op, IRInstruction.EXECUTEFOR}]
+        return float(max(times)) if times else ScheduleLength.durations.get(instruction.op, 0.0)
+
+    @staticmethod
+    def scheduled(block) -> List:
+        """
+        :param block: The block.
+        :return: Its instructions that take part in the schedule, in order.
+        """
+        return [instruction for instruction in block.instructions if instruction.op not in ScheduleLength.ignored]
+
+    @staticmethod
+    def dependencies(program: Program, instructions: List) -> Dict[int, Set[int]]:
+        """
+        :param program: The program.
+        :param instructions: The scheduled instructions of a block.
+        :return: Instruction id -> the instructions it waits for.
+        """
+        table = program.symbol_table
+        depends = {instruction.iid: set() for instruction in instructions}
+        # Name -> the last instruction in the block to write (or hold) it.
+        last = dict()
+        for instruction in instructions:
+            names = [use['name'] if isinstance(use, dict) else use for use in instruction.uses]
+            for name in names:
+                if name in last:
+                    depends[instruction.iid].add(last[name])
+            if instruction.op in ScheduleLength.holds:
+                for name in names:
+                    if not table.is_global(name):
+                        last[name] = instruction.iid
+            elif isinstance(instruction.defs, dict):
+                last[instruction.defs['name']] = instruction.iid
+        return depends
+
+    def schedule_block(self, program: Program, block, schedules: Dict[str, FunctionSchedule]) -> BlockSchedule:
+        schedule = BlockSchedule()
+        instructions = self.scheduled(block)
+        depends = self.dependencies(program, instructions)
+        for instruction in instructions:
+            schedule.duration[instruction.iid] = self.duration(instruction, schedules)
+
+        # Forward: the earliest starts.
+        for instruction in instructions:
+            iid = instruction.iid
+            schedule.asap[iid] = max((schedule.asap[dep] + schedule.duration[dep] for dep in depends[iid]),
+                                     default=0.0)
+            schedule.length = max(schedule.length, schedule.asap[iid] + schedule.duration[iid])
+
+        # Backward: the latest starts that don't make the block longer.
+        finish = {instruction.iid: schedule.length for instruction in instructions}
+        for instruction in reversed(instructions):
+            iid = instruction.iid
+            schedule.alap[iid] = finish[iid] - schedule.duration[iid]
+            for dep in depends[iid]:
+                finish[dep] = min(finish[dep], schedule.alap[iid])
+
+        schedule.critical = [instruction.iid for instruction in instructions
+                             if schedule.slack(instruction.iid) == 0 and
+                             (schedule.duration[instruction.iid] > 0 or schedule.length == 0)]
+        return schedule
+
+    @staticmethod
+    def trip_count(block) -> Optional[int]:
+        """
+        :param block: A loop header.
+        :return: How many times a REPEAT loop runs, or None if the header isn't a REPEAT's.
+        """
+        for instruction in block.instructions:
+            if instruction.op == IRInstruction.CONDITIONAL and isinstance(instruction.uses[0], dict):
+                var = instruction.uses[0].get('var')
+                name = getattr(var, 'points_to', var).name if var is not None else instruction.uses[0]['name']
+                if name.startswith('REPEAT_') and name[len('REPEAT_'):].isdigit():
+                    return int(name[len('REPEAT_'):])
+        return None
+
+    def schedule_function(self, program: Program, root: str,
+                          schedules: Dict[str, FunctionSchedule]) -> FunctionSchedule:
+        blocks = program.functions[root]['blocks']
+        cfg = program.function_cfg(root)
+        dominators = Dominators.get(program, root)
+        schedule = FunctionSchedule(root)
+        for nid in dominators.order:
+            schedule.blocks[nid] = self.schedule_block(program, blocks[nid], schedules)
+
+        # Header -> the blocks of its loop.
+        loops = dominators.natural_loops()
+        back_edges = {(latch, header) for header, body in loops.items()
+                      for latch in cfg.predecessors(header) if latch in body}
+
+        # Each loop is collapsed into its header, innermost first.
+        rank = {nid: at for at, nid in enumerate(dominators.order)}
+        weight = {nid: block.length for nid, block in schedule.blocks.items()}
+        representative = {nid: nid for nid in dominators.order}
+        for header in sorted(loops, key=lambda h: len(loops[h])):
+            body = loops[header]
+            latches = {representative[latch] for latch, target in back_edges if target == header and latch in body}
+            iteration = self.shortest(cfg, header, body, latches, weight, representative, rank, back_edges)
+            count = self.trip_count(blocks[header])
+            schedule.trip_counts[header] = count
+            # A loop that isn't a REPEAT may not run at all; its header is still checked once.
+            weight[header] = (count * iteration if count is not None else 0.0) + weight[header]
+            for member in body:
+                representative[member] = header
+
+        exits = {representative[nid] for nid in dominators.order
+                 if not any(succ in dominators.idoms for succ in cfg.successors(nid))}
+        entry = program.functions[root]['entry']
+        if entry in representative:
+            schedule.lower_bound = self.shortest(cfg, entry, set(dominators.order), exits or {entry},
+                                                 weight, representative, rank, back_edges)
+        return schedule
+
+    @staticmethod
+    def shortest(cfg, start: int, region: set, ends: set, weight: Dict, representative: Dict,
+                 rank: Dict, back_edges: set) -> float:
+        """
+        The shortest path through a region with its inner loops collapsed, which has no cycles.
+        :param cfg: The function's control flow graph.
+        :param start: Where paths start (a header, or the entry).
+        :param region: The blocks of the region.
+        :param ends: The (collapsed) blocks where paths end.
+        :param weight: Collapsed block -> its time.
+        :param representative: Block -> the collapsed block it is part of.
+        :param rank: Block -> its reverse post order number.
+        :param back_edges: The back edges of the graph.
+        :return: The time of the shortest path from start to one of the ends, including both.
+        """
+        nodes = sorted({representative[nid] for nid in region}, key=rank.get)
+        distance = {start: weight[start]}
+        for node in nodes:
+            if node not in distance:
+                continue
+            for member in [nid for nid in region if representative[nid] == node]:
+                for successor in cfg.successors(member):
+                    if successor not in region or (member, successor) in back_edges:
+                        continue
+                    target = representative[successor]
+                    if target == node:
+                        continue
+                    through = distance[node] + weight[target]
+                    if through < distance.get(target, float('inf')):
+                        distance[target] = through
+        reached = [distance[end] for end in ends if end in distance]
+        return min(reached) if reached else distance[start]
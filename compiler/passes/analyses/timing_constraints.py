@@ -0,0 +1,229 @@
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from compiler.data_structures.ir import UseBy
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.bs_analysis import BSAnalysis
+from compiler.passes.analyses.schedule_length import ScheduleLength
+
+# The constraint graph's source: every instruction starts at or after it.
+SOURCE = -1
+
+
+class Violation(object):
+    """
+    A use-by deadline that can't be met: the instructions in the chain
+    have to run one after the other, and take longer than the deadline allows.
+    """
+
+    def __init__(self, chain: List[int], deadline: float, needed: float):
+        # The instruction ids, from the one whose result has the deadline to the use that misses it.
+        self.chain = chain
+        # The seconds the result may wait after it's made.
+        self.deadline = deadline
+        # The seconds it has to wait.
+        self.needed = needed
+
+    def __repr__(self):
+        return "Violation({}, deadline={}, needed={})".format(self.chain, self.deadline, self.needed)
+
+
+class TimingInfo(object):
+    """
+    The timing of a function's blocks.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # Block id -> instruction id -> the earliest it can start, in seconds from the start of the block,
+        # with the deadlines that can be met in force.
+        self.starts = dict()
+        # Block id -> the deadlines it can't meet.
+        self.violations = dict()
+        # Block id -> the ids of the instructions whose results are used in other blocks;
+        # their deadlines aren't checked.
+        self.unchecked = dict()
+
+    @property
+    def feasible(self) -> bool:
+        """
+        :return: Whether the deadlines that were checked can be met; see checked.
+        """
+        return not any(self.violations.values())
+
+    @property
+    def checked(self) -> bool:
+        """
+        :return: Whether every deadline was checked.
+        """
+        return not any(self.unchecked.values())
+
+
+class TimingConstraints(BSAnalysis):
+    """
+    Checks the use-by deadlines of each block, without a solver.
+    The start times of a block's instructions are tied by difference constraints:
+    an instruction starts after what it depends on finishes (s_j - s_i >= d_i), and
+    everything that uses a result with a use-by deadline starts before the deadline
+    runs out (s_j - s_i <= d_i + deadline).  These form a graph whose longest paths
+    from a source are the earliest starts; a positive cycle is a chain of instructions
+    that can't fit in a deadline.  The longest paths are found with SPFA (the queue
+    based Bellman-Ford); the deadline on each positive cycle found is reported and
+    dropped, until the rest can be met.
+    Only uses within the block are constrained: a deadline on a result that is used
+    in another block (e.g.: across a repeat loop or an if/else) is reported as
+    unchecked, rather than as met.
+    Durations are those of the schedule length analysis, ExecuteFor included.
+    """
+
+    requires = ('schedule_length',)
+
+    def __init__(self):
+        super().__init__("Timing Constraints")
+
+    def analyze(self, program: Program) -> dict:
+        schedules = program.analysis.get('schedule_length')
+        if schedules is None:
+            schedules = ScheduleLength().analyze(program)['result']
+        estimator = ScheduleLength()
+        result = dict()
+        for root in program.functions:
+            info = TimingInfo(root)
+            blocks = program.functions[root]['blocks']
+            # Name -> the blocks that use it.
+            used_in = defaultdict(set)
+            for nid, block in blocks.items():
+                for instruction in block.instructions:
+                    for use in instruction.uses:
+                        used_in[use['name'] if isinstance(use, dict) else use].add(nid)
+            for nid, block in blocks.items():
+                info.starts[nid], info.violations[nid], info.unchecked[nid] = \
+                    self.check(program, block, estimator, schedules, used_in)
+                for violation in info.violations[nid]:
+                    self.log.warning("{}: the deadline of {}s for instruction {} can't be met; {} needs {}s.".format(
+                        root, violation.deadline, violation.chain[0], violation.chain, violation.needed))
+                for iid in info.unchecked[nid]:
+                    self.log.warning("{}: the deadline for instruction {} isn't checked; "
+                                     "its result is used in another block.".format(root, iid))
+            result[root] = info
+        program.stats['Timing constraints violated'] = sum(len(violations) for info in result.values()
+                                                           for violations in info.violations.values())
+        program.stats['Timing constraints unchecked'] = sum(len(unchecked) for info in result.values()
+                                                            for unchecked in info.unchecked.values())
+        return {'name': self.name, 'result': result}
+
+    @staticmethod
+    def deadline(instruction) -> Optional[float]:
+        """
+        :param instruction: The instruction.
+        :return: The tightest use-by deadline on its result, or None if it doesn't have one.
+        """
+        deadlines = [meta.quantity for meta in instruction.meta if isinstance(meta, UseBy)]
+        return float(min(deadlines)) if deadlines else None
+
+    def check(self, program: Program, block, estimator: ScheduleLength, schedules: Dict,
+              used_in: Dict) -> Tuple[Dict[int, float], List[Violation], List[int]]:
+        """
+        :param program: The program.
+        :param block: The block.
+        :param estimator: Where the dependencies and durations come from.
+        :param schedules: The schedules of the functions called.
+        :param used_in: Name -> the blocks of the function that use it.
+        :return: The earliest starts of the block's instructions, the deadlines it can't meet,
+            and the instructions whose deadlines aren't checked, because their results are used in other blocks.
+        """
+        instructions = estimator.scheduled(block)
+        depends = estimator.dependencies(program, instructions)
+        duration = {instruction.iid: estimator.duration(instruction, schedules) for instruction in instructions}
+
+        # Node -> (successor, weight, the instruction whose deadline the edge is, if it is one).
+        edges = {SOURCE: [(instruction.iid, 0.0, None) for instruction in instructions]}
+        for instruction in instructions:
+            edges[instruction.iid] = list()
+        for instruction in instructions:
+            for dep in depends[instruction.iid]:
+                edges[dep].append((instruction.iid, duration[dep], None))
+        unchecked = list()
+        for at, instruction in enumerate(instructions):
+            deadline = self.deadline(instruction)
+            if deadline is None or not isinstance(instruction.defs, dict):
+                continue
+            name = instruction.defs['name']
+            for reader in instructions[at + 1:]:
+                if name in [use['name'] if isinstance(use, dict) else use for use in reader.uses]:
+                    edges[reader.iid].append((instruction.iid, -(duration[instruction.iid] + deadline),
+                                              instruction.iid))
+                if isinstance(reader.defs, dict) and reader.defs['name'] == name and \
+                        reader.op not in ScheduleLength.holds:
+                    break
+            else:
+                # The result reaches the end of the block; any other block that uses it isn't constrained.
+                if used_in.get(name, set()) - {block.nid}:
+                    unchecked.append(instruction.iid)
+
+        violations = list()
+        while True:
+            starts, predecessor, cycle = self.longest_paths(edges)
+            if cycle is None:
+                return {iid: starts[iid] for iid in duration}, violations, unchecked
+            # The cycle goes down the chain and back up along (at least) one deadline.
+            at = next(index for index, (_, v) in enumerate(cycle) if predecessor[v][1] is not None)
+            cycle = cycle[at:] + cycle[:at]
+            user, defined = cycle[0]
+            chain = [v for _, v in cycle]
+            deadline = self.deadline(next(i for i in instructions if i.iid == defined))
+            needed = sum(duration[iid] for iid in chain[:-1]) - duration[defined]
+            violations.append(Violation(chain, deadline, needed))
+            edges[user] = [edge for edge in edges[user] if edge[2] != defined]
+
+    @staticmethod
+    def longest_paths(edges: Dict) -> Tuple[Dict, Dict, Optional[List[Tuple[int, int]]]]:
+        """
+        SPFA for the longest paths from the source.
+        :param edges: Node -> (successor, weight, deadline) edges.
+        :return: The longest distance to each node; node -> (its predecessor on that path, the edge's deadline);
+            and a positive cycle, as its (node, successor) edges in order, or None if there isn't one.
+        """
+        distance = {SOURCE: 0.0}
+        predecessor = dict()
+        # Node -> the number of edges on its path.
+        length = {SOURCE: 0}
+        queue = deque([SOURCE])
+        queued = {SOURCE}
+        while queue:
+            u = queue.popleft()
+            queued.discard(u)
+            for v, weight, deadline in edges[u]:
+                if distance[u] + weight > distance.get(v, float('-inf')):
+                    distance[v] = distance[u] + weight
+                    predecessor[v] = (u, deadline)
+                    length[v] = length[u] + 1
+                    if length[v] >= len(edges):
+                        # A path longer than the graph goes around a cycle.
+                        cycle = TimingConstraints.cycle(predecessor, v)
+                        if cycle is not None:
+                            return distance, predecessor, cycle
+                    if v not in queued:
+                        queued.add(v)
+                        queue.append(v)
+        return distance, predecessor, None
+
+    @staticmethod
+    def cycle(predecessor: Dict, node: int) -> Optional[List[Tuple[int, int]]]:
+        """
+        :param predecessor: Node -> (its predecessor, the edge's deadline).
+        :param node: Where to walk back from.
+        :return: The cycle walking back from node runs into, as its (node, successor) edges in order,
+            or None if the walk reaches the source.
+        """
+        seen = dict()
+        walk = list()
+        while node not in seen:
+            if node == SOURCE:
+                return None
+            seen[node] = len(walk)
+            walk.append(node)
+            node = predecessor[node][0]
+        cycle = walk[seen[node]:]
+        cycle.reverse()
+        return [(cycle[at - 1], cycle[at]) for at in range(len(cycle))]
@@ -1,42 +1,243 @@
-from copy import deepcopy
+from heapq import heappop, heappush
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
 from compiler.data_structures import Program
+from compiler.data_structures.properties import BSVolume
 from compiler.passes.analyses.bs_analysis import BSAnalysis
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.analyses.function_summary import FunctionSummaries, INFINITE
 from compiler.data_structures.ir import *
 
+# A variable's volumes: (size, the volume of each lane in microlitres); -1 is a disposed lane.
+# The arrays are read only, so states can share them freely.
+Entry = Tuple[int, np.ndarray]
 
-class VolumeTracker(BSAnalysis):
 
-    def __init__(self):
-        super().__init__("Volume Tracking")  # Sets the name to Volume Tracking?
-        self.variable_volume = dict()  # The dict that will store the current volumes of relevant variables
-        self.past_volumes = []  # Stores all past states of volumes
-        self.violation_found = False
-        self._program = None
+def frozen(volumes: np.ndarray) -> np.ndarray:
+    volumes.flags.writeable = False
+    return volumes
 
-    def analyze(self, program: Program) -> dict:  # The main function of the class
 
-        self._program = program
+def lanes(volumes: List[float]) -> np.ndarray:
+    return frozen(np.array(volumes, dtype=float))
+
+
+def replace(volumes: np.ndarray, lane: int, volume: float) -> np.ndarray:
+    """
+    :param volumes: The volumes of each lane.
+    :param lane: The lane to change.
+    :param volume: Its new volume.
+    :return: A copy of volumes, with the lane's volume replaced.
+    """
+    volumes = volumes.copy()
+    volumes[lane] = volume
+    return frozen(volumes)
 
-        for root in program.functions:
 
-            for node, data in program.bb_graph.nodes(data=True):
+def same(a: Entry, b: Entry) -> bool:
+    return a is b or (a is not None and b is not None and a[0] == b[0] and np.array_equal(a[1], b[1]))
 
-                for i in program.functions[root]['blocks'][node].instructions:
 
-                    self.handle(i)
+DISPOSED = lanes([-1])
+
+
+class VolumeHistory(object):
+    """
+    The volumes after each instruction of the volume tracking.
+    Only what each instruction changed is kept, along with a full state every
+    so often; a state is rebuilt from the nearest one when it is asked for.
+    history[i] is the volume each variable was last given, as of the i-th
+    instruction, as a dict of name -> {'size', 'volumes'}.
+    """
+
+    def __init__(self):
+        # The state before every interval-th instruction.
+        self._interval = 64
+        self._snapshots = list()
+        # (iid, {name: entry}) for each instruction.
+        self._deltas = list()
+        self._current = dict()
+
+    def record(self, iid: int, delta: Dict[str, Entry]):
+        if len(self._deltas) % self._interval == 0:
+            # Keep the number of states close to the number of deltas between them.
+            if len(self._snapshots) >= 2 * self._interval:
+                self._snapshots = self._snapshots[::2]
+                self._interval *= 2
+            if len(self._deltas) % self._interval == 0:
+                self._snapshots.append(dict(self._current))
+        self._deltas.append((iid, delta))
+        self._current.update(delta)
+
+    def iid(self, index: int) -> int:
+        """
+        :param index: The index into the history.
+        :return: The id of the instruction at index.
+        """
+        return self._deltas[index][0]
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def __getitem__(self, index: int) -> Dict[str, Dict]:
+        if index < 0:
+            index += len(self._deltas)
+        if not 0 <= index < len(self._deltas):
+            raise IndexError("Volume history index out of range")
+        if index == len(self._deltas) - 1:
+            state = self._current
+        else:
+            start = index // self._interval * self._interval
+            state = dict(self._snapshots[index // self._interval])
+            for _, delta in self._deltas[start:index + 1]:
+                state.update(delta)
+        return {name: {'size': size, 'volumes': volumes.tolist()} for name, (size, volumes) in state.items()}
+
+    def __iter__(self):
+        for index in range(len(self._deltas)):
+            yield self[index]
+
+
+class VolumeTracker(BSAnalysis):
+    """
+    Tracks the (minimum) volume of every fluid through each function.
+    This is a forward dataflow analysis over the function's control flow graph:
+    where paths meet, each variable keeps the smallest volume of any path,
+    and a phi node takes the smallest volume of its operands, each of which
+    is read at the end of the predecessor it comes from.  This way, the compiler
+    only proceeds when the volume is guaranteed to be correct.  Once the volumes
+    settle, each function is walked once more to check every instruction.
+    A call takes from its arguments, and returns, what the callee's summary says.
+    """
+
+    requires = ('dominators', 'function_summaries')
+    # The number of visits to a block before the volumes that keep changing are given up on.
+    widen_after = 3
+
+    def __init__(self):
+        super().__init__("Volume Tracking")
+        # The volumes of the instruction being handled, and what it changed.
+        self.state = dict()
+        self.delta = None
+        # The states at the end of the predecessors of the block being handled.
+        self.incoming = list()
+        self.past_volumes = VolumeHistory()
+        self.violation_found = False
+        self._program = None
+        # Volumes are tracked in microlitres.
+        self.units = BSVolume.MICROLITRE
+        # Function -> its summary.
+        self.summaries = dict()
 
-                    self.past_volumes.append(deepcopy(self.variable_volume))  # After every instruction has been handled, append the current state of the volume tracker to this list
+    def analyze(self, program: Program) -> dict:
+        self._program = program
+        self.units = program.config.units
+        self.summaries = program.analysis.get('function_summaries')
+        if self.summaries is None:
+            self.summaries = FunctionSummaries().analyze(program)['result']
+        visits = 0
 
+        for root in program.functions:
+            blocks = program.functions[root]['blocks']
+            cfg = program.function_cfg(root)
+            in_states, out_states, count = self.solve(cfg, Dominators.get(program, root).order, blocks)
+            visits += count
+
+            # Check and record each instruction with the final volumes.
+            for nid, block in blocks.items():
+                if nid not in in_states:
+                    continue
+                self.state = dict(in_states[nid])
+                self.incoming = [out_states.get(pred) for pred in cfg.predecessors(nid)]
+                for instruction in block.instructions:
+                    self.delta = dict()
+                    self.handle(instruction)
+                    self.past_volumes.record(instruction.iid, self.delta)
                     if self.violation_found:
                         break
+                if self.violation_found:
+                    break
+            self.delta = None
 
             if self.violation_found:
                 break
 
+        program.stats['Volume tracking block visits'] = visits
         return {'name': self.name,
-                'result': [self.violation_found, self.past_volumes]}  # Returns the relevant results
-
-    def handle(self,instruction: IR):  # The meat of the logic. Just ferries out the functions based on the type of instruction.
+                'result': [self.violation_found, self.past_volumes]}
+
+    def solve(self, cfg, order: List[int], blocks: Dict) -> Tuple[Dict, Dict, int]:
+        """
+        Runs the worklist until the volumes at the start and end of each block settle.
+        :param cfg: The function's control flow graph.
+        :param order: The reachable blocks, in reverse post order.
+        :param blocks: The function's blocks.
+        :return: The states at the start and at the end of each block, and the number of block visits.
+        """
+        rank = {nid: i for i, nid in enumerate(order)}
+        in_states = dict()
+        out_states = dict()
+        visits = {nid: 0 for nid in order}
+        work_list = [(i, nid) for i, nid in enumerate(order)]
+        queued = set(order)
+
+        while work_list:
+            _, nid = heappop(work_list)
+            queued.discard(nid)
+            visits[nid] += 1
+
+            self.incoming = [out_states.get(pred) for pred in cfg.predecessors(nid)]
+            in_states[nid] = self.join([out for out in self.incoming if out is not None])
+            self.state = dict(in_states[nid])
+            for instruction in blocks[nid].instructions:
+                self.handle(instruction)
+
+            old = out_states.get(nid)
+            out = self.state
+            if old is not None and visits[nid] > VolumeTracker.widen_after:
+                for name, (size, volumes) in out.items():
+                    if name in old and not same(old[name], out[name]):
+                        out[name] = (size, frozen(np.full(len(volumes), -1.0)))
+            if old is None or out.keys() != old.keys() or not all(same(out[name], old[name]) for name in out):
+                out_states[nid] = out
+                for succ in cfg.successors(nid):
+                    if succ in rank and succ not in queued:
+                        queued.add(succ)
+                        heappush(work_list, (rank[succ], succ))
+
+        # Violations found on the way there are found again below.
+        self.violation_found = False
+        return in_states, out_states, sum(visits.values())
+
+    @staticmethod
+    def join(states: List[Dict[str, Entry]]) -> Dict[str, Entry]:
+        """
+        The variables known on every path, each with the smallest volume of any path.
+        :param states: The states at the end of the predecessors.
+        :return: The joined state.
+        """
+        if not states:
+            return dict()
+        joined = dict(states[0])
+        for state in states[1:]:
+            for name in list(joined):
+                other = state.get(name)
+                if other is None:
+                    del joined[name]
+                elif not same(other, joined[name]):
+                    size, volumes = joined[name]
+                    count = min(len(volumes), len(other[1]))
+                    joined[name] = (min(size, other[0]), frozen(np.minimum(volumes[:count], other[1][:count])))
+        return joined
+
+    def set(self, name: str, size: int, volumes: np.ndarray):
+        self.state[name] = (size, volumes)
+        if self.delta is not None:
+            self.delta[name] = (size, volumes)
+
+    def handle(self, instruction: IR):
         if type(instruction) == Dispense:
             self.handle_dispense(instruction)
             return
@@ -54,151 +255,166 @@ class VolumeTracker(BSAnalysis):
             return
         if type(instruction) == Phi:
             self.handle_phi(instruction)
+            return
 
-    # We assume that the variable being created here has the minimum possible volume. This way, the compiler only proceeds when volume is guaranteed to be correct
-    def handle_phi(self, instructions: IR):
-        possible_volumes = []
-
-        for i in range(len(instructions.uses)):
-            possible_volumes.append(deepcopy(min(self.variable_volume[instructions.uses[i]]['volumes'])))
-
-        entry = dict()  # The dict that will hold our new entry in the variable_volume ds
-        volumes = list()  # The list that will holds the volumes stored at each index
-
-        volumes.append(min(possible_volumes))  # Add the dispense'd quantity toi the volumes list. In this case we assume that size is always 1, so we only do it a single time.
-
-        # Build the entry dict
-        entry['size'] = 1
-        entry['volumes'] = volumes
-
-        # Add the entry to the volume tracker
-        self.variable_volume[instructions.defs['name']] = entry
-
-    def handle_dispense(self, instructions: IR):
-
-        quantity = min(self._program.symbol_table.get_local(instructions.defs['name'], "main").volumes[instructions.iid])
-
-        # Initialize the structures we will use later on
-        entry = dict()  # The dict that will hold our new entry in the variable_volume ds
-        volumes = list()  # The list that will holds the volumes stored at each index
-
-        volumes.append(quantity)  # Add the dispense'd quantity toi the volumes list. In this case we assume that size is always 1, so we only do it a single time.
-
-        # Build the entry dict
-        entry['size'] = instructions.defs['size']
-        entry['volumes'] = volumes
+        if type(instruction) == Call:
+            self.handle_call(instruction)
 
-        # Add the entry to the volume tracker
-        self.variable_volume[instructions.defs['name']] = entry
+    def handle_phi(self, instruction: IR):
+        possible_volumes = []
 
-    def handle_dispose(self,instructions: IR):  # This is the function that is called when a dispose instruction is found.
+        for use, out in zip(instruction.uses, self.incoming):
+            # The predecessor hasn't been visited yet.
+            if out is None:
+                continue
+            # Not a fluid (or one we know nothing about).
+            if use not in out:
+                return
+            possible_volumes.append(out[use])
 
-        if instructions.uses[0]['size'] < 1 or self.get_volume(instructions.uses[0]) < 1:
-            self.violation_found = True
+        if not possible_volumes:
             return
-
-        if instructions.uses[0]['offset'] >= 0:
-            if self.variable_volume.get(instructions.defs['name'], None) is not None:
-                self.variable_volume[instructions.defs['name']]['volumes'][instructions['offset']] = -1  # Since volumes is a list, we wrap our single volume data in its own list. This is to avoid any issues when reading a disposed variable's entry down the line
-
-            else:
-                self.violation_found = True
+        if len({len(volumes) for _, volumes in possible_volumes}) == 1:
+            # Arrays keep their lanes, each with its smallest volume.
+            self.set(instruction.defs['name'], min(size for size, _ in possible_volumes),
+                     frozen(np.minimum.reduce([volumes for _, volumes in possible_volumes])))
         else:
-            self.variable_volume[instructions.defs['name']]['volumes'] = [-1]  # Since volumes is a list, we wrap our single volume data in its own list. This is to avoid any issues when reading a disposed variable's entry down the line
-            self.variable_volume[instructions.defs['name']]['size'] = 0  # A disposed variable doesn't have a presence on the board. It's size is therefore zero.
+            self.set(instruction.defs['name'], 1, lanes([min(volumes.min() for _, volumes in possible_volumes)]))
 
-    def _handle_dispose(self,
-                        instructions: dict):  # This is an internal simulation of the proper dispose function. It is used internally by mix and split when the host variable(s) are destroyed by the execution of the instruction
+    def handle_dispense(self, instruction: IR):
+        quantity = self.units.normalize(min(instruction.defs['var'].volumes[instruction.iid]))
+        # Each lane of an array gets the dispensed quantity.
+        self.set(instruction.defs['name'], instruction.defs['size'],
+                 frozen(np.full(max(instruction.defs['size'], 1), quantity, dtype=float)))
 
-        if instructions['offset'] >= 0:
-            if self.variable_volume.get(instructions['name'], None) is not None:
-                self.variable_volume[instructions['name']]['volumes'][instructions['offset']] = -1  # Since volumes is a list, we wrap our single volume data in its own list. This is to avoid any issues when reading a disposed variable's entry down the line
-            else:
-                self.violation_found = True
-
-        else:
-            self.variable_volume[instructions['name']]['volumes'] = [-1]  # Since volumes is a list, we wrap our single volume data in its own list. This is to avoid any issues when reading a disposed variable's entry down the line
-            self.variable_volume[instructions['name']]['size'] = 0  # A disposed variable doesn't have a presence on the board. It's size is therefore zero.
+    def handle_dispose(self, instruction: IR):
+        use = instruction.uses[0]
+        if use['name'] not in self.state:
+            return
 
-    def handle_mix(self, instructions: IR):
-        quantity = self._program.symbol_table.get_local(instructions.defs['name'], "main").volumes[instructions.iid]
+        if use['size'] < 1 or self.get_volume(use) < 1:
+            self.violation_found = True
 
-        quantity_0 = quantity[0]  # Grab the first value
-        quantity_1 = quantity[1]  # Grab the second value
+        self._handle_dispose(use)
+
+    def _handle_dispose(self, use: dict):
+        """
+        Disposes of the variable (or index of the variable) use refers to;
+        also used by mix and split when a use is consumed.
+        :param use: The operand being disposed.
+        :return: None
+        """
+        size, volumes = self.state[use['name']]
+        if 0 <= use['offset'] < len(volumes):
+            self.set(use['name'], size, replace(volumes, use['offset'], -1))
+        else:
+            # A disposed variable doesn't have a presence on the board. It's size is therefore zero.
+            self.set(use['name'], 0, DISPOSED)
+
+    def is_simd(self, instruction: IR) -> bool:
+        """
+        Does the instruction work on whole arrays, lane by lane?
+        :param instruction: The mix or split.
+        :return: True if every use is a whole array of more than one lane, all of the same width.
+        """
+        widths = set()
+        for use in instruction.uses:
+            if use['offset'] >= 0 or use['name'] not in self.state:
+                return False
+            widths.add(len(self.state[use['name']][1]))
+        return len(widths) == 1 and widths.pop() > 1
+
+    def handle_mix(self, instruction: IR):
+        quantities = [self.units.normalize(quantity) for quantity in instruction.defs['var'].volumes[instruction.iid]]
+
+        if self.is_simd(instruction):
+            # Each lane is mixed with the same lane of the other array.
+            for use, quantity in zip(instruction.uses, quantities):
+                size, volumes = self.state[use['name']]
+                if np.any(quantity > volumes):
+                    self.violation_found = True
+                self.set(use['name'], size, frozen(np.where(volumes == quantity, -1, volumes - quantity)))
+            width = len(self.state[instruction.uses[0]['name']][1])
+            self.set(instruction.defs['name'], instruction.defs['size'],
+                     frozen(np.full(width, quantities[0] + quantities[1])))
+            return
 
         # Check if there is enough volume in the two uses to support the operation
-        if instructions.uses[0]['offset'] >= 0:  # In this case, a discrete offset of 'volumes' is used. Therefore, the value of 'volumes['offset']' must be at least quantity_0
-            if quantity_0 > self.variable_volume[instructions.uses[0]['name']]['volumes'][instructions.uses[0]['offset']]:
-                self.violation_found = True
-                return
-
-        else:  # In this case, offset is -1. That means that we need to use every single drop in whichever index in 'volumes'. Therefore, the sumation of 'volumes' must be at least quantity_0.
-            if quantity_0 > sum(self.variable_volume[instructions.uses[0]['name']]['volumes']):
-                self.violation_found = True
-                return
-
-        # Perform the same checks for the other use
-        if instructions.uses[1]['offset'] >= 0:
-            if quantity_1 > self.variable_volume[instructions.uses[1]['name']]['volumes'][instructions.uses[1]['offset']]:
-                self.violation_found = True
-                return
-
-        else:
-            if quantity_1 > sum(self.variable_volume[instructions.uses[1]['name']]['volumes']):
+        for use, quantity in zip(instruction.uses, quantities):
+            if use['name'] in self.state and quantity > self.get_volume(use):
                 self.violation_found = True
-                return
-
-        # Initialize the structures we will use later on
-        entry = dict()  # The dict that will hold our new entry in the variable_volume ds
-        volumes = list()  # The list that will holds the volumes stored at each index
-
-        volumes.append(quantity_0 + quantity_1)  # Add the dispense'd quantity to the volumes list. In this case we assume that size is always 1, so we only do it a single time.
-
-        # Build the entry dict
-        entry['size'] = instructions.defs['size']
-        entry['volumes'] = volumes
-
-        # Add the entry to the volume tracker
-        self.variable_volume[instructions.defs['name']] = entry
 
         # Adjust the entries for the two variables that were used
-        if quantity_0 == self.variable_volume[instructions.uses[0]['name']]['volumes'][instructions.uses[0]['offset']]:
-            self._handle_dispose(instructions.uses[0])  # if the volume is completely used up, destroy the old var
+        for use, quantity in zip(instruction.uses, quantities):
+            if use['name'] in self.state:
+                self.take(use, quantity)
+
+        self.set(instruction.defs['name'], instruction.defs['size'], lanes([quantities[0] + quantities[1]]))
+
+    def take(self, use: dict, quantity: float):
+        """
+        Takes a quantity from the variable (or index of the variable) use refers to.
+        :param use: The operand.
+        :param quantity: The volume taken.
+        :return: None
+        """
+        size, volumes = self.state[use['name']]
+        index = use['offset'] if 0 <= use['offset'] < len(volumes) else len(volumes) - 1
+        if quantity == volumes[index]:
+            self._handle_dispose(use)  # if the volume is completely used up, destroy the old var
         else:
-            self.variable_volume[instructions.uses[0]['name']]['volumes'][instructions.uses[0]['offset']] -= quantity_0  # If the volume isn't totally used, simply reduce its volume appropriately
-
-        if quantity_1 == self.variable_volume[instructions.uses[1]['name']]['volumes'][instructions.uses[1]['offset']]:
-            self._handle_dispose(instructions.uses[1])
-        else:
-            self.variable_volume[instructions.uses[1]['name']]['volumes'][instructions.uses[1]['offset']] -= quantity_1
-
-    def handle_split(self, instructions: IR):
-        if self.get_volume(instructions.uses[0]) <= 0:
-            self.violation_found = True
-            return
+            self.set(use['name'], size, replace(volumes, index, volumes[index] - quantity))
 
-        if self.get_volume(instructions.uses[0]) % instructions.defs['size'] != 0:
-            self.violation_found = True
+    def handle_call(self, instruction: IR):
+        summary = self.summaries.get(instruction.name)
+        if summary is None:
             return
 
-        # Initialize the structures we will use later on
-        entry = dict()  # The dict that will hold our new entry in the variable_volume ds
-        volumes = list()  # The list that will holds the volumes stored at each index
-
-        for i in range(instructions.defs['size']):  # Since a split should evenly break a variable into a given set of sub-variables, this loop puts volume/num_split of the use into each sub-variable of the def
-            volumes.append(self.get_volume(instructions.uses[0]) / instructions.defs['size'])
-
-        # Build the entry dict
-        entry['size'] = instructions.defs['size']
-        entry['volumes'] = volumes
+        for use, quantity in zip(instruction.uses, summary.consumed):
+            if not isinstance(use, dict) or use['name'] not in self.state or quantity == 0:
+                continue
+            if quantity == INFINITE:
+                self._handle_dispose(use)
+                continue
+            if quantity > self.get_volume(use):
+                self.violation_found = True
+            self.take(use, quantity)
 
-        # Add the entry to the volume tracker
-        self.variable_volume[instructions.defs['name']] = entry
+        if summary.produced is not None and isinstance(instruction.defs, dict):
+            self.set(instruction.defs['name'], instruction.defs.get('size', 1), lanes([summary.produced]))
 
-        self._handle_dispose(instructions.uses[0])
+    def handle_split(self, instruction: IR):
+        use = instruction.uses[0]
+        if use['name'] not in self.state:
+            return
 
-    def get_volume(self, var: dict) -> int:  # A helper function that fetch's the volume associated with a given variable's offset. This is not user-guarded, so use sparingly.
-        if var['offset'] >= 0:
-            return self.variable_volume[var['name']]['volumes'][var['offset']]
+        size = instruction.defs['size']
+        if self.is_simd(instruction):
+            # Each lane is split on its own; its pieces sit next to each other.
+            volumes = self.state[use['name']][1]
+            if np.any(volumes <= 0) or np.any(volumes % size != 0):
+                self.violation_found = True
+            self.set(instruction.defs['name'], size * len(volumes), frozen(np.repeat(volumes / size, size)))
         else:
-            return sum(self.variable_volume[var['name']]['volumes'])
+            volume = self.get_volume(use)
+            if volume <= 0 or volume % size != 0:
+                self.violation_found = True
+
+            # A split evenly breaks a variable into a given set of sub-variables.
+            self.set(instruction.defs['name'], size, frozen(np.full(size, volume / size)))
+
+        self._handle_dispose(use)
+
+    def get_volume(self, var: dict) -> Optional[float]:
+        """
+        Gets the volume of the given index of a variable, or of all of it.
+        :param var: The operand.
+        :return: The volume, or None if nothing is known about the variable.
+        """
+        entry = self.state.get(var['name'])
+        if entry is None:
+            return None
+        volumes = entry[1]
+        if 0 <= var['offset'] < len(volumes):
+            return volumes[var['offset']]
+        return volumes.sum()
@@ -1,62 +1,219 @@
-import colorlog
-import networkx as nx
+from timeit import default_timer as timer
+from typing import List
 
 from compiler.data_structures.program import Program
+from compiler.passes.analyses.bs_analysis import BSAnalysis
 from compiler.passes.analyses.call_graph import CallGraph
 from compiler.passes.analyses.track_volume import VolumeTracker
 from compiler.passes.analyses.def_use import DefUseChains
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.analyses.function_summary import FunctionSummaries
+from compiler.passes.analyses.liveness import Liveness
+from compiler.passes.analyses.schedule_length import ScheduleLength
+from compiler.passes.analyses.timing_constraints import TimingConstraints
+from compiler.passes.transforms.constant_propagation import ConstantPropagation
+from compiler.passes.transforms.dead_code import DeadCodeElimination
 from compiler.passes.transforms.inline import Inline
+from compiler.passes.transforms.loop_unroll import LoopUnroll
+from compiler.passes.transforms.out_of_ssa import OutOfSSA
 from compiler.passes.transforms.split_edges import SplitEdges
+from compiler.passes.transforms.value_numbering import ValueNumbering
 from compiler.passes.transforms.simd_expansion import SIMDExpansion
 from compiler.passes.transforms.ssa import SSA
+from compiler.targets.target_selector import TargetSelector
+from shared.bs_exceptions import UnsupportedOperation
+from shared.lazy_logger import LazyLogger
 
 
 class PassManager(object):
+    """
+    Runs a pipeline of analyses and transforms over a program.
+    Each pass declares the analyses it requires, and each transform
+    the analyses it preserves.  An analysis is only computed when a
+    pass in the pipeline asks for it, and is kept until a transform
+    invalidates it; analyses that are cached per function are only
+    dropped for the functions the transform changed.
+    The latest result of every analysis is in program.analysis.
+    """
+    log = LazyLogger()
+    # The targets that emit code, and so can't execute phi nodes.
+    code_targets = {TargetSelector.IR, TargetSelector.LLVM_IR, TargetSelector.PUDDLE}
+    # The passes a pipeline can name.
+    registry = {
+        'call_graph': CallGraph,
+        'def_use': DefUseChains,
+        'dominators': Dominators,
+        'function_summaries': FunctionSummaries,
+        'liveness': Liveness,
+        'schedule_length': ScheduleLength,
+        'timing_constraints': TimingConstraints,
+        'volume_tracking': VolumeTracker,
+        'loop_unroll': LoopUnroll,
+        'inline': Inline,
+        'constant_propagation': ConstantPropagation,
+        'value_numbering': ValueNumbering,
+        'dead_code': DeadCodeElimination,
+        'split_edges': SplitEdges,
+        'out_of_ssa': OutOfSSA,
+        'simd_expansion': SIMDExpansion,
+    }
 
     def __init__(self, program: Program):
         self.config = None
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.log.debug("Initializing pass manager.")
         self.program = program
         self.config = program.config
-        # self.dependencies = {'analysis': nx.DiGraph(), 'transforms': nx.DiGraph()}
         self.transforms = dict()
         self.analysis = dict()
+        # The analyses whose result in program.analysis is up to date.
+        self.valid = set()
+        # Pass name -> the seconds spent in it.
+        self.times = dict()
+        self.pipeline = list(self.config.passes) if self.config.passes else self.default_pipeline()
+        unknown = [key for key in self.pipeline if key not in PassManager.registry]
+        if unknown:
+            raise UnsupportedOperation("Unknown passes: {}; the passes are: {}.".format(
+                ", ".join(unknown), ", ".join(PassManager.registry)))
         # Ensure SSA is run first.
         self.run_ssa()
 
+    def default_pipeline(self) -> List[str]:
+        """
+        The pipeline used when none is given.
+        :return: The names of the passes, in order.
+        """
+        pipeline = ['call_graph']
+        if self.config.inline:
+            # Inlined code is analyzed, and unrolled, along with its caller.
+            pipeline.append('inline')
+        if self.config.loopunroll:
+            # The analyses that follow see the unrolled code.
+            pipeline.append('loop_unroll')
+        if self.config.constant_propagation:
+            # The constants unrolling and inlining expose; the passes after it see straight line code.
+            pipeline.append('constant_propagation')
+        if self.config.value_numbering or self.config.coalesce_dispenses:
+            pipeline.append('value_numbering')
+        if self.config.dead_code:
+            # After inlining and unrolling, which leave values unused, and before anything looks at them.
+            pipeline.append('dead_code')
+        pipeline.extend(['def_use', 'liveness', 'volume_tracking', 'schedule_length', 'timing_constraints'])
+        if self.config.target in PassManager.code_targets:
+            pipeline.extend(['split_edges', 'out_of_ssa'])
+        pipeline.append('simd_expansion')
+        return pipeline
+
     def run_ssa(self):
         if not self.program.ssa_form:
             ssa = SSA()
+            start = timer()
             self.program = ssa.transform(self.program)
+            self.timed(ssa.name, start)
             self.program.ssa_form = True
-            # self.log.info(self.program.symbol_table)
-            # self.log.info(self.program.functions['main']['blocks'])
+
+    def run(self):
+        """
+        Runs the pipeline, in order.
+        :return: None
+        """
+        self.init_analysis()
+        self.init_transforms()
+        for key in self.pipeline:
+            if key in self.analysis:
+                self.require(key)
+            else:
+                self.run_transform(key)
 
     def run_transformations(self):
         self.init_transforms()
-        # TODO: This should be handled through decorator.
-        # TODO: Make this handle dependencies correctly.
-        for key, value in self.transforms.items():
-            if key is 'loop_unroll' and not self.config.loopunroll:
-                continue
-            self.program = value.transform(self.program)
+        for key in self.pipeline:
+            if key in self.transforms:
+                self.run_transform(key)
 
     def run_analysis(self):
         self.init_analysis()
-        # TODO: This should be handled through decorator.
-        for key, value in self.analysis.items():
-            self.program.analysis[key] = value.analyze(self.program)['result']
+        for key in self.pipeline:
+            if key in self.analysis:
+                self.require(key)
 
     def init_analysis(self):
-        self.analysis['call_graph'] = CallGraph()
-        self.analysis['def_use'] = DefUseChains()
-        self.analysis['volume_tracking'] = VolumeTracker()
-        # self.dependencies['analysis'].add_node('call_graph')
+        for key, value in PassManager.registry.items():
+            if issubclass(value, BSAnalysis) and key not in self.analysis:
+                self.analysis[key] = value()
 
     def init_transforms(self):
-        if self.config.inline:
-            self.transforms['inline'] = Inline()
-        self.transforms['split_edges'] = SplitEdges()
-        self.transforms['simd_expansion'] = SIMDExpansion()
-        # self.dependencies['transforms'].add_node('split_edges')
+        for key in self.pipeline:
+            if not issubclass(PassManager.registry[key], BSAnalysis) and key not in self.transforms:
+                self.transforms[key] = PassManager.registry[key]()
+
+    def require(self, key: str):
+        """
+        Gets the result of an analysis, computing it
+        (and what it requires) only if it isn't up to date.
+        :param key: The analysis.
+        :return: The result.
+        """
+        if key not in self.valid:
+            if key not in self.analysis:
+                self.analysis[key] = PassManager.registry[key]()
+            analysis = self.analysis[key]
+            for required in analysis.requires:
+                self.require(required)
+            if analysis.per_function:
+                # Callees are analyzed before their callers.
+                calls = self.require('call_graph')
+                start = timer()
+                self.program.analysis[key] = calls.schedule(
+                    lambda component, done: {root: analysis.get(self.program, root) for root in component})
+            else:
+                start = timer()
+                self.program.analysis[key] = analysis.analyze(self.program)['result']
+            self.timed(analysis.name, start)
+            self.valid.add(key)
+        return self.program.analysis[key]
+
+    def run_transform(self, key: str):
+        """
+        Runs a transform, after bringing the analyses it requires up to date,
+        and then invalidates the analyses it doesn't preserve.
+        :param key: The transform.
+        :return: None
+        """
+        transform = self.transforms[key]
+        for required in transform.requires:
+            self.require(required)
+        start = timer()
+        self.program = transform.transform(self.program)
+        self.timed(transform.name, start)
+        self.invalidate(transform)
+
+    def invalidate(self, transform):
+        """
+        Drops the analyses a transform didn't preserve, along with
+        everything computed from them.  Per function analyses are
+        only dropped for the functions the transform changed.
+        :param transform: The transform that just ran.
+        :return: None
+        """
+        modified = transform.modified
+        if modified is not None and not modified:
+            return
+        invalid = {key for key in self.analysis if key not in transform.preserves}
+        changed = True
+        while changed:
+            changed = False
+            for key, analysis in self.analysis.items():
+                if key not in invalid and invalid.intersection(analysis.requires):
+                    invalid.add(key)
+                    changed = True
+        roots = self.program.functions if modified is None else modified
+        for key in invalid:
+            self.valid.discard(key)
+            if self.analysis[key].per_function:
+                for root in roots:
+                    if root in self.program.functions:
+                        self.program.functions[root].pop(key, None)
+
+    def timed(self, name: str, start: float):
+        self.times[name] = self.times.get(name, 0) + timer() - start
+        self.program.stats['{} time'.format(name)] = round(self.times[name], 4)
@@ -0,0 +1,332 @@
+import copy
+from typing import Dict, List
+
+from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import IR, IRInstruction, Label
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import RenamedSymbol, Symbol
+from compiler.passes.transforms.bs_transform import BSTransform
+
+
+class BlockCopier(BSTransform):
+    """
+    The base of the transforms that copy blocks of SSA code into a function
+    (loop unrolling and inlining), or rename its values (value numbering):
+    copying and renaming instructions, giving definitions new SSA versions,
+    and editing the control flow graph around the copies while keeping phi
+    operands in line with the predecessors.
+    """
+
+    def __init__(self, pass_name: str):
+        super().__init__(pass_name)
+        self.program = None
+        # Base sid -> the highest SSA version of it.
+        self.versions = dict()
+        # Function -> version name -> its symbol; see: symbols_of.
+        self.symbols = dict()
+
+    def start(self, program: Program):
+        """
+        Gets ready to edit a program.
+        :param program: The program.
+        :return: None
+        """
+        self.program = program
+        self.modified = set()
+        table = program.symbol_table
+        self.versions = dict()
+        self.symbols = dict()
+        for base, version in table.version_names:
+            self.versions[base] = max(self.versions.get(base, 0), version)
+
+    def symbols_of(self, root: str) -> Dict[str, Symbol]:
+        """
+        The symbols of the names a function uses.  Locals of different functions
+        can have versions of the same name, so names are resolved per function.
+        :param root: The function.
+        :return: Version name -> its symbol.
+        """
+        if root not in self.symbols:
+            table = self.program.symbol_table
+            versions = {name: table.get_version(base, version)
+                        for name, (base, version) in table.scope_versions(root).items()}
+            self.symbols[root] = {name: var for name, var in versions.items() if var is not None}
+        return self.symbols[root]
+
+    def copy_blocks(self, source: Dict[int, BasicBlock], root: str, nids: List[int], renamed: Dict[str, str],
+                    skip=None, returns: Dict[int, int] = None) -> Dict[int, int]:
+        """
+        Copies blocks into a function, without any edges.
+        :param source: The blocks to copy from (those of any function).
+        :param root: The function the copies go in.
+        :param nids: The blocks to copy, in order.
+        :param renamed: Old name -> new name; the copies' definitions are added to it.
+        :param skip: An instruction that isn't copied; what it defines is what it uses.
+        :param returns: The blocks of the source making calls -> the blocks the calls return to.
+        :return: Old block -> its copy.
+        """
+        blocks = self.program.functions[root]['blocks']
+        copies = dict()
+        labels = dict()
+        for nid in nids:
+            block = BasicBlock()
+            block.add(self.copy_label(source[nid].label, block.nid))
+            blocks[block.nid] = block
+            self.program.cfg.add_node(block.nid, function=root, label=block.label.label)
+            copies[nid] = block.nid
+            labels[source[nid].label.label] = block.label
+
+        for nid in nids:
+            block = blocks[copies[nid]]
+            for instruction in source[nid].instructions:
+                if instruction.op == IRInstruction.LABEL:
+                    continue
+                if instruction is skip:
+                    renamed[instruction.defs['name']] = renamed.get(instruction.uses[0]['name'],
+                                                                    instruction.uses[0]['name'])
+                    continue
+                duplicate = self.copy_instruction(instruction, renamed, labels, root)
+                if duplicate.op == IRInstruction.PHI:
+                    # A phi node's operands are names, which add doesn't take.
+                    block.instructions.append(duplicate)
+                    block.defs.add(duplicate.defs['name'])
+                    block.uses.update(duplicate.uses)
+                else:
+                    block.add(duplicate)
+            block.phis = {instruction for instruction in block.instructions if instruction.op == IRInstruction.PHI}
+            block.jumps = [labels.get(jump.label, jump) if isinstance(jump, Label) else jump
+                           for jump in source[nid].jumps]
+            if nid in self.program.calls:
+                self.program.calls[copies[nid]] = set(self.program.calls[nid])
+            if returns and nid in returns:
+                self.program.functions[root].setdefault('returns', dict())[copies[nid]] = \
+                    copies.get(returns[nid], returns[nid])
+        return copies
+
+    @staticmethod
+    def copy_label(label: Label, nid: int) -> Label:
+        """
+        :param label: The label of the block copied.
+        :param nid: The copy.
+        :return: The copy's label, which keeps the kind of construct the block belongs to, e.g. bsbbw.
+        """
+        parts = label.label.split('_')
+        kind, suffix = (parts[0], parts[-1]) if label.label.startswith('bsbb') and len(parts) == 3 else ('bsbbr', 'u')
+        return Label(f"{kind}_{nid}_{suffix}")
+
+    def copy_instruction(self, instruction, renamed: Dict[str, str], labels: Dict[str, Label], root: str):
+        """
+        :param instruction: The instruction.
+        :param renamed: Old name -> new name; a definition that isn't in it gets
+            a new SSA version, which is added to it.
+        :param labels: Old label -> the copy's label.
+        :param root: The function.
+        :return: The copy.
+        """
+        duplicate = copy.copy(instruction)
+        duplicate.iid = IR.get_next_id()
+        duplicate.meta = list(instruction.meta)
+        duplicate._uses = list()
+        duplicate.uses = [self.rename(use, renamed, root) for use in instruction.uses]
+        deff = instruction.defs
+        if isinstance(deff, dict):
+            shared = [x for x, use in enumerate(instruction.uses) if use is deff]
+            if shared:
+                # Heat and dispose define the very operand they use.
+                duplicate.defs = duplicate.uses[shared[0]]
+            else:
+                if deff['name'] in renamed:
+                    duplicate.defs = self.rename(deff, renamed, root)
+                else:
+                    duplicate.defs = self.fresh(deff, root)
+                    renamed[deff['name']] = duplicate.defs['name']
+                volumes = deff['var'].volumes.get(instruction.iid) if deff.get('var') is not None else None
+                if volumes is not None and duplicate.defs.get('var') is not None:
+                    duplicate.defs['var'].volumes[duplicate.iid] = list(volumes) \
+                        if isinstance(volumes, list) else volumes
+        if instruction.op == IRInstruction.CONDITIONAL:
+            duplicate.left = duplicate.uses[0]
+            duplicate.right = duplicate.uses[1] if len(duplicate.uses) > 1 else instruction.right
+            for branch in ('true_branch', 'false_branch'):
+                target = getattr(instruction, branch)
+                if target is not None:
+                    setattr(duplicate, branch, labels.get(target.label, target))
+        elif instruction.op == IRInstruction.JUMP and instruction.jumps.label in labels:
+            duplicate.jumps = labels[instruction.jumps.label]
+        return duplicate
+
+    def rename(self, operand, renamed: Dict[str, str], root: str):
+        """
+        :param operand: An operand (a name, for phi nodes).
+        :param renamed: Old name -> new name.
+        :param root: The function the operand is in.
+        :return: The operand, renamed.
+        """
+        if isinstance(operand, str):
+            return renamed.get(operand, operand)
+        operand = dict(operand)
+        if operand['name'] in renamed:
+            operand['name'] = renamed[operand['name']]
+            operand['var'] = self.symbols_of(root).get(operand['name'], operand.get('var'))
+        return operand
+
+    def fresh(self, operand: dict, root: str, base: int = None) -> dict:
+        """
+        :param operand: A definition.
+        :param root: The function.
+        :param base: The symbol to version, if it isn't the operand's.
+        :return: The definition, as a new SSA version.
+        """
+        if base is None:
+            var = operand['var']
+            base = var.base if isinstance(var, RenamedSymbol) else self.program.symbol_table.get_symbol(
+                operand['name'], root).sid
+        self.versions[base] = self.versions.get(base, 0) + 1
+        return dict(operand, **self.version(base, self.versions[base], root))
+
+    def version(self, base: int, version: int, root: str) -> dict:
+        """
+        :return: The name and symbol of an SSA version, creating it if needs be.
+        """
+        table = self.program.symbol_table
+        name = table.version_name(base, version)
+        var = table.get_version(base, version)
+        if var is None:
+            var = table.add_version(RenamedSymbol(name, table.get_symbol_by_id(base), version), root)
+        self.symbols_of(root)[name] = var
+        return {'name': name, 'var': var}
+
+    def rename_uses(self, root: str, nids: List[int], renamed: Dict[str, str]):
+        """
+        Renames the uses in some blocks.
+        :param root: The function.
+        :param nids: The blocks.
+        :param renamed: Old name -> new name.
+        :return: None
+        """
+        blocks = self.program.functions[root]['blocks']
+        for nid in nids:
+            for instruction in blocks[nid].instructions:
+                for x, use in enumerate(instruction.uses):
+                    name = use if isinstance(use, str) else use['name']
+                    if name in renamed:
+                        replacement = self.rename(use, renamed, root)
+                        if instruction.defs is use:
+                            instruction.defs = replacement
+                        instruction.uses[x] = replacement
+                if instruction.op == IRInstruction.CONDITIONAL and instruction.uses:
+                    instruction.left = instruction.uses[0]
+                    instruction.right = instruction.uses[1] if len(instruction.uses) > 1 else instruction.right
+
+    def replace_successor(self, root: str, source: int, old: int, new: int):
+        """
+        Replaces the edge from source to old with one from source to new,
+        keeping the order of source's successors.
+        """
+        graph = self.program.cfg
+        successors = list(graph.successors(source))
+        for succ in successors:
+            graph.remove_edge(source, succ)
+        for succ in successors:
+            graph.add_edge(source, new if succ == old else succ)
+
+    def replace_predecessor(self, root: str, destination: int, old: int, new: int):
+        """
+        Replaces the edge from old to destination with one from new to destination,
+        keeping the order of destination's predecessors (and so of its phi operands).
+        """
+        graph = self.program.cfg
+        predecessors = list(graph.predecessors(destination))
+        for pred in predecessors:
+            graph.remove_edge(pred, destination)
+        for pred in predecessors:
+            graph.add_edge(new if pred == old else pred, destination)
+
+    @staticmethod
+    def retarget(block: BasicBlock, old: Label, new: Label):
+        """
+        Points a block's branches to old at new.
+        """
+        for instruction in block.instructions:
+            if instruction.op == IRInstruction.CONDITIONAL:
+                if instruction.true_branch is not None and instruction.true_branch.label == old.label:
+                    instruction.true_branch = new
+                if instruction.false_branch is not None and instruction.false_branch.label == old.label:
+                    instruction.false_branch = new
+            elif instruction.op == IRInstruction.JUMP and instruction.jumps.label == old.label:
+                instruction.jumps = new
+        block.jumps = [new if isinstance(jump, Label) and jump.label == old.label else jump for jump in block.jumps]
+
+    def place(self, root: str, at: int, removed: List[int], chain: List[int]):
+        """
+        Removes blocks, and moves the new blocks of the chain to where the loop was (right after at).
+        """
+        blocks = self.program.functions[root]['blocks']
+        for nid in removed:
+            self.program.cfg.remove_node(nid)
+            self.program.calls.pop(nid, None)
+            self.program.functions[root].get('returns', dict()).pop(nid, None)
+        ordered = dict()
+        for nid, block in blocks.items():
+            if nid in chain:
+                continue
+            if nid not in removed:
+                ordered[nid] = block
+            if nid == at:
+                for copied in chain:
+                    ordered[copied] = blocks[copied]
+        blocks.clear()
+        blocks.update(ordered)
+
+    def merge_blocks(self, root: str, candidates: List[int]):
+        """
+        Merges each candidate with its successor while it's the only one, and the candidate its only predecessor.
+        :param root: The function.
+        :param candidates: The blocks to merge into.
+        :return: None
+        """
+        blocks = self.program.functions[root]['blocks']
+        graph = self.program.cfg
+        entry = self.program.functions[root]['entry']
+        for nid in candidates:
+            while nid in blocks:
+                successors = graph.successors(nid)
+                if len(successors) != 1 or successors[0] == nid or successors[0] == entry:
+                    break
+                succ = successors[0]
+                if succ not in blocks or graph.predecessors(succ) != [nid] or blocks[succ].phis or \
+                        any(instruction.op == IRInstruction.CONDITIONAL for instruction in blocks[nid].instructions):
+                    break
+                block, absorbed = blocks[nid], blocks[succ]
+                block.instructions = [instruction for instruction in block.instructions
+                                      if not (instruction.op == IRInstruction.JUMP and
+                                              instruction.jumps.label == absorbed.label.label)]
+                block.instructions.extend(instruction for instruction in absorbed.instructions
+                                          if instruction.op != IRInstruction.LABEL)
+                block.jumps = absorbed.jumps
+                block.defs |= absorbed.defs
+                block.uses |= absorbed.uses
+                if succ in self.program.calls:
+                    self.program.calls.setdefault(nid, set()).update(self.program.calls.pop(succ))
+                returns = self.program.functions[root].get('returns', dict())
+                if succ in returns:
+                    returns[nid] = returns.pop(succ)
+                after = list(graph.successors(succ))
+                for target in after:
+                    self.replace_predecessor(root, target, succ, nid)
+                graph.remove_node(succ)
+                del blocks[succ]
+
+    def reorder_phis(self, root: str, nid: int, old: List[int]):
+        """
+        Puts the operands of a block's phi nodes back in line with its predecessors,
+        after its edges have been added in another order.
+        :param root: The function.
+        :param nid: The block.
+        :param old: The predecessors the operands are in the order of.
+        :return: None
+        """
+        new = self.program.function_cfg(root).predecessors(nid)
+        for phi in self.program.functions[root]['blocks'][nid].phis:
+            operands = dict(zip(old, phi.uses))
+            phi.uses[:] = [operands[pred] for pred in new]
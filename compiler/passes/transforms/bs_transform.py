@@ -1,15 +1,21 @@
 from abc import ABCMeta, abstractmethod
 
-import colorlog
-
 from compiler.data_structures.program import Program
+from shared.lazy_logger import LazyLogger
 
 
 class BSTransform(metaclass=ABCMeta):
+    log = LazyLogger()
+    # The (pass manager names of the) analyses that must be up to date,
+    # in program.analysis, before this runs.
+    requires = ()
+    # The analyses that are still valid after this runs.
+    preserves = ()
 
     def __init__(self, pass_name: str):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.name = pass_name
+        # The functions the last run changed; None if it may have changed any of them.
+        self.modified = None
 
     @abstractmethod
     def transform(self, program: Program) -> Program:
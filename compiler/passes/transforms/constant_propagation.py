@@ -0,0 +1,463 @@
+import operator
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from chemicals.chemtypes import ChemTypeResolver
+from compiler.data_structures.ir import BinaryOps, Constant, IRInstruction, RelationalOps
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import Number, Symbol
+from compiler.passes.transforms.block_copier import BlockCopier
+
+
+class ConstantPropagation(BlockCopier):
+    """
+    Sparse conditional constant propagation over the SSA form (after Wegman and Zadeck).
+    Every number starts out unknown, and is lowered to a constant, or to not constant, as the
+    instructions defining it are evaluated; only the blocks that can be reached, going through
+    conditionals only along the branches their operands allow, are evaluated, and a phi node only
+    merges the values of the edges that can be taken.  The constants are the global constants,
+    the values a repeat counter starts at, number assignments, and the math, phi nodes and copies
+    computed from them.  Then the uses of a constant use the global constant of its value, and the
+    math, phi nodes and copies that computed it go; a conditional whose operands are constants
+    becomes a jump to the branch it takes, and the blocks that can't be reached are removed.
+    What's left of the control flow is merged into as few blocks as it can, so control flow that
+    is known statically becomes straight line code.  A repeat counter isn't a constant inside its
+    loop, so repeat loops are left to unrolling.
+    """
+
+    # The values of the math operators, and of the relational ones.
+    math = {BinaryOps.ADD: operator.add, BinaryOps.SUBTRACT: operator.sub, BinaryOps.MULTIPLE: operator.mul,
+            BinaryOps.DIVIDE: operator.truediv}
+    relations = {RelationalOps.EQUALITY: operator.eq, RelationalOps.NE: operator.ne, RelationalOps.LT: operator.lt,
+                 RelationalOps.LTE: operator.le, RelationalOps.GT: operator.gt, RelationalOps.GTE: operator.ge}
+    # The instructions that compute a number from the numbers they use.
+    folds = {IRInstruction.MATH, IRInstruction.PHI, IRInstruction.COPY}
+    repeat = re.compile(r'REPEAT_(\d+)$')
+    # A value that isn't constant.
+    varying = 'varying'
+
+    def __init__(self):
+        super().__init__("Constant Propagation")
+        # Name -> its value: the values of a number's lanes, or varying; a name that isn't there is unknown.
+        self.values = dict()
+        # The names defined in the function.
+        self.defined = set()
+        # The function being solved.
+        self.root = None
+
+    def transform(self, program: Program) -> Program:
+        self.start(program)
+        folded = branches = dead = 0
+        for root in program.functions:
+            reached, taken = self.solve(root)
+            removed = self.fold_values(root, reached)
+            resolved = self.fold_branches(root, taken)
+            blocks = self.remove_blocks(root, reached)
+            if removed or resolved or blocks:
+                self.modified.add(root)
+                self.remove_trivial_phis(root)
+                self.merge_blocks(root, list(program.functions[root]['blocks']))
+                self.update_block_def_use(root)
+            folded += removed
+            branches += resolved
+            dead += blocks
+
+        program.stats['Constants folded'] = program.stats.get('Constants folded', 0) + folded
+        program.stats['Conditionals folded'] = program.stats.get('Conditionals folded', 0) + branches
+        program.stats['Dead branch blocks removed'] = program.stats.get('Dead branch blocks removed', 0) + dead
+        return program
+
+    @staticmethod
+    def name_of(operand) -> str:
+        return operand if isinstance(operand, str) else operand['name']
+
+    @staticmethod
+    def number(value) -> Optional[Dict[int, float]]:
+        """
+        :param value: The value of a number: index -> value (or a value).
+        :return: The value, if all of its lanes are known; otherwise None.
+        """
+        lanes = value if isinstance(value, dict) else {0: value}
+        if not lanes or any(isinstance(lane, bool) or not isinstance(lane, (int, float)) or lane != lane
+                            for lane in lanes.values()):
+            return None
+        return dict(lanes)
+
+    def initial(self, name: str):
+        """
+        :param name: A name that isn't defined in the function.
+        :return: Its value: a global constant's, a repeat counter's before the loop, or varying.
+        """
+        table = self.program.symbol_table
+        if name.startswith('CONST_') and table.is_global(name):
+            value = self.number(getattr(table.get_global(name).value, 'value', None))
+            return value if value is not None else ConstantPropagation.varying
+        symbol = self.symbols_of(self.root).get(name)
+        base = getattr(symbol, 'points_to', None)
+        if base is not None and symbol.version == 0:
+            match = ConstantPropagation.repeat.match(base.name)
+            if match:
+                return {0: int(match.group(1))}
+        return ConstantPropagation.varying
+
+    def value(self, name: str):
+        """
+        :param name: A name.
+        :return: What's known of its value so far (None if nothing is).
+        """
+        if name in self.defined:
+            return self.values.get(name)
+        if name not in self.values:
+            self.values[name] = self.initial(name)
+        return self.values[name]
+
+    def lane(self, use):
+        """
+        :param use: An operand.
+        :return: The value of the lane it uses, None if it's unknown, or varying.
+        """
+        value = self.value(self.name_of(use))
+        if value is None or value is ConstantPropagation.varying:
+            return value
+        offset = use.get('offset', 0) if isinstance(use, dict) else 0
+        if len(value) == 1:
+            return next(iter(value.values()))
+        return value.get(offset, ConstantPropagation.varying)
+
+    def evaluate(self, instruction, nid: int, executable: Set[Tuple[int, int]], preds: List[int]):
+        """
+        :param instruction: An instruction defining a name.
+        :param nid: Its block.
+        :param executable: The edges that can be taken.
+        :param preds: The predecessors of the block, in the order of its phi operands.
+        :return: The value of what it defines.
+        """
+        if instruction.op == IRInstruction.CONSTANT:
+            if instruction.defs.get('size', 1) > 1 and instruction.defs.get('offset', -1) not in {-1, 0}:
+                return ConstantPropagation.varying
+            value = self.number(instruction.value)
+            return value if value is not None else ConstantPropagation.varying
+        if instruction.op == IRInstruction.PHI:
+            merged = None
+            for pred, use in zip(preds, instruction.uses):
+                if (pred, nid) not in executable:
+                    continue
+                value = self.value(use)
+                if value is None:
+                    continue
+                if value is ConstantPropagation.varying or (merged is not None and merged != value):
+                    return ConstantPropagation.varying
+                merged = value
+            return merged
+        if instruction.defs.get('size', 1) != 1:
+            return ConstantPropagation.varying
+        if instruction.op == IRInstruction.COPY:
+            value = self.lane(instruction.uses[0])
+        elif instruction.op == IRInstruction.MATH and instruction.operand in ConstantPropagation.math:
+            operands = [self.lane(use) for use in instruction.uses]
+            if ConstantPropagation.varying in operands:
+                return ConstantPropagation.varying
+            if None in operands:
+                return None
+            if instruction.operand == BinaryOps.DIVIDE and operands[1] == 0:
+                return ConstantPropagation.varying
+            value = ConstantPropagation.math[instruction.operand](*operands)
+        else:
+            return ConstantPropagation.varying
+        return {0: value} if value is not None and value is not ConstantPropagation.varying else value
+
+    def condition(self, instruction):
+        """
+        :param instruction: A conditional.
+        :return: Whether it holds, None if that's unknown yet, or varying.
+        """
+        operands = [self.lane(use) for use in instruction.uses[:2]]
+        if len(operands) != 2 or ConstantPropagation.varying in operands or \
+                instruction.relop not in ConstantPropagation.relations:
+            return ConstantPropagation.varying
+        if None in operands:
+            return None
+        return ConstantPropagation.relations[instruction.relop](*operands)
+
+    def branches(self, root: str, nid: int, instruction) -> Optional[Tuple[int, int]]:
+        """
+        :param root: The function.
+        :param nid: The block ending in a conditional.
+        :param instruction: The conditional.
+        :return: The blocks its true and false branches go to, or None if they aren't its successors.
+        """
+        blocks = self.program.functions[root]['blocks']
+        successors = self.program.function_cfg(root).successors(nid)
+        targets = list()
+        for branch in (instruction.true_branch, instruction.false_branch):
+            target = [succ for succ in successors if branch is not None and blocks[succ].label is not None and
+                      blocks[succ].label.label == branch.label]
+            if len(target) != 1:
+                return None
+            targets.append(target[0])
+        return targets[0], targets[1]
+
+    def solve(self, root: str) -> Tuple[Set[int], Dict[int, int]]:
+        """
+        Finds the values of a function's numbers, and the blocks that can be reached.
+        :param root: The function.
+        :return: The blocks that can be reached, and the block -> the only branch its conditional takes.
+        """
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        self.root = root
+        self.values = dict()
+        self.defined = set()
+        # Name -> the instructions using it, and their blocks.
+        users = dict()
+        # Conditional -> its block.
+        conditionals = dict()
+        for nid, block in blocks.items():
+            for instruction in block.instructions:
+                if self.defines(instruction):
+                    self.defined.add(instruction.defs['name'])
+                for use in instruction.uses:
+                    users.setdefault(self.name_of(use), list()).append((nid, instruction))
+                if instruction.op == IRInstruction.CONDITIONAL:
+                    conditionals[instruction.iid] = nid
+
+        executable = set()
+        reached = set()
+        # Conditional block -> the branches it can take.
+        outcomes = dict()
+        entry = self.program.functions[root]['entry']
+        edges = [(None, entry)]
+        work = list()
+
+        def visit(nid: int, instruction):
+            if instruction.op == IRInstruction.CONDITIONAL:
+                targets = self.branches(root, nid, instruction)
+                holds = self.condition(instruction)
+                if holds is None:
+                    return
+                if targets is None or holds is ConstantPropagation.varying:
+                    taken = set(cfg.successors(nid))
+                else:
+                    taken = {targets[0] if holds else targets[1]}
+                outcomes.setdefault(nid, set()).update(taken)
+                edges.extend((nid, succ) for succ in taken)
+                return
+            if not self.defines(instruction):
+                return
+            name = instruction.defs['name']
+            value = self.evaluate(instruction, nid, executable, cfg.predecessors(nid))
+            old = self.values.get(name)
+            if value is None or value == old or old is ConstantPropagation.varying:
+                return
+            self.values[name] = value if old is None else ConstantPropagation.varying
+            work.extend(users.get(name, list()))
+
+        while edges or work:
+            if edges:
+                edge = edges.pop()
+                if edge in executable:
+                    continue
+                executable.add(edge)
+                nid = edge[1]
+                for phi in [instruction for instruction in blocks[nid].instructions
+                            if instruction.op == IRInstruction.PHI]:
+                    visit(nid, phi)
+                if nid in reached:
+                    continue
+                reached.add(nid)
+                for instruction in blocks[nid].instructions:
+                    if instruction.op != IRInstruction.PHI:
+                        visit(nid, instruction)
+                if not any(instruction.op == IRInstruction.CONDITIONAL for instruction in blocks[nid].instructions):
+                    edges.extend((nid, succ) for succ in cfg.successors(nid))
+            else:
+                nid, instruction = work.pop()
+                if nid in reached:
+                    visit(nid, instruction)
+
+        taken = {nid: next(iter(succs)) for nid, succs in outcomes.items()
+                 if len(succs) == 1 and len(cfg.successors(nid)) > 1}
+        return reached, taken
+
+    @staticmethod
+    def defines(instruction) -> bool:
+        """
+        :return: Does the instruction define a name (rather than act on one it uses)?
+        """
+        return isinstance(instruction.defs, dict) and instruction.op != IRInstruction.RETURN and \
+            not any(use is instruction.defs for use in instruction.uses)
+
+    def constant(self, value, root: str) -> str:
+        """
+        :param value: A value.
+        :param root: The function using it.
+        :return: The name of the global constant of the value, which is added if needs be.
+        """
+        table = self.program.symbol_table
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        name = 'CONST_{}'.format(value)
+        if not table.is_global(name):
+            symbol = Symbol(name, table.global_scope, ChemTypeResolver.numbers())
+            symbol.value = Number(name, 1, value)
+            table.add_global(symbol)
+        self.symbols_of(root)[name] = table.get_global(name)
+        return name
+
+    def fold_values(self, root: str, reached: Set[int]) -> int:
+        """
+        Replaces the uses of the constants with the global constants of their values,
+        and removes the math, phi nodes and copies computing the constants.
+        A phi node using a constant keeps it, so the instruction computing it becomes a constant.
+        :param root: The function.
+        :param reached: The blocks that can be reached.
+        :return: The number of instructions folded.
+        """
+        blocks = self.program.functions[root]['blocks']
+        constants = {name: self.constant(next(iter(value.values())), root)
+                     for name, value in self.values.items()
+                     if name in self.defined and value is not ConstantPropagation.varying and len(value) == 1}
+        if not constants:
+            return 0
+        # Phi operands are names, so they can't name a global constant.
+        kept = {use for nid in reached for instruction in blocks[nid].instructions
+                if instruction.op == IRInstruction.PHI and instruction.defs['name'] not in constants
+                for use in instruction.uses if use in constants}
+
+        folded = 0
+        for nid in reached:
+            block = blocks[nid]
+            instructions = list()
+            after = list()
+            changed = False
+            for instruction in block.instructions:
+                name = instruction.defs['name'] if self.defines(instruction) else None
+                if instruction.op not in ConstantPropagation.folds or name not in constants:
+                    instructions.append(instruction)
+                    continue
+                folded += 1
+                changed = True
+                self.log.debug("{} is {}.".format(name, constants[name]))
+                if name not in kept:
+                    continue
+                value = self.values[name]
+                replacement = Constant(dict(instruction.defs, offset=-1, size=1), dict(value))
+                if instruction.op == IRInstruction.PHI:
+                    # Phi nodes stay at the top of the block.
+                    after.append(replacement)
+                else:
+                    instructions.append(replacement)
+            if after:
+                at = next((x for x, instruction in enumerate(instructions) if instruction.op != IRInstruction.PHI),
+                          len(instructions))
+                instructions[at:at] = after
+            if changed:
+                block.instructions = instructions
+                block.phis = {instruction for instruction in instructions if instruction.op == IRInstruction.PHI}
+
+        # Only the operands that aren't phi operands are renamed.
+        for nid in reached:
+            for instruction in blocks[nid].instructions:
+                if instruction.op == IRInstruction.PHI:
+                    continue
+                for x, use in enumerate(instruction.uses):
+                    if isinstance(use, dict) and use['name'] in constants:
+                        replacement = dict(self.rename(use, constants, root), offset=0, size=1)
+                        if instruction.defs is use:
+                            instruction.defs = replacement
+                        instruction.uses[x] = replacement
+                if instruction.op == IRInstruction.CONDITIONAL and instruction.uses:
+                    instruction.left = instruction.uses[0]
+                    instruction.right = instruction.uses[1] if len(instruction.uses) > 1 else instruction.right
+        return folded
+
+    def fold_branches(self, root: str, taken: Dict[int, int]) -> int:
+        """
+        Replaces the conditionals that only take one branch with a jump to it, and removes
+        the edge to the other, along with its phi operands.
+        :param root: The function.
+        :param taken: Block -> the only branch its conditional takes.
+        :return: The number of conditionals folded.
+        """
+        blocks = self.program.functions[root]['blocks']
+        for nid, succ in taken.items():
+            block = blocks[nid]
+            block.instructions = [instruction for instruction in block.instructions
+                                  if instruction.op != IRInstruction.CONDITIONAL]
+            block.jumps = [blocks[succ].label]
+            for other in [other for other in self.program.function_cfg(root).successors(nid) if other != succ]:
+                self.remove_edge(root, nid, other)
+            self.log.debug("Block {} of {} always goes to block {}.".format(nid, root, succ))
+        return len(taken)
+
+    def remove_edge(self, root: str, source: int, destination: int):
+        """
+        Removes an edge, and the phi operands for it.
+        """
+        preds = self.program.function_cfg(root).predecessors(destination)
+        block = self.program.functions[root]['blocks'][destination]
+        for phi in block.phis:
+            phi.uses[:] = [use for pred, use in zip(preds, phi.uses) if pred != source]
+        self.program.cfg.remove_edge(source, destination)
+
+    def remove_blocks(self, root: str, reached: Set[int]) -> int:
+        """
+        Removes the blocks that can't be reached, along with their phi operands.
+        :param root: The function.
+        :param reached: The blocks that can be reached.
+        :return: The number of blocks removed.
+        """
+        blocks = self.program.functions[root]['blocks']
+        dead = [nid for nid in blocks if nid not in reached]
+        cfg = self.program.function_cfg(root)
+        for nid in reached:
+            preds = cfg.predecessors(nid)
+            if any(pred in dead for pred in preds):
+                for phi in blocks[nid].phis:
+                    phi.uses[:] = [use for pred, use in zip(preds, phi.uses) if pred not in dead]
+        for nid in dead:
+            self.log.debug("Removed block {} of {}, which can't be reached.".format(nid, root))
+            self.program.cfg.remove_node(nid)
+            self.program.calls.pop(nid, None)
+            self.program.functions[root].get('returns', dict()).pop(nid, None)
+            del blocks[nid]
+        return len(dead)
+
+    def remove_trivial_phis(self, root: str):
+        """
+        Removes the phi nodes left with a single value to merge; what used them uses the value.
+        :param root: The function.
+        :return: None
+        """
+        blocks = self.program.functions[root]['blocks']
+        leaders = dict()
+        for block in blocks.values():
+            for phi in list(block.phis):
+                values = {use for use in phi.uses if use != phi.defs['name']}
+                if len(values) != 1:
+                    continue
+                leaders[phi.defs['name']] = values.pop()
+                block.instructions.remove(phi)
+                block.phis.discard(phi)
+        if not leaders:
+            return
+        # A value may be a phi node that went too.
+        for name in leaders:
+            while leaders[name] in leaders and leaders[name] != name:
+                leaders[name] = leaders[leaders[name]]
+        for block in blocks.values():
+            for phi in block.phis:
+                phi.uses[:] = [leaders.get(use, use) for use in phi.uses]
+        self.rename_uses(root, list(blocks), leaders)
+
+    def update_block_def_use(self, root: str):
+        for block in self.program.functions[root]['blocks'].values():
+            block.defs = set()
+            block.uses = set()
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    continue
+                for use in instruction.uses:
+                    block.uses.add(use['name'])
+                if self.defines(instruction):
+                    block.defs.add(instruction.defs['name'])
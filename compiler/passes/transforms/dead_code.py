@@ -0,0 +1,201 @@
+from collections import defaultdict
+from typing import Set
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.schedule_length import ScheduleLength
+from compiler.passes.transforms.bs_transform import BSTransform
+
+
+class DeadCodeElimination(BSTransform):
+    """
+    Removes the instructions whose results are never needed, and the blocks the entry can't reach,
+    working on the SSA form.  It is aggressive: everything is assumed dead until it's shown to be live,
+    so dead values that only feed each other (around a loop, say) go too.  What can't be removed is live:
+    stores, returns, calls and control flow.  A value is live if a live instruction uses it, and then so are
+    the instruction defining it, the heats of its droplet (which change what it is), and its disposals.
+    A droplet that is only ever disposed of, such as a dispense that's immediately disposed, is dead along
+    with its disposal; a detect whose result isn't used observes nothing, and is dead.  A droplet that's
+    live stays live where phi nodes pass it on, so its leftovers are still disposed of.
+    """
+
+    # The instructions that go when nothing needs them; anything else is always live.
+    removable = {IRInstruction.MIX, IRInstruction.SPLIT, IRInstruction.DETECT, IRInstruction.HEAT,
+                 IRInstruction.DISPENSE, IRInstruction.DISPOSE, IRInstruction.GRADIENT, IRInstruction.MATH,
+                 IRInstruction.BINARYOP, IRInstruction.CONSTANT, IRInstruction.PHI, IRInstruction.COPY}
+    # The instructions that act on the droplet they use, rather than define a new one.
+    holds = {IRInstruction.HEAT, IRInstruction.DISPOSE}
+    # The instructions that pass a value on to a new name.
+    passes = {IRInstruction.PHI, IRInstruction.COPY}
+    # The instructions that aren't operations.
+    meta = {IRInstruction.LABEL, IRInstruction.NOP, IRInstruction.PHI, IRInstruction.JUMP, IRInstruction.RETURN}
+
+    def __init__(self):
+        super().__init__("Dead Code Elimination")
+        self.program = None
+        self.timing = ScheduleLength()
+        # What the last run removed.
+        self.instructions = 0
+        self.operations = 0
+        self.volume = 0.0
+        self.time = 0.0
+
+    def transform(self, program: Program) -> Program:
+        self.program = program
+        self.modified = set()
+        self.instructions = self.operations = 0
+        self.volume = self.time = 0.0
+        unreachable = 0
+
+        for root in program.functions:
+            blocks = self.unreachable(root)
+            if self.sweep(root, self.mark(root)) or blocks:
+                self.modified.add(root)
+                self.update_block_def_use(root)
+            unreachable += blocks
+
+        program.stats['Dead instructions removed'] = \
+            program.stats.get('Dead instructions removed', 0) + self.instructions
+        program.stats['Dead operations removed'] = program.stats.get('Dead operations removed', 0) + self.operations
+        program.stats['Dead volume removed'] = program.stats.get('Dead volume removed', 0) + self.volume
+        program.stats['Dead operation time removed (s)'] = \
+            program.stats.get('Dead operation time removed (s)', 0) + self.time
+        program.stats['Unreachable blocks removed'] = program.stats.get('Unreachable blocks removed', 0) + unreachable
+        return program
+
+    @staticmethod
+    def name_of(operand) -> str:
+        return operand if isinstance(operand, str) else operand['name']
+
+    def unreachable(self, root: str) -> int:
+        """
+        Removes the blocks of a function its entry can't reach, along with their phi operands.
+        :param root: The function.
+        :return: The number of blocks removed.
+        """
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        entry = self.program.functions[root]['entry']
+        reached = cfg.reachable(entry) | {entry}
+        dead = [nid for nid in blocks if nid not in reached]
+        if not dead:
+            return 0
+        for nid in reached:
+            preds = cfg.predecessors(nid)
+            if not any(pred in dead for pred in preds):
+                continue
+            for phi in blocks[nid].phis:
+                phi.uses[:] = [use for pred, use in zip(preds, phi.uses) if pred not in dead]
+        for nid in dead:
+            for instruction in blocks[nid].instructions:
+                self.removed(instruction)
+            self.log.debug("Removed block {} of {}, which can't be reached.".format(nid, root))
+            self.program.cfg.remove_node(nid)
+            self.program.calls.pop(nid, None)
+            self.program.functions[root].get('returns', dict()).pop(nid, None)
+            del blocks[nid]
+        return len(dead)
+
+    def mark(self, root: str) -> Set[int]:
+        """
+        :param root: The function.
+        :return: The ids of its live instructions.
+        """
+        instructions = [instruction for block in self.program.functions[root]['blocks'].values()
+                        for instruction in block.instructions]
+        # Name -> the instruction defining it.
+        defining = dict()
+        # Name -> the instructions that act on its droplet, and those that pass it on.
+        holding = defaultdict(list)
+        passing = defaultdict(list)
+        for instruction in instructions:
+            if instruction.op in DeadCodeElimination.holds:
+                for use in instruction.uses:
+                    holding[self.name_of(use)].append(instruction)
+            elif isinstance(instruction.defs, (dict, str)) and instruction.op != IRInstruction.RETURN and \
+                    not any(use is instruction.defs for use in instruction.uses):
+                defining[self.name_of(instruction.defs)] = instruction
+            if instruction.op in DeadCodeElimination.passes:
+                for use in instruction.uses:
+                    passing[self.name_of(use)].append(instruction)
+
+        live = set()
+        names = set()
+        work = [instruction for instruction in instructions if instruction.op not in DeadCodeElimination.removable]
+        # A droplet that comes from outside the function (a parameter) is still there to be held.
+        work.extend(instruction for name, held in holding.items() if name not in defining for instruction in held)
+
+        def need(name: str):
+            if name in names:
+                return
+            names.add(name)
+            if name in defining:
+                work.append(defining[name])
+            work.extend(holding[name])
+            work.extend(passing[name])
+
+        while work:
+            instruction = work.pop()
+            if instruction.iid in live:
+                continue
+            live.add(instruction.iid)
+            for use in instruction.uses:
+                need(self.name_of(use))
+            # A call's result is there whether it's used or not, and a droplet passed on is still a droplet.
+            if instruction.op in DeadCodeElimination.passes or instruction.op == IRInstruction.CALL:
+                if isinstance(instruction.defs, (dict, str)):
+                    need(self.name_of(instruction.defs))
+        return live
+
+    def sweep(self, root: str, live: Set[int]) -> int:
+        """
+        Removes the instructions of a function that aren't live.
+        :param root: The function.
+        :param live: The ids of the live instructions.
+        :return: The number of instructions removed.
+        """
+        removed = 0
+        for block in self.program.functions[root]['blocks'].values():
+            kept = list()
+            for instruction in block.instructions:
+                if instruction.op in DeadCodeElimination.removable and instruction.iid not in live:
+                    self.removed(instruction)
+                    removed += 1
+                else:
+                    kept.append(instruction)
+            if len(kept) != len(block.instructions):
+                block.instructions = kept
+                block.phis = {instruction for instruction in kept if instruction.op == IRInstruction.PHI}
+        return removed
+
+    def removed(self, instruction):
+        """
+        Accounts for an instruction that's removed.
+        :param instruction: The instruction.
+        :return: None
+        """
+        self.instructions += 1
+        if instruction.op in DeadCodeElimination.meta:
+            return
+        self.operations += 1
+        self.time += self.timing.duration(instruction, dict())
+        if instruction.op == IRInstruction.DISPENSE and instruction.defs.get('var') is not None:
+            volumes = instruction.defs['var'].volumes.get(instruction.iid)
+            if volumes:
+                volume = min(volumes) if isinstance(volumes, list) else volumes
+                self.volume += self.program.config.units.normalize(volume) * max(instruction.defs.get('size', 1), 1)
+        self.log.debug("Removed dead instruction: {}".format(instruction))
+
+    def update_block_def_use(self, root: str):
+        for block in self.program.functions[root]['blocks'].values():
+            block.defs = set()
+            block.uses = set()
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    continue
+                for use in instruction.uses:
+                    block.uses.add(use['name'])
+                if instruction.op in DeadCodeElimination.holds:
+                    continue
+                if isinstance(instruction.defs, dict):
+                    block.defs.add(instruction.defs['name'])
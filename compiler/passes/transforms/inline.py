@@ -1,128 +1,285 @@
-from compiler.data_structures import Program
-from compiler.passes.transforms.bs_transform import BSTransform
-from compiler.data_structures.ir import *
-from compiler.data_structures.variable import Variable
+from collections import Counter
+from typing import Dict, Optional, Set, Tuple
 
-class Inline(BSTransform):
+from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import IRInstruction, Label, Phi
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import RenamedSymbol, Symbol
+from compiler.passes.analyses.call_graph import CallGraph
+from compiler.passes.transforms.block_copier import BlockCopier
+
+
+class Inline(BlockCopier):
+    """
+    Inlines calls, working on the SSA form.  The block making a call is split
+    after it, and the callee's blocks are copied in between: the first half
+    enters the copy, and each of the callee's returns leaves it for the second
+    half, where a phi node merges the values returned if there's more than one.
+    The callee's names get symbols of their own in the caller, so they keep
+    their SSA versions; its parameters are the arguments of the call.
+    Functions are visited bottom up over the call graph, so the calls in a
+    callee are inlined before the callee is.  A call to a function that can
+    call itself isn't inlined.  Otherwise, a call is inlined when what the copy
+    adds (the callee's instructions) less what goes away (the call, and moving
+    its arguments across the call) is within the inline threshold, or when it's
+    the only call to the callee.  A function whose calls were all inlined is removed.
+    """
+
+    requires = ('call_graph',)
+    # The instructions that don't count towards a function's size.
+    free = {IRInstruction.LABEL, IRInstruction.NOP, IRInstruction.JUMP, IRInstruction.PHI, IRInstruction.RETURN}
 
     def __init__(self):
         super().__init__("inliner")
-        self.var_num = 0
-
-
-    def handle_call(self, program, call, already_called=set()):
-        def inline_var_names(a, parameter_map, global_vars):
-            '''
-            small local function for transforming parameter arguments into their
-            appropriate outer scope variables
-            '''
-            if a[:-1] in parameter_map:
-                return parameter_map[a[:-1]]
-
-            if a in parameter_map:
-                return parameter_map[a]
-
-            if a in global_vars:
-                return a
-            return '{}_{}{}'.format(call.name, a, str(self.var_num))
-
-        
-        func_name = call.name
-        ret = call.defs.name
-        func_info = program.symbol_table.functions[func_name]
-        global_vars = program.symbol_table.globals.keys()
-        parameter_map = {}
-        instructions = []
-
-        #map the return value to the local variable
-        for block in program.functions[func_name]['blocks'].values():
-            ret_names = block.get_returns()
-            if ret_names != None:
-                key = ret_names.return_value.name
-                value = ret
-                parameter_map[key] = value
-
-
-        #map the parameters to the actual variable names
-        for arg, uses in zip(func_info.args, call.uses):
-            key = arg.name 
-            value = uses.name
-            parameter_map[key] = value 
-
-
-        for block in program.functions[func_name]['blocks'].values():
-            for instr in block.instructions:
-
-                inline_instr = None
-
-                if type(instr) == Dispose:
-                    a = inline_var_names(instr.uses[0].name, parameter_map, global_vars)
-                    inline_instr = Dispose(Variable(a))
-                elif type(instr) == Mix:
-                    r = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                    a   = inline_var_names(instr.uses[0].name, parameter_map, global_vars)
-                    b   = inline_var_names(instr.uses[1].name, parameter_map, global_vars)
-                    inline_instr = Mix(Variable(r), Variable(a), Variable(b))
-                elif type(instr) == Split:
-                    r = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                    a = inline_var_names(instr.uses[0].name, parameter_map, global_vars)
-                    inline_instr = Split(Variable(r), Variable(a))
-                elif type(instr) == Detect:
-                    r = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                    a   = inline_var_names(instr.uses[0].name, global_vars)
-                    inline_instr = Detect(Variable(r), instr.module, Variable(a))
-                elif type(instr) == Heat:
-                    r = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                    a = inline_var_names(instr.uses[0].name, parameter_map, global_vars)
-                    inline_instr = Heat(Variable(r), Variable(a))
-                elif type(instr) == Dispense:
-                    r = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                    a   = inline_var_names(instr.uses[0].name, parameter_map, global_vars)
-                    inline_instr = Dispense(Variable(r), Variable(a))
-                elif type(instr) == Return:
-                    inline_instr = NOP()
-                elif type(instr) == Call:
-                    if instr.name != func_name and instr.name not in already_called:
-                        instructions = instructions + self.handle_call(program, instr, already_called=already_called|{func_name})
-                        inline_instr = NOP()
-                    else:
-                        #we have entered a recursive area, cannot inline
-                        ret = inline_var_names(instr.defs.name, parameter_map, global_vars)
-                        arguments = map(lambda a: Variable(inline_var_names(a.name, parameter_map, global_vars)), instr.uses)
-                        inline_instr = Call(Variable(ret), instr.function, arguments)
+        # Function -> the number of calls to it.
+        self.sites = Counter()
 
-                instructions.append(inline_instr)
-       
-        self.var_num = self.var_num + 1 
-        return instructions
+    def transform(self, program: Program) -> Program:
+        self.start(program)
+        calls = program.analysis.get('call_graph')
+        if calls is None:
+            calls = CallGraph().analyze(program)['result']
+        threshold = program.config.inline_threshold
+        self.sites = Counter(instruction.name for root in program.functions
+                             for block in program.functions[root]['blocks'].values()
+                             for instruction in block.instructions if self.is_call(instruction))
+        inlined = 0
 
+        for root in calls.bottom_up():
+            # The calls that stay.
+            kept = set()
+            while True:
+                site = self.next_call(root, calls, threshold, kept)
+                if site is None:
+                    break
+                self.inline(root, *site)
+                self.modified.add(root)
+                inlined += 1
 
-    def transform(self, program: Program) -> Program:
+        # The functions that were called, but aren't any more.
+        removed = list()
+        while True:
+            unused = [root for root in program.functions if calls.callers(root) and not self.sites[root]]
+            if not unused:
+                break
+            for root in unused:
+                for nid, block in program.functions[root]['blocks'].items():
+                    for instruction in block.instructions:
+                        if self.is_call(instruction):
+                            self.sites[instruction.name] -= 1
+                    program.cfg.remove_node(nid)
+                    program.calls.pop(nid, None)
+                del program.functions[root]
+                removed.append(root)
+                self.log.debug("Removed {}, as all of its calls were inlined.".format(root))
+
+        program.stats['Calls inlined'] = program.stats.get('Calls inlined', 0) + inlined
+        program.stats['Functions removed by inlining'] = \
+            program.stats.get('Functions removed by inlining', 0) + len(removed)
+        return program
+
+    def is_call(self, instruction) -> bool:
         """
-        This function will do three things:
-        1) Run alpha conversion on non-recursive calls,
-        2) Alter the call graph, and edge connections of the graph,
-        3) Alter the jumps in the basic blocks.
-        :param program: The program requiring modification.
-        :return: The modified program.
+        :param instruction: The instruction.
+        :return: Is it a call to a function of the program?
         """
+        return instruction.op == IRInstruction.CALL and instruction.name in self.program.functions
 
-        for block in program.functions['main']['blocks'].values():
-            #TODO: I assume call is always the last element
-            #may or may not be true...
-            call = block.get_call()
-            if call != None:
-                ret = call.defs.name  
-                func_name = call.name
-                blocks = program.functions[func_name]['blocks']
-                #get rid of last instruction, replace with inline code.
-                block.instructions[-1] = NOP()
-                block.instructions = block.instructions + self.handle_call(program, call)
+    def size(self, root: str) -> int:
+        """
+        :param root: The function.
+        :return: The number of instructions a copy of the function adds.
+        """
+        return sum(1 for block in self.program.functions[root]['blocks'].values()
+                   for instruction in block.instructions if instruction.op not in Inline.free)
 
-        return program
+    def next_call(self, root: str, calls, threshold: int, kept: Set[int]) -> Optional[Tuple[int, object]]:
+        """
+        :param root: The caller.
+        :param calls: The call graph.
+        :param threshold: The most instructions inlining a call may add.
+        :param kept: The calls that aren't inlined; the calls looked at are added to it.
+        :return: The block of the next call to inline, and the call, or None if there are none.
+        """
+        for nid, block in self.program.functions[root]['blocks'].items():
+            for instruction in block.instructions:
+                if not self.is_call(instruction) or instruction.iid in kept:
+                    continue
+                callee = instruction.name
+                cost = self.size(callee)
+                benefit = 1 + len(instruction.uses)
+                if calls.is_recursive(callee) or callee == root:
+                    self.log.debug("Not inlining {} into {}, as it's recursive.".format(callee, root))
+                elif cost - benefit <= threshold or self.sites[callee] == 1:
+                    return nid, instruction
+                else:
+                    self.log.debug("Not inlining {} into {}: it adds {} instructions, and removes {}.".format(
+                        callee, root, cost, benefit))
+                kept.add(instruction.iid)
+        return None
+
+    def inline(self, root: str, nid: int, call):
+        """
+        Replaces a call with a copy of the callee.
+        :param root: The caller.
+        :param nid: The block making the call.
+        :param call: The call.
+        :return: None
+        """
+        blocks = self.program.functions[root]['blocks']
+        graph = self.program.cfg
+        callee = self.program.functions[call.name]
+        source = callee['blocks']
+        callee_cfg = self.program.function_cfg(call.name)
+        order = list(source)
+        self.sites[call.name] -= 1
+        for block in source.values():
+            for instruction in block.instructions:
+                if self.is_call(instruction):
+                    self.sites[instruction.name] += 1
+
+        renamed = self.names(root, call)
+        returns = callee.get('returns', dict())
+        copies = self.copy_blocks(source, root, order, renamed, returns=returns)
+        # The blocks leaving the callee, and what they return.
+        exits = list()
+        for old in order:
+            if callee_cfg.successors(old):
+                continue
+            block = blocks[copies[old]]
+            value = None
+            for at, instruction in enumerate(block.instructions):
+                if instruction.op == IRInstruction.RETURN:
+                    value = instruction.uses[0] if instruction.uses else None
+                    # Nothing runs after a return.
+                    del block.instructions[at:]
+                    break
+            exits.append((copies[old], value))
 
+        # Split the block after the call; the second half is where the copy returns to.
+        block = blocks[nid]
+        at = next(x for x, instruction in enumerate(block.instructions) if instruction is call)
+        after = BasicBlock()
+        after.add(Label("{}_return_{}".format(call.name, after.nid)))
+        after.instructions = block.instructions[at + 1:]
+        after.jumps = block.jumps
+        after.defs = set(block.defs)
+        after.uses = set(block.uses)
+        blocks[after.nid] = after
+        graph.add_node(after.nid, function=root, label=after.label.label)
+        entry = blocks[copies[callee['entry']]]
+        block.instructions = block.instructions[:at]
+        block.jumps = [entry.label]
+        for succ in [succ for succ in graph.successors(nid) if succ in blocks]:
+            self.replace_predecessor(root, succ, nid, after.nid)
+        # With the call gone, control goes on to the block the call returned to.
+        returned = self.program.functions[root].get('returns', dict()).pop(nid, None)
+        if returned is not None:
+            graph.add_edge(after.nid, returned)
+        # The edges between the block and the functions it called go with the calls.
+        called = {instruction.name for instruction in block.instructions + after.instructions + [call]
+                  if self.is_call(instruction)} | self.program.calls.get(nid, set())
+        for other in [self.program.functions[name]['entry'] for name in called if name in self.program.functions]:
+            if other in blocks:
+                continue
+            if other in graph.successors(nid):
+                graph.remove_edge(nid, other)
+            if nid in graph.successors(other):
+                graph.remove_edge(other, nid)
 
+        graph.add_edge(nid, entry.nid)
+        for old in order:
+            for succ in callee_cfg.successors(old):
+                # The copies of the callee's calls are recorded as returning to their copies instead.
+                if returns.get(old) != succ:
+                    graph.add_edge(copies[old], copies[succ])
+        for exit, _ in exits:
+            graph.add_edge(exit, after.nid)
+        for old in order:
+            self.reorder_phis(root, copies[old], [copies[pred] for pred in callee_cfg.predecessors(old)])
+        for changed in [nid, after.nid] + list(copies.values()):
+            self.link_calls(root, changed)
 
+        # What the call defines is what the callee returns.
+        values = [value for _, value in exits]
+        if isinstance(call.defs, dict) and values and None not in values:
+            names = [value['name'] if isinstance(value, dict) else value for value in values]
+            if len(names) == 1:
+                self.rename_uses(root, list(blocks), {call.defs['name']: names[0]})
+            else:
+                phi = Phi(dict(call.defs), names)
+                after.instructions.insert(0, phi)
+                after.phis.add(phi)
 
+        chain = list(copies.values()) + [after.nid]
+        self.place(root, nid, list(), chain)
+        # The block may now be straight line code with the block before it, too.
+        before = [pred for pred in graph.predecessors(nid) if pred in blocks]
+        self.merge_blocks(root, before[:1] + [nid] + chain)
 
+    def names(self, root: str, call) -> Dict[str, str]:
+        """
+        Names the callee's values in the caller.
+        :param root: The caller.
+        :param call: The call.
+        :return: The callee's names -> their names in the caller.
+        """
+        table = self.program.symbol_table
+        callee = call.name
+        renamed = dict()
+        function = table.functions.get(callee)
+        parameters = [arg if isinstance(arg, str) else arg.name for arg in function.args] if function else list()
+        for parameter, argument in zip(parameters, call.uses):
+            symbol = table.get_local(parameter, callee)
+            if symbol is not None:
+                renamed[table.version_name(symbol.sid, 0)] = argument['name'] if isinstance(argument, dict) \
+                    else argument
+
+        # Base sid -> its symbol in the caller.
+        bases = dict()
+        prefix = "{}_{}".format(callee, call.iid)
+        for block in self.program.functions[callee]['blocks'].values():
+            for instruction in block.instructions:
+                operands = list(instruction.uses)
+                if isinstance(instruction.defs, (dict, str)):
+                    operands.append(instruction.defs)
+                for operand in operands:
+                    name = operand['name'] if isinstance(operand, dict) else operand
+                    if not isinstance(name, str) or name in renamed or table.is_global(name):
+                        continue
+                    symbol = table.get_local(name, callee)
+                    if symbol is None:
+                        renamed[name] = "{}_{}".format(prefix, name)
+                        continue
+                    base = symbol.points_to if isinstance(symbol, RenamedSymbol) else symbol
+                    if base.sid not in bases:
+                        local = Symbol("{}_{}".format(prefix, base.name), root, base.types)
+                        local.value = base.value
+                        table.add_local_to_scope(local, root)
+                        bases[base.sid] = table.get_local(local.name, root)
+                    local = bases[base.sid]
+                    if isinstance(symbol, RenamedSymbol):
+                        renamed[name] = self.version(local.sid, symbol.version, root)['name']
+                        self.versions[local.sid] = max(self.versions.get(local.sid, 0), symbol.version)
+                    else:
+                        renamed[name] = local.name
+                        self.symbols_of(root)[local.name] = local
+        return renamed
 
+    def link_calls(self, root: str, nid: int):
+        """
+        Adds the edges between a block and the functions it calls, and records the calls.
+        :param root: The function.
+        :param nid: The block.
+        :return: None
+        """
+        callees = {instruction.name for instruction in self.program.functions[root]['blocks'][nid].instructions
+                   if self.is_call(instruction)}
+        for callee in callees:
+            entry = self.program.functions[callee]['entry']
+            self.program.cfg.add_edge(nid, entry)
+            self.program.cfg.add_edge(entry, nid)
+        if callees:
+            self.program.calls[nid] = callees
+        else:
+            self.program.calls.pop(nid, None)
@@ -0,0 +1,266 @@
+from typing import Dict, List, Optional, Set
+
+from chemicals.chemtypes import ChemTypeResolver
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import Number, Symbol
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.analyses.schedule_length import ScheduleLength
+from compiler.passes.transforms.block_copier import BlockCopier
+
+
+class RepeatLoop(object):
+    """
+    The parts of a loop built from a repeat statement (see IRVisitor.visitRepeat):
+    a header holding only phi nodes and the REPEAT_n > 0 conditional, a single
+    block entering it, a single back edge, and no way out but through the header.
+    """
+
+    def __init__(self, header: int, body: List[int], preheader: int, latch: int, inside: int, exit: int,
+                 count: int, counter: str, decrement):
+        self.header = header
+        # The blocks of the loop other than the header, in reverse post order.
+        self.body = body
+        self.preheader = preheader
+        self.latch = latch
+        # The header's successors in, and out of, the loop.
+        self.inside = inside
+        self.exit = exit
+        # The number of times the loop runs.
+        self.count = count
+        # The (SSA) name of the counter the header checks, and the instruction decrementing it.
+        self.counter = counter
+        self.decrement = decrement
+        # Block -> its successors (those in other functions included) and its predecessors, before any unrolling.
+        self.successors = dict()
+        self.predecessors = dict()
+
+
+class LoopUnroll(BlockCopier):
+    """
+    Unrolls the loops of repeat statements, innermost first, working on the SSA form.
+    A loop whose copies fit the unroll budget is unrolled fully: its body is copied
+    once per iteration, each copy's definitions get new SSA versions, the values the
+    header's phi nodes would merge are passed from one copy to the next, and the
+    header goes away.  Otherwise it is unrolled partially, by the largest factor k
+    that divides the count and fits the budget: the body is copied k times per
+    iteration, and the loop gets a REPEAT_{n/k} counter of its own.
+    The straight line code that's left is then merged into as few blocks as it can.
+    """
+
+    # Calls don't change.
+    preserves = ('call_graph',)
+    # The instructions that don't count against the budget.
+    free = {IRInstruction.LABEL, IRInstruction.NOP, IRInstruction.JUMP}
+
+    def __init__(self):
+        super().__init__("Loop Unroll")
+
+    def transform(self, program: Program) -> Program:
+        self.start(program)
+        budget = program.config.unroll_budget
+        full = partial = 0
+
+        for root in program.functions:
+            skipped = set()
+            while True:
+                loop = self.next_loop(root, skipped)
+                if loop is None:
+                    break
+                size = self.size(root, loop)
+                if loop.count * size <= budget:
+                    self.unroll_fully(root, loop)
+                    full += 1
+                else:
+                    factor = max((k for k in range(2, loop.count) if loop.count % k == 0 and k * size <= budget),
+                                 default=None)
+                    if factor is None:
+                        skipped.add(loop.header)
+                        continue
+                    self.unroll_partially(root, loop, factor)
+                    # The loop stays, so it isn't unrolled again.
+                    skipped.add(loop.header)
+                    partial += 1
+                self.modified.add(root)
+
+        program.stats['Loops fully unrolled'] = program.stats.get('Loops fully unrolled', 0) + full
+        program.stats['Loops partially unrolled'] = program.stats.get('Loops partially unrolled', 0) + partial
+        return program
+
+    def next_loop(self, root: str, skipped: Set[int]) -> Optional[RepeatLoop]:
+        """
+        :param root: The function.
+        :param skipped: The headers of the loops that can't be unrolled (any further).
+        :return: An innermost loop that can be unrolled, or None if there are none.
+        """
+        dominators = Dominators.get(self.program, root)
+        loops = dominators.natural_loops()
+        for header in dominators.order:
+            if header not in loops or header in skipped:
+                continue
+            if any(other != header and other in loops[header] for other in loops):
+                continue
+            loop = self.recognize(root, header, loops[header], dominators.order)
+            if loop is None:
+                skipped.add(header)
+            else:
+                return loop
+        return None
+
+    def recognize(self, root: str, header: int, members: Set[int], order: List[int]) -> Optional[RepeatLoop]:
+        """
+        :param root: The function.
+        :param header: The loop's header.
+        :param members: The blocks of the loop.
+        :param order: The function's blocks, in reverse post order.
+        :return: The parts of the loop, or None if it isn't one repeat builds.
+        """
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        count = ScheduleLength.trip_count(blocks[header])
+        instructions = blocks[header].instructions
+        if count is None or instructions[-1].op != IRInstruction.CONDITIONAL or \
+                any(instruction.op not in {IRInstruction.LABEL, IRInstruction.PHI} for instruction in instructions[:-1]):
+            return None
+        inside = [succ for succ in cfg.successors(header) if succ in members]
+        outside = [succ for succ in cfg.successors(header) if succ not in members]
+        latches = [pred for pred in cfg.predecessors(header) if pred in members]
+        entering = [pred for pred in cfg.predecessors(header) if pred not in members]
+        if len(inside) != 1 or len(outside) != 1 or len(latches) != 1 or len(entering) != 1:
+            return None
+        if any(succ not in members for nid in members if nid != header for succ in cfg.successors(nid)):
+            return None
+
+        counter = instructions[-1].uses[0]['name']
+        phis = {instruction.defs['name']: instruction for instruction in instructions
+                if instruction.op == IRInstruction.PHI}
+        if counter not in phis:
+            return None
+        latch_value = phis[counter].uses[cfg.predecessors(header).index(latches[0])]
+        decrements = [instruction for nid in members for instruction in blocks[nid].instructions
+                      if instruction.op == IRInstruction.MATH and instruction.uses[0]['name'] == counter and
+                      instruction.defs['name'] == latch_value]
+        if len(decrements) != 1:
+            return None
+        body = [nid for nid in order if nid in members and nid != header]
+        loop = RepeatLoop(header, body, entering[0], latches[0], inside[0], outside[0], count, counter, decrements[0])
+        for nid in body:
+            loop.successors[nid] = list(self.program.cfg.successors(nid))
+            loop.predecessors[nid] = list(cfg.predecessors(nid))
+        return loop
+
+    def size(self, root: str, loop: RepeatLoop) -> int:
+        """
+        :return: The number of instructions a copy of the loop's body adds.
+        """
+        blocks = self.program.functions[root]['blocks']
+        return sum(1 for nid in loop.body for instruction in blocks[nid].instructions
+                   if instruction.op not in LoopUnroll.free and instruction is not loop.decrement)
+
+    def unroll_fully(self, root: str, loop: RepeatLoop):
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        header = blocks[loop.header]
+        phis = [instruction for instruction in header.instructions if instruction.op == IRInstruction.PHI]
+        preds = cfg.predecessors(loop.header)
+        entering, latching = preds.index(loop.preheader), preds.index(loop.latch)
+
+        # The value each phi node has at the start of the copy.
+        values = {phi.defs['name']: phi.uses[entering] for phi in phis}
+        previous = loop.preheader
+        chain = list()
+        for _ in range(loop.count):
+            copies, renamed = self.copy_body(root, loop, values, previous, skip=loop.decrement)
+            chain.extend(copies[nid] for nid in loop.body)
+            values = {phi.defs['name']: renamed.get(phi.uses[latching], phi.uses[latching]) for phi in phis}
+            previous = copies[loop.latch]
+
+        # Leave the loop from the last copy; what used the phi nodes uses their final values.
+        if previous == loop.preheader:
+            self.replace_successor(root, loop.preheader, loop.header, loop.exit)
+        self.replace_predecessor(root, loop.exit, loop.header, previous)
+        self.retarget(blocks[previous], header.label, blocks[loop.exit].label)
+        removed = [loop.header] + loop.body
+        self.rename_uses(root, [nid for nid in blocks if nid not in removed], values)
+        self.place(root, loop.header, removed, chain)
+
+        self.merge_blocks(root, [loop.preheader] + chain)
+
+    def unroll_partially(self, root: str, loop: RepeatLoop, factor: int):
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        header = blocks[loop.header]
+        phis = [instruction for instruction in header.instructions if instruction.op == IRInstruction.PHI]
+        preds = list(cfg.predecessors(loop.header))
+        entering, latching = preds.index(loop.preheader), preds.index(loop.latch)
+
+        # The loop now runs count / factor times, which its counter has to say.
+        table = self.program.symbol_table
+        name = "REPEAT_{}".format(loop.count // factor)
+        symbol = table.get_local(name, root)
+        if symbol is None:
+            symbol = Symbol(name, 'global', ChemTypeResolver.numbers())
+            symbol.value = Number(name, 1, loop.count // factor)
+            table.add_local_to_scope(symbol, root)
+        counter = next(phi for phi in phis if phi.defs['name'] == loop.counter)
+        counter.uses[entering] = self.version(symbol.sid, 0, root)['name']
+        counter.defs = self.fresh(counter.defs, root, symbol.sid)
+        condition = header.instructions[-1]
+        condition.uses[0] = dict(condition.uses[0], name=counter.defs['name'], var=counter.defs['var'])
+        condition.left = condition.uses[0]
+        loop.decrement.uses[0] = dict(loop.decrement.uses[0], name=counter.defs['name'], var=counter.defs['var'])
+        loop.decrement.defs = self.fresh(loop.decrement.defs, root, symbol.sid)
+        counter.uses[latching] = loop.decrement.defs['name']
+        # Nothing outside the loop should use the counter, but keep it in SSA form if something does.
+        self.rename_uses(root, [nid for nid in blocks if nid != loop.header and nid not in loop.body],
+                         {loop.counter: counter.defs['name']})
+        loop.counter = counter.defs['name']
+
+        # The original body is the first copy; the others follow it, and the last goes back to the header.
+        values = {phi.defs['name']: phi.uses[latching] for phi in phis}
+        previous = loop.latch
+        chain = list()
+        for _ in range(factor - 1):
+            copies, renamed = self.copy_body(root, loop, values, previous, skip=loop.decrement)
+            chain.extend(copies[nid] for nid in loop.body)
+            values = {phi.defs['name']: renamed.get(phi.uses[latching], phi.uses[latching]) for phi in phis}
+            previous = copies[loop.latch]
+        # The back edge now comes from the last copy, which has the values the phi nodes merge.
+        self.program.cfg.add_edge(previous, loop.header)
+        for phi in phis:
+            phi.uses[latching] = values[phi.defs['name']]
+        self.reorder_phis(root, loop.header, [previous if pred == loop.latch else pred for pred in preds])
+        self.place(root, loop.latch, list(), chain)
+
+        self.merge_blocks(root, loop.body + chain)
+
+    def copy_body(self, root: str, loop: RepeatLoop, values: Dict[str, str], previous: int, skip=None):
+        """
+        Copies the body of a loop, placing the copy after previous.
+        :param root: The function.
+        :param loop: The loop.
+        :param values: The names the header's phi nodes stand for in the copy.
+        :param previous: The block the copy is entered from, in place of the header.
+        :param skip: An instruction that isn't copied; what it defines is what it uses.
+        :return: Old block -> its copy, and old name -> its name in the copy.
+        """
+        blocks = self.program.functions[root]['blocks']
+        graph = self.program.cfg
+        renamed = dict(values)
+        copies = self.copy_blocks(blocks, root, loop.body, renamed, skip,
+                                  self.program.functions[root].get('returns'))
+
+        # The copy's edges match the original's; the header's edge into the loop comes from previous.
+        if loop.header in graph.successors(previous):
+            self.replace_successor(root, previous, loop.header, copies[loop.inside])
+        else:
+            graph.add_edge(previous, copies[loop.inside])
+        self.retarget(blocks[previous], blocks[loop.header].label, blocks[copies[loop.inside]].label)
+        for nid in loop.body:
+            for succ in loop.successors[nid]:
+                if succ != loop.header:
+                    graph.add_edge(copies[nid], copies.get(succ, succ))
+        # Phi operands follow the predecessors, which may have been added in another order.
+        for nid in loop.body:
+            self.reorder_phis(root, copies[nid], [copies.get(pred, previous) for pred in loop.predecessors[nid]])
+        return copies, renamed
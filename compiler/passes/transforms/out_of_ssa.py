@@ -0,0 +1,236 @@
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from compiler.data_structures.ir import Copy, InstructionSet, IRInstruction
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import RenamedSymbol
+from compiler.passes.analyses.liveness import Liveness
+from compiler.passes.transforms.bs_transform import BSTransform
+
+
+class OutOfSSA(BSTransform):
+    """
+    Takes a program out of SSA form, for the targets that emit code.
+    Phi nodes are lowered to parallel copies at the end of their
+    predecessors (SplitEdges must have run first), the parallel copies
+    are sequentialized, and then every copy whose source and destination
+    don't interfere is coalesced away.  What's left are the copies
+    that are really needed, each of which is a droplet transfer.
+    """
+
+    # Only instructions change; the control flow graph doesn't.
+    preserves = ('call_graph', 'dominators')
+
+    def __init__(self):
+        super().__init__("Out of SSA")
+        self.program = None
+        # Version name -> (base sid, version), in the function we are in.
+        self.versions = dict()
+
+    def transform(self, program: Program) -> Program:
+        self.program = program
+        inserted = 0
+        coalesced = 0
+        self.modified = {root for root in program.functions
+                         if any(block.phis for block in program.functions[root]['blocks'].values())}
+        for root in program.functions:
+            # Locals of different functions can have versions of the same name.
+            self.versions = program.symbol_table.scope_versions(root)
+            copies = self.lower_phis(root)
+            inserted += len(copies)
+            coalesced += self.coalesce(root, copies)
+            self.update_block_def_use(root)
+        program.stats['Out of SSA copies inserted'] = inserted
+        program.stats['Out of SSA copies coalesced'] = coalesced
+        program.ssa_form = False
+        return program
+
+    def operand(self, name: str, root: str) -> Dict:
+        """
+        Builds an operand for an SSA name used by a phi node.
+        :param name: The version name.
+        :param root: The function we are in.
+        :return: The operand.
+        """
+        table = self.program.symbol_table
+        base, version = self.versions[name]
+        var = table.get_version(base, version)
+        if var is None:
+            var = table.add_version(RenamedSymbol(name, table.get_symbol_by_id(base), version), root)
+        size = var.value.size if var.value is not None and hasattr(var.value, 'size') else 1
+        return {'name': name, 'offset': -1, 'size': size, 'var': var}
+
+    def temporary(self, name: str, root: str) -> Dict:
+        """
+        Builds an operand for a new version of the variable behind name,
+        used to break a cycle of copies.
+        :param name: The version name.
+        :param root: The function we are in.
+        :return: The operand.
+        """
+        table = self.program.symbol_table
+        base, _ = self.versions[name]
+        version = 1 + max(v for (b, v) in table.versions if b == base)
+        temp = table.version_name(base, version)
+        self.versions[temp] = (base, version)
+        table.add_version(RenamedSymbol(temp, table.get_symbol_by_id(base), version), root)
+        return self.operand(temp, root)
+
+    def lower_phis(self, root: str) -> List[Copy]:
+        """
+        Replaces each block's phi nodes with a parallel copy
+        in each of its predecessors.
+        :param root: The function we are looking at.
+        :return: The copies that were inserted.
+        """
+        blocks = self.program.functions[root]['blocks']
+        copies = list()
+        for nid, block in blocks.items():
+            if not block.phis:
+                continue
+            phis = [instruction for instruction in block.instructions if instruction.op == IRInstruction.PHI]
+            preds = [pred for pred in self.program.cfg.predecessors(nid) if pred in blocks]
+            for slot, pred in enumerate(preds):
+                parallel = list()
+                for phi in phis:
+                    use = phi.uses[slot]
+                    # Operands that were never renamed come from unreachable blocks.
+                    if use == phi.defs['name'] or use not in self.versions:
+                        continue
+                    parallel.append((phi.defs['name'], use))
+                sequential = self.sequentialize(parallel, root)
+                instructions = blocks[pred].instructions
+                # Copies go before the block's terminator.
+                at = len(instructions)
+                while at > 0 and instructions[at - 1].op in {IRInstruction.CONDITIONAL, IRInstruction.RETURN,
+                                                            IRInstruction.NOP}:
+                    at -= 1
+                instructions[at:at] = sequential
+                copies.extend(sequential)
+            block.instructions = [instruction for instruction in block.instructions
+                                  if instruction.op != IRInstruction.PHI]
+            block.phis = set()
+        return copies
+
+    def sequentialize(self, parallel: List[Tuple[str, str]], root: str) -> List[Copy]:
+        """
+        Orders a parallel copy so no copy overwrites a value
+        another one still needs; cycles are broken with a temporary.
+        :param parallel: The (destination, source) pairs.
+        :param root: The function we are in.
+        :return: The copies, in order.
+        """
+        pending = list(parallel)
+        sequential = list()
+        while pending:
+            sources = {source for _, source in pending}
+            ready = [(destination, source) for destination, source in pending if destination not in sources]
+            if ready:
+                destination, source = ready[0]
+                pending.remove((destination, source))
+                sequential.append(Copy(self.operand(destination, root), self.operand(source, root)))
+                continue
+            # Everything left is on a cycle: save one destination's value first.
+            destination = pending[0][0]
+            temp = self.temporary(destination, root)
+            sequential.append(Copy(temp, self.operand(destination, root)))
+            pending = [(d, temp['name'] if s == destination else s) for d, s in pending]
+        return sequential
+
+    @staticmethod
+    def defines(instruction) -> bool:
+        # Heat and dispose don't define a new value.
+        return instruction.defs is not None and \
+            (instruction.op in InstructionSet.assignment or instruction.op in InstructionSet.numeric_assignment)
+
+    def coalesce(self, root: str, copies: List[Copy]) -> int:
+        """
+        Gives the source and destination of each copy the same name
+        wherever they don't interfere, and removes the copies that
+        became self copies.
+        :param root: The function we are looking at.
+        :param copies: The copies to try to remove.
+        :return: The number of copies removed.
+        """
+        table = self.program.symbol_table
+        blocks = self.program.functions[root]['blocks']
+        liveness = Liveness.compute(self.program, root)
+
+        # Two names interfere if one is defined while the other is live;
+        # a copy's destination doesn't interfere with its source.
+        interference = defaultdict(set)
+        for nid, block in blocks.items():
+            live = liveness.live_out_names(nid)
+            for instruction in reversed(block.instructions):
+                if self.defines(instruction):
+                    deff = instruction.defs['name']
+                    live.discard(deff)
+                    for other in live:
+                        if instruction.op == IRInstruction.COPY and other == instruction.uses[0]['name']:
+                            continue
+                        interference[deff].add(other)
+                        interference[other].add(deff)
+                for use in instruction.uses:
+                    if not table.is_global(use['name']):
+                        live.add(use['name'])
+
+        # Union-find over the names, with each class's members and neighbours.
+        parent = dict()
+        members = dict()
+        neighbours = dict()
+
+        def find(name: str) -> str:
+            if name not in parent:
+                parent[name] = name
+                members[name] = {name}
+                neighbours[name] = set(interference[name])
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for copy in copies:
+            destination = find(copy.defs['name'])
+            source = find(copy.uses[0]['name'])
+            if destination == source or members[source] & neighbours[destination]:
+                continue
+            parent[source] = destination
+            members[destination] |= members.pop(source)
+            neighbours[destination] |= neighbours.pop(source)
+
+        # Each class is named after its oldest version.
+        rename = dict()
+        for name in parent:
+            group = find(name)
+            if len(members[group]) > 1:
+                rename[name] = min(members[group], key=lambda member: self.versions[member])
+        if rename:
+            operands = {name: self.operand(name, root) for name in set(rename.values())}
+            for block in blocks.values():
+                for instruction in block.instructions:
+                    for operand in list(instruction.uses) + [instruction.defs]:
+                        if isinstance(operand, dict) and operand['name'] in rename:
+                            new = operands[rename[operand['name']]]
+                            operand['name'] = new['name']
+                            operand['var'] = new['var']
+
+        removed = 0
+        for block in blocks.values():
+            kept = list()
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.COPY and instruction.defs['name'] == instruction.uses[0]['name']:
+                    removed += 1
+                else:
+                    kept.append(instruction)
+            block.instructions = kept
+        return removed
+
+    def update_block_def_use(self, root: str):
+        for block in self.program.functions[root]['blocks'].values():
+            block.defs = set()
+            block.uses = set()
+            for instruction in block.instructions:
+                for use in instruction.uses:
+                    block.uses.add(use['name'])
+                if self.defines(instruction):
+                    block.defs.add(instruction.defs['name'])
@@ -3,6 +3,8 @@ from compiler.passes.transforms.bs_transform import BSTransform
 
 
 class SIMDExpansion(BSTransform):
+    # Only instructions change; the control flow graph doesn't.
+    preserves = ('call_graph', 'dominators')
 
     def __init__(self):
         super().__init__("SIMD Expansion")
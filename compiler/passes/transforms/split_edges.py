@@ -1,11 +1,80 @@
+from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import IRInstruction, Jump, Label
 from compiler.data_structures.program import Program
 from compiler.passes.transforms.bs_transform import BSTransform
 
 
 class SplitEdges(BSTransform):
+    """
+    Splits the critical edges, i.e. the edges from a block with many
+    successors to a block with many predecessors, that lead into blocks
+    with phi nodes.  This gives every phi operand a block of its own,
+    where the copy that replaces it can be placed when leaving SSA form.
+    """
+
+    # Calls don't change.
+    preserves = ('call_graph',)
 
     def __init__(self):
         super().__init__("Split Edges")
 
     def transform(self, program: Program) -> Program:
+        split = 0
+        self.modified = set()
+        for root in program.functions:
+            blocks = program.functions[root]['blocks']
+            for nid in list(blocks):
+                if not blocks[nid].phis:
+                    continue
+                for pred in [pred for pred in program.cfg.predecessors(nid) if pred in blocks]:
+                    # Edges into other functions (calls) don't count.
+                    if sum(1 for succ in program.cfg.successors(pred) if succ in blocks) > 1:
+                        self.split_edge(program, root, pred, nid)
+                        self.modified.add(root)
+                        split += 1
+        program.stats['Critical edges split'] = program.stats.get('Critical edges split', 0) + split
         return program
+
+    @staticmethod
+    def split_edge(program: Program, root: str, source: int, destination: int) -> BasicBlock:
+        """
+        Places a new block on the edge from source to destination.
+        :param program: The program.
+        :param root: The function the edge is in.
+        :param source: The block the edge leaves.
+        :param destination: The block the edge enters.
+        :return: The new block.
+        """
+        blocks = program.functions[root]['blocks']
+        cfg = program.cfg
+        target = blocks[destination]
+        # Keep the kind of the construct the edge belongs to, e.g. bsbbif.
+        prefix = target.label.label.split('_')[0] if target.label.label.startswith('bsbb') else 'bsbbif'
+        block = BasicBlock()
+        block.add(Label(f"{prefix}_{block.nid}_e"))
+        block.add(Jump(target.label))
+        blocks[block.nid] = block
+
+        # The phi operand of the edge moves to the new block; phi
+        # operands line up with the predecessors inside the function.
+        old_preds = [pred for pred in cfg.predecessors(destination) if pred in blocks]
+        cfg.add_node(block.nid, function=root, label=block.label.label)
+        cfg.remove_edge(source, destination)
+        cfg.add_edge(source, block.nid)
+        cfg.add_edge(block.nid, destination)
+        new_preds = [pred for pred in cfg.predecessors(destination) if pred in blocks]
+        for phi in target.phis:
+            operands = dict(zip(old_preds, phi.uses))
+            operands[block.nid] = operands.pop(source)
+            phi.uses[:] = [operands[pred] for pred in new_preds]
+
+        # Retarget the branches of the source.
+        for instruction in blocks[source].instructions:
+            if instruction.op == IRInstruction.CONDITIONAL:
+                if instruction.true_branch is not None and instruction.true_branch.label == target.label.label:
+                    instruction.true_branch = block.label
+                if instruction.false_branch is not None and instruction.false_branch.label == target.label.label:
+                    instruction.false_branch = block.label
+        blocks[source].jumps = [block.label if jump is not None and jump.label == target.label.label else jump
+                                for jump in blocks[source].jumps]
+        return block
@@ -1,14 +1,14 @@
 import copy
-from collections import defaultdict
-
-import networkx as nx
+from collections import defaultdict, deque
 
 from compiler.data_structures.basic_block import BasicBlock
 # from compiler.data_structures.ir import IRInstruction
 from compiler.data_structures.ir import *
 from compiler.data_structures.ir import Phi
 from compiler.data_structures.program import Program
-from compiler.data_structures.variable import RenamedSymbol
+from compiler.data_structures.variable import RenamedSymbol, Symbol
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.analyses.liveness import Liveness
 from .bs_transform import BSTransform
 
 
@@ -22,8 +22,18 @@ class SSA(BSTransform):
         self.dominator_tree = dict()
         # The immediate dominators for each function.
         self.idoms = dict()
+        # The liveness of the (un-renamed) variables, for each function.
+        self.live_in = dict()
         # Bookkeeping for the variable renaming algorithm.
         self.bookkeeper = dict()
+        # Name -> sid of the renamed (non-global) variables of the function
+        # being renamed, for the operands that don't carry their symbol.
+        self.sids = dict()
+        # The sids of the function's renamed variables.
+        self.renamed = set()
+        # How many versioned symbols were created, and how many operands reused one.
+        self.versions_created = 0
+        self.versions_reused = 0
         self.program = None
 
     def transform(self, program: Program) -> Program:
@@ -31,19 +41,20 @@ class SSA(BSTransform):
         self.log.debug(f"Beginning SSA conversion for: {self.program.name}")
         for root in self.program.functions:
             self.build_dominators(root)
+            self.compute_liveness(root)
             # self.log.debug("Inserting phi nodes.")
             self.insert_phi_functions(root)
             # self.log.debug("Done inserting phi nodes.")
             # self.log.debug("Renaming variables.")
             self.rename_variables(root)
-
             # self.log.debug("Done renaming variables.")
-            # self.log.debug("Removing direct copy phi nodes.")
+            # self.log.debug("Removing trivial phi nodes.")
+            self.remove_trivial_phis(root)
+            self.remove_empty_blocks(root)
+            # self.log.debug("Done removing trivial phi nodes.")
             self.update_block_def_use(root)
-            # self.log.debug("Done renaming variables.")
-            # self.log.debug("Removing direct copy phi nodes.")
-            self.remove_copies(root)
-            # self.log.debug("Done removing blind copies.")
+        self.program.stats['SSA versions created'] = self.versions_created
+        self.program.stats['SSA versions reused'] = self.versions_reused
         self.log.debug(f"Done converting {self.program.name} to SSA form.")
         return self.program
 
@@ -55,15 +66,21 @@ class SSA(BSTransform):
         :param root: Name of function to build for.
         :return: None
         """
-        self.frontier[root] = nx.dominance_frontiers(self.program.bb_graph, self.program.functions[root]['entry'])
-        self.idoms[root] = nx.immediate_dominators(self.program.bb_graph, self.program.functions[root]['entry'])
-        self.dominator_tree[root] = defaultdict(lambda: set())
+        info = Dominators.get(self.program, root)
+        self.frontier[root] = info.frontier
+        self.idoms[root] = info.idoms
+        self.dominator_tree[root] = info.tree
 
-        for key, value in self.idoms[root].items():
-            # Ensure a self dominated node isn't added
-            # This guarantees no infinite iteration
-            if key != value:
-                self.dominator_tree[root][value].add(key)
+    def compute_liveness(self, root: str):
+        """
+        Block level liveness of the (not yet renamed) local variables.
+        A phi node is only inserted where its variable is live-in,
+        which gives pruned SSA.
+        :param root: The function we are looking at.
+        :return: None
+        """
+        # The instructions are about to change, so this isn't cached.
+        self.live_in[root] = Liveness.compute(self.program, root)
 
     def insert_phi_functions(self, root: str):
         """
@@ -74,9 +91,11 @@ class SSA(BSTransform):
         :return: None.
         """
         blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
         # Maps variable to the blocks that define it.
         # This is Appel's A_{orig}[n]
         def_sites = defaultdict(lambda: set())
+        pruned = 0
 
         for nid, block in blocks.items():
             for deff in block.defs:
@@ -92,71 +111,113 @@ class SSA(BSTransform):
                 # This is Appel's n
                 nid = work_list.pop()
                 # This is Appel's y \in DF[n]
-                for dominator in self.frontier[root][nid]:
+                # Blocks unreachable from the entry have no frontier.
+                for dominator in self.frontier[root].get(nid, ()):
                     # This is Appel's a \notin A_{phi}[y]
                     if dominator not in needs_phi:
-                        phi = Phi(var, [var for x in range(len(self.program.bb_graph.in_edges(dominator)))])
-                        self.program.functions[root]['blocks'][dominator].phis.add(phi)
-                        self.program.functions[root]['blocks'][dominator].instructions.insert(0, phi)
                         needs_phi.add(dominator)
+                        # A variable that is dead at y doesn't need a phi,
+                        # but y still counts towards the iterated frontier.
+                        if self.live_in[root].is_live_in(dominator, var):
+                            phi = Phi(var, [var for x in range(cfg.in_degree(dominator))])
+                            self.program.functions[root]['blocks'][dominator].phis.add(phi)
+                            self.program.functions[root]['blocks'][dominator].instructions.insert(0, phi)
+                        else:
+                            pruned += 1
                     if dominator not in seen_block:
                         work_list.add(dominator)
                         seen_block.add(dominator)
+        self.program.stats['SSA phi nodes pruned'] = self.program.stats.get('SSA phi nodes pruned', 0) + pruned
 
     def rename_variables(self, root: str):
         """
-        This is the initial set-up and invocation for the recursive
-        renaming function call.  It initializes the bookkeeping,
-        and then begins renaming variables.
+        This is the initial set-up and invocation for the
+        renaming traversal.  It initializes the bookkeeping,
+        caches each block's phi nodes and the phi operand slot
+        of every edge, and then walks the dominator tree with
+        an explicit stack, so deep nesting can't exhaust the
+        interpreter's recursion limit.
         :param root: The name of the function call to begin the renaming process.
         :return: None
         """
-        for variable in self.program.symbol_table.scope_map[root].locals:
-            self.bookkeeper[variable] = {'count': 0, 'stack': [0], 'renamed': defaultdict(lambda: 0)}
+        table = self.program.symbol_table
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.function_cfg(root)
+        self.sids = dict()
+        for name, variable in table.scope_map[root].locals.items():
+            if table.is_global(name):
+                continue
+            self.sids[name] = variable.sid
+            self.bookkeeper[variable.sid] = {'count': 0, 'stack': [0]}
+        self.renamed = set(self.sids.values())
         # for variable in self.program.symbol_table.globals:
         #     self.bookkeeper[variable] = {'count': 0, 'stack': [0]}
-        self.rename(self.program.functions[root]['blocks'][self.program.functions[root]['entry']], root)
 
-    def rename(self, block: BasicBlock, root: str):
+        # Block -> [(phi, the sid of the variable it merges)].
+        # The phi defs aren't renamed yet, so the names are still the originals.
+        phis = dict()
+        for nid, block in blocks.items():
+            phis[nid] = [(instruction, self.sids[instruction.defs])
+                         for instruction in block.instructions if instruction.op == IRInstruction.PHI]
+        # Block -> [(successor, the phi operand this block fills)].
+        # Phi operand i corresponds to predecessor i of the block.
+        slots = {nid: [(successor, cfg.predecessors(successor).index(nid))
+                       for successor in cfg.successors(nid) if phis.get(successor)]
+                 for nid in cfg}
+
+        # The stack holds (block id, the sids it pushed); the sids are
+        # None until the block is renamed, and set while its children are.
+        stack = [(self.program.functions[root]['entry'], None)]
+        while stack:
+            nid, pushed = stack.pop()
+            if pushed is not None:
+                for sid in pushed:
+                    self.bookkeeper[sid]['stack'].pop()
+                continue
+            pushed = self.rename(blocks[nid], root)
+            for successor, slot in slots[nid]:
+                for instruction, sid in phis[successor]:
+                    # i = stack[deff].peek()
+                    # replace use[i] with use[i]_i
+                    instruction.uses[slot] = table.version_name(sid, self.bookkeeper[sid]['stack'][-1])
+            stack.append((nid, pushed))
+            # Children are pushed in reverse, so they're renamed in order.
+            for child in reversed(self.dominator_tree[root][nid]):
+                stack.append((child, None))
+
+    def rename(self, block: BasicBlock, root: str) -> list:
         """
-        This variable renaming algorithm is taken from Appel's Tiger book.
+        This renames the definitions and uses of a single block,
+        following the variable renaming algorithm from Appel's Tiger book.
         :param block: block that needs renaming.
         :param root: function name we are in.
-        :return: None
+        :return: The sids whose version stacks were pushed, in order.
         """
+        pushed = list()
         # For each phi function and x = y op z.
         for instruction in block.instructions:
             if instruction.op != IRInstruction.PHI:
                 for x, use in enumerate(instruction.uses):
-                    if self.program.symbol_table.is_global(use['name']):
+                    sid = self.operand_sid(use)
+                    # Globals aren't renamed.
+                    if sid < 0:
                         continue
-                    renamed = {'name': use['name'] + str(self.bookkeeper[use['name']]['stack'][-1]),
-                               'offset': use['offset'], 'size': use['size'], 'var': None}
-                    renamed_var = RenamedSymbol(renamed['name'],
-                                                self.program.symbol_table.get_symbol(use['name'], root))
-                    self.program.symbol_table.add_local_to_scope(renamed_var, root)
-                    renamed['var'] = renamed_var
-                    instruction.uses[x] = renamed
-                    pass
+                    instruction.uses[x] = self.rename_operand(use, sid, self.bookkeeper[sid]['stack'][-1], root)
             if instruction.op in InstructionSet.assignment or instruction.op in InstructionSet.numeric_assignment:
                 if instruction.op == IRInstruction.PHI:
                     old = {'name': instruction.defs, 'offset': -1, 'size': -1, 'var': None}
                 else:
                     old = instruction.defs
+                sid = self.operand_sid(old)
 
                 # count[deff] = count[deff] + 1
                 # i = count[deff]
                 # stack[deff].push(i)
-                self.bookkeeper[old['name']]['count'] += 1
-                self.bookkeeper[old['name']]['stack'].append(self.bookkeeper[old['name']]['count'])
-
-                renamed = {'name': old['name'] + str(self.bookkeeper[old['name']]['stack'][-1]),
-                           'offset': old['offset'], 'size': old['size'], 'var': None}
-                renamed_var = RenamedSymbol(renamed['name'], self.program.symbol_table.get_symbol(old['name'], root))
-                self.program.symbol_table.add_local_to_scope(renamed_var, root)
+                self.bookkeeper[sid]['count'] += 1
+                self.bookkeeper[sid]['stack'].append(self.bookkeeper[sid]['count'])
+                pushed.append(sid)
                 # replace deff with deff_i in instruction
-                renamed['var'] = renamed_var
-                instruction.defs = renamed
+                instruction.defs = self.rename_operand(old, sid, self.bookkeeper[sid]['stack'][-1], root)
             if instruction.op in {IRInstruction.HEAT, IRInstruction.DISPOSE}:
                 '''
                 This exists because a heat and dispose don't create new definitions.
@@ -165,36 +226,40 @@ class SSA(BSTransform):
                 Because of this fact, we set the def to the renamed use. 
                 '''
                 instruction.defs = instruction.uses[0]
-        for j, successor in enumerate(self.program.bb_graph.out_edges(block.nid)):
-            '''
-            This successor is a successor -- or an outgoing edge within the CFG. 
-            '''
-            succ_block = self.program.functions[root]['blocks'][successor[1]]
-            # We only care about the PHI nodes of this block
-            for instruction in list(filter(lambda instr: instr.op == IRInstruction.PHI, succ_block.instructions)):
-                if isinstance(instruction.defs, dict):
-                    original_var = instruction.defs['var'].points_to.name
-                else:
-                    original_var = instruction.defs
-                use_count = len(instruction.uses)
-                # i = stack[deff].peek()
-                # replace use[i] with use[i]_i
-                # If the variable has been replaced already,
-                # we don't need to look at this phi node.
-                if self.bookkeeper[original_var]['renamed'][instruction.iid] < use_count:
-                    next_id = self.bookkeeper[original_var]['renamed'][instruction.iid]
-                    instruction.uses[next_id] = f"{original_var}{self.bookkeeper[original_var]['stack'][-1]}"
-                    self.bookkeeper[original_var]['renamed'][instruction.iid] += 1
-        for successor in self.dominator_tree[root][block.nid]:
-            '''
-            This is a child -- or an outgoing edge within the dominator tree.
-            '''
-            self.rename(self.program.functions[root]['blocks'][successor], root)
-        for instruction in block.instructions:
-            if instruction.defs and instruction.op not in {IRInstruction.HEAT, IRInstruction.DISPOSE}:
-                # We must use the old points to name
-                # because we've lost it at this point.
-                self.bookkeeper[instruction.defs['var'].points_to.name]['stack'].pop()
+        return pushed
+
+    def operand_sid(self, operand: dict) -> int:
+        """
+        The interned id of an operand's variable.  Most operands carry
+        their symbol; the rest (e.g.: those that carry the variable's
+        value) are resolved through the function's name -> sid map.
+        :param operand: The un-renamed operand.
+        :return: The sid, -1 if the operand isn't a renamed variable.
+        """
+        var = operand.get('var')
+        if isinstance(var, Symbol) and var.sid in self.renamed:
+            return var.sid
+        return self.sids.get(operand['name'], -1)
+
+    def rename_operand(self, operand: dict, sid: int, version: int, root: str) -> dict:
+        """
+        Builds the SSA version of an operand.
+        :param operand: The un-renamed operand.
+        :param sid: The interned id of the operand's symbol.
+        :param version: The SSA version to rename to.
+        :param root: The function (scope) we are in.
+        :return: The renamed operand.
+        """
+        table = self.program.symbol_table
+        name = table.version_name(sid, version)
+        # Each version is created once and shared by all of its operands.
+        var = table.get_version(sid, version)
+        if var is None:
+            var = table.add_version(RenamedSymbol(name, table.get_symbol_by_id(sid), version), root)
+            self.versions_created += 1
+        else:
+            self.versions_reused += 1
+        return {'name': name, 'offset': operand['offset'], 'size': operand['size'], 'var': var}
 
     def update_block_def_use(self, root: str):
         for nid, block in self.program.functions[root]['blocks'].items():
@@ -210,31 +275,117 @@ class SSA(BSTransform):
                 if instruction.defs:
                     block.defs.add(instruction.defs['name'])
 
+    def remove_trivial_phis(self, root: str):
+        """
+        A phi node is trivial if it merges a single value, other
+        than itself, e.g.: a3 = phi(a1, a1) or a3 = phi(a1, a3).
+        Operands that were never renamed come from blocks the entry
+        can't reach, so they don't count as values.  Each trivial phi
+        is removed and its uses are replaced with the value it merges,
+        which can, in turn, make the phi nodes that used it trivial.
+        :param root: The function we are looking at.
+        :return: None
+        """
+        table = self.program.symbol_table
+        blocks = self.program.functions[root]['blocks']
+        # Version name -> (base sid, version), in this function.
+        versions = table.scope_versions(root)
+        # Version name -> the instructions that use it.
+        users = defaultdict(list)
+        # Phi iid -> the block it lives in.
+        where = dict()
+        work_list = deque()
+        for nid, block in blocks.items():
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    where[instruction.iid] = nid
+                    work_list.append(instruction)
+                    for use in instruction.uses:
+                        users[use].append(instruction)
+                else:
+                    for use in instruction.uses:
+                        users[use['name']].append(instruction)
 
-    def remove_copies(self, root: str):
-        # TODO [review]: I'm unconvinced that this does what you think it does, with the current implementation.
-        #  It seems either checking for ...uses[0] == ...uses[1] may be the correct check, but there are more issues.
-        #  In any case, it may be easier to simply _not insert a PHI node_ if it is a simple copy operation,
-        #   rather than trying to remove it later.  This requires not only the removal of the node,
-        #   but should also, in the case where the PHI node is the _only_ instruction in the block,
-        #   remove the block from the graph, connecting preds with succs.
-        for nid, block in self.program.functions[root]['blocks'].items():
-            if block.phis:
-                x = 0
-                while x < len(block.phis):
-                    if block.instructions[x].op == IRInstruction.PHI:
-                        if len(block.instructions[x].uses) == 2:
-                            if block.instructions[x].uses[0] == block.instructions[x].uses[1]:
-                            # for use in block.instructions[x].uses:
-                            #     if use[-1] == '0':
-                                phi = block.instructions[x]
-                                block.instructions.pop(x)
-                                block.phis.remove(phi)
-                                # We subtract one because popping reduces
-                                # the size of the array.  This prevents the
-                                # case where you pop an instruction and try
-                                # to reference an index out of bounds.
-                                x -= 1
-                    else:
-                        break
-                    x += 1
+        removed = set()
+        while work_list:
+            phi = work_list.popleft()
+            if phi.iid in removed:
+                continue
+            name = phi.defs['name']
+            original = phi.defs['var'].points_to.name
+            values = {use for use in phi.uses if use != name and use != original}
+            if len(values) != 1:
+                continue
+            value = values.pop()
+            base, version = versions[value]
+
+            block = blocks[where[phi.iid]]
+            block.instructions.remove(phi)
+            block.phis.discard(phi)
+            removed.add(phi.iid)
+
+            for user in users.pop(name, []):
+                if user.op == IRInstruction.PHI:
+                    if user.iid not in removed:
+                        user.uses[:] = [value if use == name else use for use in user.uses]
+                        work_list.append(user)
+                    continue
+                for x, use in enumerate(user.uses):
+                    if use['name'] == name:
+                        renamed = self.rename_operand(use, base, version, root)
+                        # Heat and dispose define the very operand they use.
+                        if user.defs is use:
+                            user.defs = renamed
+                        user.uses[x] = renamed
+                users[value].append(user)
+        self.program.stats['SSA trivial phi nodes removed'] = \
+            self.program.stats.get('SSA trivial phi nodes removed', 0) + len(removed)
+
+    def remove_empty_blocks(self, root: str):
+        """
+        Removes the blocks that are left empty (e.g. blocks that only held
+        trivial phi nodes), connecting their predecessors to their successor.
+        Only blocks entered by unconditional edges are removed, so no
+        conditional needs its branches retargeted; the predecessors' jumps
+        and the successor's phi operands are updated.
+        :param root: The function we are looking at.
+        :return: None
+        """
+        blocks = self.program.functions[root]['blocks']
+        cfg = self.program.cfg
+        removed = 0
+        for nid in list(blocks):
+            block = blocks[nid]
+            if nid == self.program.functions[root]['entry'] or block.instructions or cfg.out_degree(nid) != 1:
+                continue
+            successor = cfg.successors(nid)[0]
+            preds = list(cfg.predecessors(nid))
+            if not preds or successor == nid or successor not in blocks:
+                continue
+            if any(pred not in blocks or cfg.out_degree(pred) != 1 or
+                   any(instruction.op == IRInstruction.CONDITIONAL for instruction in blocks[pred].instructions)
+                   for pred in preds):
+                continue
+            succ_block = blocks[successor]
+            # Phi operands line up with the predecessors inside the function.
+            old_preds = [pred for pred in cfg.predecessors(successor) if pred in blocks]
+            # Distinct predecessors must keep distinct phi operands.
+            if succ_block.phis and any(pred in old_preds for pred in preds):
+                continue
+
+            for pred in preds:
+                blocks[pred].jumps = [succ_block.label if block.label is not None and jump is not None and
+                                      jump.label == block.label.label else jump for jump in blocks[pred].jumps]
+                cfg.add_edge(pred, successor)
+            cfg.remove_node(nid)
+            del blocks[nid]
+            removed += 1
+
+            new_preds = [pred for pred in cfg.predecessors(successor) if pred in blocks]
+            for phi in succ_block.phis:
+                operands = dict(zip(old_preds, phi.uses))
+                for pred in preds:
+                    operands[pred] = operands[nid]
+                phi.uses[:] = [operands[pred] for pred in new_preds]
+        self.program.stats['SSA empty blocks removed'] = \
+            self.program.stats.get('SSA empty blocks removed', 0) + removed
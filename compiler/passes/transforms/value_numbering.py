@@ -0,0 +1,282 @@
+from typing import Dict, List, Optional, Tuple
+
+from compiler.data_structures.ir import BinaryOps, Dispense, IRInstruction
+from compiler.data_structures.program import Program
+from compiler.data_structures.variable import Movable, RenamedSymbol, Symbol
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.transforms.block_copier import BlockCopier
+
+
+class ValueNumbering(BlockCopier):
+    """
+    Global value numbering over the SSA form, for numbers: a constant, math or phi node computing
+    a value a dominating instruction already computed is removed, and its uses use the earlier name.
+    The blocks are walked in preorder over the dominator tree, with a table of the expressions computed
+    by the blocks dominating the one being looked at; a constant is numbered by its value, so it's the same
+    as the global constant of that value, and addition and multiplication by their operands in any order.
+    Droplets can't be used twice, so they're never numbered.  Instead, in the dispense coalescing mode,
+    the single droplet dispenses of the same reagent and volume in a block become one dispense of an array,
+    and what used each droplet uses its lane; droplets passed to a phi node, a call or a return are left alone.
+    The array is dispensed where the last of its droplets was, so no droplet is dispensed earlier than it was;
+    a droplet used before a later one is dispensed starts a new array, so that its use still follows its dispense.
+    """
+
+    # Calls don't change.
+    preserves = ('call_graph',)
+    commutative = {BinaryOps.ADD, BinaryOps.MULTIPLE}
+    # The instructions that can't use a lane of an array in place of a droplet.
+    whole = {IRInstruction.PHI, IRInstruction.CALL, IRInstruction.RETURN, IRInstruction.COPY}
+
+    def __init__(self):
+        super().__init__("Value Numbering")
+        # Name -> the value of the constant it is.
+        self.constants = dict()
+
+    def transform(self, program: Program) -> Program:
+        self.start(program)
+        redundant = coalesced = 0
+        for root in program.functions:
+            removed = self.number(root)
+            merged = self.coalesce(root) if program.config.coalesce_dispenses else 0
+            if removed or merged:
+                self.modified.add(root)
+            redundant += removed
+            coalesced += merged
+        program.stats['Redundant values removed'] = program.stats.get('Redundant values removed', 0) + redundant
+        program.stats['Dispenses coalesced'] = program.stats.get('Dispenses coalesced', 0) + coalesced
+        return program
+
+    @staticmethod
+    def name_of(operand) -> str:
+        return operand if isinstance(operand, str) else operand['name']
+
+    def constant(self, name: str):
+        """
+        :param name: A (leading) name.
+        :return: The value of the constant it is, or None.
+        """
+        if name in self.constants:
+            return self.constants[name]
+        if name.startswith('CONST_') and self.program.symbol_table.is_global(name):
+            return self.scalar(getattr(self.program.symbol_table.get_global(name).value, 'value', None))
+        return None
+
+    @staticmethod
+    def scalar(value):
+        """
+        :param value: The value of a number: index -> value (or a list, or a value).
+        :return: The value, if it's a single, known one; otherwise None.
+        """
+        values = list(value.values()) if isinstance(value, dict) else value if isinstance(value, list) else [value]
+        if len(values) != 1 or not isinstance(values[0], (int, float)) or values[0] != values[0]:
+            return None
+        return values[0]
+
+    def operand(self, use, leaders: Dict[str, str]) -> Tuple:
+        """
+        :param use: An operand.
+        :param leaders: Name -> the name with the same value that replaces it.
+        :return: What the operand's value is known as.
+        """
+        name = self.name_of(use)
+        name = leaders.get(name, name)
+        value = self.constant(name)
+        if value is not None:
+            return 'constant', value
+        offset = use.get('offset', -1) if isinstance(use, dict) and use.get('size', 1) > 1 else 0
+        return name, offset
+
+    def key(self, instruction, nid: int, leaders: Dict[str, str], numbers: set) -> Optional[Tuple]:
+        """
+        :param instruction: An instruction.
+        :param nid: Its block.
+        :param leaders: Name -> the name with the same value that replaces it.
+        :param numbers: The names known to be numbers.
+        :return: The expression the instruction computes, or None if it isn't one that's numbered.
+        """
+        deff = instruction.defs
+        # Phi nodes don't know their size; they're numbered when their operands are.
+        if not isinstance(deff, dict) or (instruction.op != IRInstruction.PHI and deff.get('size', 1) != 1):
+            return None
+        if instruction.op == IRInstruction.CONSTANT:
+            value = self.scalar(instruction.value)
+            return ('constant', value) if value is not None else None
+        if instruction.op == IRInstruction.MATH:
+            operands = [self.operand(use, leaders) for use in instruction.uses]
+            if instruction.operand in ValueNumbering.commutative:
+                operands.sort(key=repr)
+            return (IRInstruction.MATH, instruction.operand) + tuple(operands)
+        if instruction.op == IRInstruction.PHI:
+            names = [leaders.get(use, use) for use in instruction.uses]
+            if not all(name in numbers or self.constant(name) is not None for name in names):
+                return None
+            # Phi nodes are only the same if they're in the same block.
+            return (IRInstruction.PHI, nid) + tuple(self.operand(name, leaders) for name in names)
+        return None
+
+    def number(self, root: str) -> int:
+        """
+        Removes the numbers of a function that are computed twice.
+        :param root: The function.
+        :return: The number of instructions removed.
+        """
+        blocks = self.program.functions[root]['blocks']
+        dominators = Dominators.get(self.program, root)
+        leaders = dict()
+        numbers = set()
+        self.constants = dict()
+        # Expression -> the name that first computed it.
+        table = dict()
+        removed = 0
+        # A preorder walk over the dominator tree, with each block's children in reverse post order,
+        # so the operands of phi nodes have been seen unless they come around a loop.
+        # None marks leaving a block's subtree.
+        rank = {nid: at for at, nid in enumerate(dominators.order)}
+        work = [dominators.entry]
+        scopes = list()
+        while work:
+            nid = work.pop()
+            if nid is None:
+                for key in scopes.pop():
+                    del table[key]
+                continue
+            added = list()
+            kept = list()
+            for instruction in blocks[nid].instructions:
+                key = self.key(instruction, nid, leaders, numbers)
+                if key is None:
+                    kept.append(instruction)
+                    continue
+                name = instruction.defs['name']
+                if key[0] == IRInstruction.PHI and len(set(key[2:])) == 1 and key[2][0] != 'constant':
+                    # Every operand is the same value.
+                    leaders[name] = key[2][0]
+                elif key in table:
+                    leaders[name] = table[key]
+                else:
+                    table[key] = name
+                    added.append(key)
+                    numbers.add(name)
+                    if key[0] == 'constant':
+                        self.constants[name] = key[1]
+                    kept.append(instruction)
+                    continue
+                removed += 1
+                self.log.debug("{} is the same value as {}.".format(name, leaders[name]))
+            if len(kept) != len(blocks[nid].instructions):
+                blocks[nid].instructions = kept
+                blocks[nid].phis = {instruction for instruction in kept if instruction.op == IRInstruction.PHI}
+            scopes.append(added)
+            work.append(None)
+            work.extend(sorted(dominators.tree.get(nid, list()), key=rank.get, reverse=True))
+
+        if leaders:
+            self.rename_uses(root, list(blocks), leaders)
+        return removed
+
+    def coalesce(self, root: str) -> int:
+        """
+        Turns the single droplet dispenses of the same reagent and volume in each block of a function into one.
+        :param root: The function.
+        :return: The number of dispenses removed.
+        """
+        blocks = self.program.functions[root]['blocks']
+        # Name -> the operands (and the instructions) using it.
+        uses = dict()
+        for block in blocks.values():
+            for instruction in block.instructions:
+                for x, use in enumerate(instruction.uses):
+                    uses.setdefault(self.name_of(use), list()).append((instruction, x))
+
+        removed = 0
+        for nid, block in blocks.items():
+            groups = dict()
+            for instruction in block.instructions:
+                if self.coalescable(instruction, uses):
+                    volumes = instruction.defs['var'].volumes.get(instruction.iid)
+                    groups.setdefault((instruction.uses[0]['name'], tuple(volumes)), list()).append(instruction)
+            for (reagent, volumes), group in groups.items():
+                for chunk in self.chunks(block, group, uses):
+                    if len(chunk) < 2:
+                        continue
+                    self.combine(root, block, reagent, list(volumes), chunk, uses)
+                    removed += len(chunk) - 1
+        return removed
+
+    def chunks(self, block, group: List, uses: Dict[str, List]) -> List[List]:
+        """
+        Splits dispenses into runs that can be dispensed at once, where the last of the run is:
+        a run ends at a dispense that comes after a use, in the block, of a droplet of the run.
+        :param block: The block of the dispenses.
+        :param group: The dispenses, in order.
+        :param uses: Name -> the operands using it.
+        :return: The runs, in order.
+        """
+        at = {instruction.iid: index for index, instruction in enumerate(block.instructions)}
+        chunks = list()
+        # The index of the first use in the block of a droplet of the current run.
+        first_use = float('inf')
+        for instruction in group:
+            if not chunks or at[instruction.iid] > first_use:
+                chunks.append(list())
+                first_use = float('inf')
+            chunks[-1].append(instruction)
+            for user, _ in uses.get(instruction.defs['name'], list()):
+                if user.iid in at:
+                    first_use = min(first_use, at[user.iid])
+        return chunks
+
+    def coalescable(self, instruction, uses: Dict[str, List]) -> bool:
+        """
+        :param instruction: An instruction.
+        :param uses: Name -> the operands using it.
+        :return: Is it a single droplet dispense whose droplet can be a lane of an array instead?
+        """
+        if instruction.op != IRInstruction.DISPENSE or instruction.defs.get('size', 1) != 1 or instruction.meta or \
+                instruction.defs.get('var') is None or not instruction.defs['var'].volumes.get(instruction.iid):
+            return False
+        return all(user.op not in ValueNumbering.whole and isinstance(user.uses[x], dict) and
+                   user.uses[x].get('offset', -1) in {-1, 0}
+                   for user, x in uses.get(instruction.defs['name'], list()))
+
+    def combine(self, root: str, block, reagent: str, volumes: List, group: List, uses: Dict[str, List]):
+        """
+        Replaces dispenses with one dispense of an array, with a lane for each.
+        :param root: The function.
+        :param block: The block of the dispenses.
+        :param reagent: What they dispense.
+        :param volumes: The volume they dispense.
+        :param group: The dispenses, in order; none of their droplets is used before the last of them.
+        :param uses: Name -> the operands using it.
+        :return: None
+        """
+        table = self.program.symbol_table
+        first = group[0]
+        width = len(group)
+        base = first.defs['var'].points_to if isinstance(first.defs['var'], RenamedSymbol) else first.defs['var']
+        symbol = Symbol("{}_{}_lanes".format(reagent, first.iid), root, base.types)
+        symbol.value = Movable(symbol.name, size=width, volume=min(volumes))
+        table.add_local_to_scope(symbol, root)
+        symbol = table.get_local(symbol.name, root)
+        array = self.version(symbol.sid, 1, root)
+        self.versions[symbol.sid] = max(self.versions.get(symbol.sid, 0), 1)
+
+        dispense = Dispense({'name': array['name'], 'offset': -1, 'size': width, 'var': array['var']},
+                            dict(first.uses[0]))
+        array['var'].volumes[dispense.iid] = list(volumes)
+        # The array takes the place of the last dispense, so no droplet lives longer than it did.
+        last = group[-1]
+        block.instructions = [dispense if instruction is last else instruction
+                              for instruction in block.instructions if instruction is last or instruction not in group]
+        block.defs.add(array['name'])
+
+        for lane, instruction in enumerate(group):
+            name = instruction.defs['name']
+            block.defs.discard(name)
+            for user, x in uses.get(name, list()):
+                use = user.uses[x]
+                replacement = {'name': array['name'], 'offset': lane, 'size': width, 'var': array['var']}
+                if user.defs is use:
+                    user.defs = replacement
+                user.uses[x] = replacement
+            self.log.debug("{} is lane {} of {}.".format(name, lane, array['name']))
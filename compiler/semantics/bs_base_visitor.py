@@ -1,8 +1,6 @@
 from abc import ABCMeta
 from typing import Set, Dict
 
-import colorlog
-
 import compiler.data_structures.symbol_table as st
 from chemicals.chemtypes import ChemTypeResolver, ChemTypes
 from chemicals.identifier import Identifier, NaiveIdentifier
@@ -11,13 +9,14 @@ from compiler.data_structures.scope import Scope
 from compiler.data_structures.variable import Number
 from grammar.parsers.python.BSParser import BSParser
 from grammar.parsers.python.BSParserVisitor import BSParserVisitor
+from shared.lazy_logger import LazyLogger
 
 
 class BSBaseVisitor(BSParserVisitor, metaclass=ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, symbol_table: st.SymbolTable, name="BaseVisitor", identifier: Identifier = NaiveIdentifier()):
         super().__init__()
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.visitor_name = name
         # The current symbol table
         self.symbol_table = symbol_table
@@ -72,7 +72,8 @@ class IRVisitor(BSBaseVisitor):
         self.current_block.label = Label("main")
         self.graph.add_node(self.current_block.nid, function=self.scope_stack[-1], label=self.current_block.label.label)
         # Build the main function.
-        self.functions['main'] = {'blocks': dict(), 'entry': self.current_block.nid, 'graph': self.graph}
+        self.functions['main'] = {'blocks': dict(), 'entry': self.current_block.nid, 'graph': self.graph,
+                                  'returns': dict()}
 
         # Add all the subsequent instructions to the B.B.
         for statement in ctx.statements():
@@ -113,7 +114,7 @@ class IRVisitor(BSBaseVisitor):
         self.symbol_table.current_scope = self.symbol_table.scope_map[name]
 
         self.current_block = BasicBlock()
-        self.functions[name] = {"blocks": dict(), "entry": self.current_block.nid, 'graph': None}
+        self.functions[name] = {"blocks": dict(), "entry": self.current_block.nid, 'graph': None, 'returns': dict()}
         label = Label("{}_entry".format(name))
         # Build the mapping from label to nid.
         self.labels[name] = self.current_block.nid
@@ -489,7 +490,8 @@ class IRVisitor(BSBaseVisitor):
             offset = deff['index']
         method_name, args = self.visitMethodCall(ctx.methodCall())
         self.current_block.add(
-            Call({'name': deff['name'], 'offset': offset}, self.symbol_table.functions[method_name], args))
+            Call({'name': deff['name'], 'offset': offset, 'size': deff['var'].value.size, 'var': deff['var']},
+                 self.symbol_table.functions[method_name], args))
 
         # Create the jump to the function.
         jump_location = self.get_entry_block(method_name)
@@ -505,6 +507,9 @@ class IRVisitor(BSBaseVisitor):
         self.current_block = BasicBlock()
         # This is the return call from the return call.
         self.current_block.add(Label('{}_return_{}'.format(method_name, previous_nid)))
+        # Within the function, control carries on here after the call;
+        # the function's own control flow graph adds this edge.
+        self.functions[self.scope_stack[-1]]['returns'][previous_nid] = self.current_block.nid
         # self.functions[self.scope_stack[-1]]['blocks'][self.current_block.nid] = self.current_block
 
     def visitMethodCall(self, ctx: BSParser.MethodCallContext):
@@ -825,10 +830,7 @@ class IRVisitor(BSBaseVisitor):
                        'var': self.symbol_table.get_local(deff['name'], self.scope_stack[-1])},
                       {'name': ctx.IDENTIFIER().__str__(), 'offset': 1, 'size': float("inf")})
 
-        if ir.iid in self.symbol_table.get_local(deff['name'], self.scope_stack[-1]).volumes:
-            self.symbol_table.get_local(deff['name'], self.scope_stack[-1]).volumes[ir.iid].append(_volume)
-        else:
-            self.symbol_table.get_local(deff['name'], self.scope_stack[-1]).volumes[ir.iid] = [_volume]
+        self.symbol_table.get_local(deff['name'], self.scope_stack[-1]).volumes.add(ir.iid, _volume)
 
         self.current_block.add(ir)
         return None
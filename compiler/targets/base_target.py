@@ -1,15 +1,14 @@
 import abc
 
-import colorlog
-
 import compiler.data_structures.program as prog
 from shared.bs_exceptions import UndefinedException
+from shared.lazy_logger import LazyLogger
 
 
 class BaseTarget(metaclass=abc.ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, program: prog.Program, name="BaseTarget"):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.program = program
         self.config = program.config
         self.name = name
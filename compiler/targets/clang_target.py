@@ -62,6 +62,9 @@ class ClangTarget(BaseTarget):
                 code += '  dispose({});\n'.format(instr.uses[0].name)
             elif type(instr) == Store:
                 code += '  {} = {};\n'.format(instr.defs.name, instr.uses)
+            elif type(instr) == Copy:
+                # The destination is declared at the top of the function; it's copied to from each predecessor.
+                code += '  {} = {};\n'.format(instr.defs['name'], instr.uses[0]['name'])
             elif type(instr) == Mix:
                 code += '  mat {} = mix({}, {}, {}, {}, {});\n'.format(
                                             instr.defs.name, 
@@ -171,6 +174,11 @@ class ClangTarget(BaseTarget):
 
                 self.compiled += '{} {}({});\n\n'.format(ret, func_name, args)
                 code = '{} {}({}) '.format(ret, func_name, args) + '{\n'
+            # The destinations of the copies out of SSA form, each once.
+            copies = dict.fromkeys(instr.defs['name'] for block in function['blocks'].values()
+                                   for instr in block.instructions if type(instr) == Copy)
+            for name in copies:
+                code += '  mat {};\n'.format(name)
             for block in function['blocks'].values(): 
                 code += self.construct_basic_block_code(block.instructions)
             code += '}\n\n'
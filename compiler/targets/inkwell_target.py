@@ -1,5 +1,4 @@
 import json
-from collections import defaultdict
 
 import networkx as nx
 from jsonschema import exceptions
@@ -7,6 +6,7 @@ from jsonschema import validate
 
 from compiler.data_structures import Program
 from compiler.data_structures.ir import *
+from compiler.data_structures.lanes import LaneMap, LaneUses, Span
 from compiler.data_structures.writable import Writable, WritableType
 from compiler.targets.base_target import BaseTarget
 from shared.components import FlowType
@@ -25,6 +25,8 @@ class InkwellTarget(BaseTarget):
         self.connections = dict()
         # The DAG node to component entity mapping.
         self.node_to_component = dict()
+        # The lanes of each droplet array to the component that holds them.
+        self.lanes = LaneMap()
 
     def build_dags(self):
         """
@@ -33,14 +35,15 @@ class InkwellTarget(BaseTarget):
         have an output var and consume something.
         :return:
         """
+        # The lane DAGs are composed with the control flow graph only for
+        # the dot output; they must not leak into the program's graph.
+        cfg = self.program.bb_graph if self.config.write_cfg else None
         for root in self.program.functions:
             self.dags[root] = dict()
-            # This maps an output variable (key) to a node in the graph.
-            var_defs = defaultdict(lambda: list())
-            var_uses = defaultdict(lambda: list())
-            # This maintains the set of variables an instruction
+            # This maps the lanes of a variable to the instructions that use them.
+            var_uses = LaneUses()
+            # This maintains the set of lane spans an instruction
             # defines or uses (basically a use/def chain)
-            # Have we added the edge for this def yet?
 
             no_defs = {IRInstruction.NOP, IRInstruction.CONDITIONAL, IRInstruction.PHI}
             graph = nx.DiGraph()
@@ -52,58 +55,46 @@ class InkwellTarget(BaseTarget):
                         # Add all the global variables to the instruction_uses.
                         if instruction.op == IRInstruction.DISPENSE and instruction.uses[0]['name'] not in graph:
                             graph.add_node(instruction.uses[0]['name'], defs=set(),
-                                           uses={(instruction.uses[0]['name'], 1)}, op=instruction.op)
-                        # Keep track of all the used variables,
-                        # with offsets in an instruction
+                                           uses={Span(instruction.uses[0]['name'], 1, 2)}, op=instruction.op)
+                        # Keep track of all the used lanes in an instruction
                         use = set()
-                        # Keep track of all the defd variables,
-                        # with offset in an instruction
+                        # Keep track of all the defd lanes in an instruction
                         deff = set()
 
                         if instruction.defs['offset'] >= 0:
-                            name = f"{instruction.defs['name']}_{instruction.defs['offset']}"
-                            if self.program.symbol_table.is_global(instruction.uses[0]['name']):
-                                var_defs[name].append(instruction.uses[0]['name'])
-                            else:
-                                var_defs[name].append(instruction.iid)
-                            deff.add((instruction.defs['name'], instruction.defs['offset']))
+                            deff.add(Span(instruction.defs['name'], instruction.defs['offset'],
+                                          instruction.defs['offset'] + 1))
                         else:
                             if instruction.op == IRInstruction.SPLIT:
                                 var = self.program.symbol_table.get_symbol(instruction.defs['name'], root)
-                                offset = var.value.size
+                                width = var.value.size
                             else:
-                                offset = instruction.defs['offset']
-                            for x in range(offset):
-                                name = f"{instruction.defs['name']}_{x}"
-                                var_defs[name].append(instruction.iid)
-                                deff.add((instruction.defs['name'], x))
+                                width = instruction.defs['offset']
+                            if width > 0:
+                                deff.add(Span(instruction.defs['name'], 0, width))
 
                         for uze in instruction.uses:
                             if uze['offset'] >= 0:
-                                # This wraps all dispenses into one single node.
-                                if self.program.symbol_table.is_global(uze['name']):
-                                    name = uze['name']
-                                else:
-                                    name = f"{uze['name']}_{uze['offset']}"
-                                var_uses[name].append(instruction.iid)
-                                use.add((uze['name'], uze['offset']))
+                                # All dispenses of a global are wrapped into one single node.
+                                span = Span(uze['name'], uze['offset'], uze['offset'] + 1)
                             else:
                                 # This if/else must be here because if the op is a split,
                                 # and the op consumes the entire variable, then both
                                 # the use['offset'] and def['offset'] are = 1.
                                 if instruction.op == IRInstruction.SPLIT:
                                     var = self.program.symbol_table.get_symbol(uze['name'], root)
-                                    offset = var.value.size
+                                    width = var.value.size
                                 else:
-                                    offset = instruction.defs['offset']
-                                for x in range(offset):
-                                    name = f"{uze['name']}_{x}"
-                                    var_uses[name].append(instruction.iid)
-                                    use.add((uze['name'], x))
-
-                        for name, offset in use:
-                            if self.program.symbol_table.is_global(name):
-                                graph.nodes[name]['defs'].update(deff)
+                                    width = instruction.defs['offset']
+                                if width <= 0:
+                                    continue
+                                span = Span(uze['name'], 0, width)
+                            var_uses.add(span, instruction.iid)
+                            use.add(span)
+
+                        for span in use:
+                            if self.program.symbol_table.is_global(span.name):
+                                graph.nodes[span.name]['defs'].update(deff)
                             else:
                                 graph.add_node(instruction.iid, op=instruction.op, defs=deff, uses=use)
 
@@ -111,19 +102,20 @@ class InkwellTarget(BaseTarget):
                 for node in graph.nodes:
                     # Get the instruction in which this variable is defined.
                     # Source is the uses.
-                    for source, src_offset in graph.nodes[node]['uses']:
+                    for source in graph.nodes[node]['uses']:
                         # Destination is the defs.
-                        if self.program.symbol_table.is_global(source):
-                            siids = [source]
+                        if self.program.symbol_table.is_global(source.name):
+                            siids = [source.name]
                         else:
-                            siids = var_uses[f"{source}_{src_offset}"]
-                        for destination, dst_offset in graph.nodes[node]['defs']:
+                            siids = var_uses.users(source)
+                        for destination in graph.nodes[node]['defs']:
                             # Build the edge from the source to the destination.
+                            dids = var_uses.users(destination)
                             for sid in siids:
-                                for did in var_uses[f"{destination}_{dst_offset}"]:
-                                    if sid != did and (f"{sid}_{did}" not in edges and f"{did}_{sid}" not in edges):
+                                for did in dids:
+                                    if sid != did and (sid, did) not in edges and (did, sid) not in edges:
                                         graph.add_edge(sid, did)
-                                        edges.add(f"{sid}_{did}")
+                                        edges.add((sid, did))
 
             if self.config.write_cfg:
                 self.program.write[root] = Writable(self.program.name, f"{self.config.output}/"
@@ -131,11 +123,24 @@ class InkwellTarget(BaseTarget):
                                                      graph, WritableType.GRAPH)
 
             self.program.functions[root]['graph'] = graph
-            self.program.bb_graph = nx.compose(self.program.bb_graph, graph)
+            if self.config.write_cfg:
+                cfg = nx.compose(cfg, graph)
         if self.config.write_cfg:
             self.program.write['cfg'] = Writable(self.program.name,
                                                  f"{self.config.output}/{self.program.name}_cfg.dot",
-                                                 self.program.bb_graph, WritableType.GRAPH)
+                                                 cfg, WritableType.GRAPH)
+
+    def lane_component(self, name: str, lane: int) -> dict:
+        """
+        Gets the component holding a lane of a variable.
+        Globals are held by their input port.
+        :param name: The variable.
+        :param lane: The lane.
+        :return: The component.
+        """
+        if self.program.symbol_table.is_global(name):
+            return self.components[f"{name}_{lane}"]
+        return self.lanes.get(name, lane)
 
     def transform(self, verify: bool = False):
         """
@@ -167,20 +172,19 @@ class InkwellTarget(BaseTarget):
                         then we know this must be a dispense port, so we build it.
                         '''
                         use = next(iter(graph.nodes[node]['uses']))
-                        global_use = f"{use[0]}_{use[1]}"
+                        global_use = f"{use.name}_{use.start}"
                         if global_use not in self.components:
                             self.components[global_use] = self.build_component(global_use,
                                                                                output['layers'][0]['id'],
                                                                                graph.nodes[node]['op'],
-                                                                               splits=use[1], iid=global_use,
+                                                                               splits=use.start, iid=global_use,
                                                                                deff_name="none")
                             output['components'].append(self.components[global_use])
                         # This maps a disposals def to the correct global use.
                         # e.g.: a[2] = dispose aaa, a[0] and a[1] will map to
                         # the dispenser aaa.
-                        for deff_name, deff_offset in graph.nodes[node]['defs']:
-                            if f"{deff_name}_{deff_offset}" not in self.components:
-                                self.components[f"{deff_name}_{deff_offset}"] = self.components[global_use]
+                        for deff in graph.nodes[node]['defs']:
+                            self.lanes.bind(deff, self.components[global_use])
                     elif not graph.out_edges(node):
                         '''
                         This checks for disposals.  If there are no outgoing edges,
@@ -188,18 +192,18 @@ class InkwellTarget(BaseTarget):
                         and the corresponding connection right now.
                         '''
                         use = next(iter(graph.nodes[node]['uses']))
-                        component_name = f"{use[0]}_{use[1]}_disposal"
+                        component_name = f"{use}_disposal"
                         self.components[component_name] = self.build_component(
                             component_name, output['layers'][0]['id'], graph.nodes[node]['op'],
-                            splits=use[1], iid=node, deff_name=use[0]
+                            splits=use.start, iid=node, deff_name=use.name
                         )
                         output['components'].append(self.components[component_name])
-                        connection_name = f"{use[0]}_{use[1]}->{component_name}"
+                        connection_name = f"{use}->{component_name}"
                         if connection_name not in self.connections:
                             connection = self.build_connection(
-                            self.components[f'{use[0]}_{use[1]}'], self.components[component_name],
+                                self.lane_component(use.name, use.start), self.components[component_name],
                                 connection_name, output['layers'][0]['id'],
-                            self.program.symbol_table.is_global(use[1])
+                                self.program.symbol_table.is_global(use.name)
                             )
                             self.connections[connection_name] = connection
                             output['connections'].append(connection)
@@ -207,38 +211,36 @@ class InkwellTarget(BaseTarget):
                         '''
                         Iterate all the other nodes that exist.
                         '''
-                        deff_name = '__'.join("%s_%s" % tup for tup in graph.nodes[node]['defs'])
+                        defs = sorted(graph.nodes[node]['defs'])
+                        deff_name = '__'.join(str(deff) for deff in defs)
                         self.components[deff_name] = self.build_component(deff_name, output['layers'][0]['id'],
                                                                           graph.nodes[node]['op'],
-                                                                          splits=len(graph.nodes[node]['defs']),
+                                                                          splits=sum(deff.width for deff in defs),
                                                                           iid=node, deff_name=deff_name)
                         output['components'].append((self.components[deff_name]))
-                        for name, offset in graph.nodes[node]['defs']:
-                            # Access an item in a set but don't iterate.
-                            # Disposals will have only one use, thus we can
-                            # safely check the first element if it's not global,
-                            # it doesn't matter what anything else is.
-                            component_name = f"{name}_{offset}"
-                            if component_name not in self.components:
-                                self.components[component_name] = self.components[deff_name]
+                        # The lanes an operation defines are now held by its component.
+                        for deff in defs:
+                            self.lanes.rebind(deff, self.components[deff_name])
 
                 # Build the connections between those components.
                 for node in self.program.functions[root]['graph'].nodes:
-                    for name, offset in graph.nodes[node]['uses']:
-                        use_name, use_offset = next(iter(graph.nodes[node]['uses']))
-                        if self.program.symbol_table.is_global(use_name):
-                            source = self.components[f"{use_name}_{use_offset}"]
+                    for use in graph.nodes[node]['uses']:
+                        first = next(iter(graph.nodes[node]['uses']))
+                        if self.program.symbol_table.is_global(first.name):
+                            sources = [self.components[f"{first.name}_{first.start}"]]
                         else:
-                            source = self.components[f"{name}_{offset}"]
-                        for deff_name, deff_offset in graph.nodes[node]['defs']:
-                            deff_var = self.program.symbol_table.get_symbol(deff_name)
-                            destination = self.components[f"{deff_name}_{deff_offset}"]
-                            connection_name = f"{source['name']}->{destination['name']}"
-                            if source['name'] != destination['name'] and connection_name not in self.connections:
-                                self.connections[connection_name] = self.build_connection(
-                                    source, destination, connection_name,
-                                    output['layers'][0]['id'], deff_var.value.is_global)
-                                output['connections'].append(self.connections[connection_name])
+                            sources = self.lanes.values(use)
+                        for deff in graph.nodes[node]['defs']:
+                            deff_var = self.program.symbol_table.get_symbol(deff.name)
+                            for destination in self.lanes.values(deff):
+                                for source in sources:
+                                    connection_name = f"{source['name']}->{destination['name']}"
+                                    if source['name'] != destination['name'] and \
+                                            connection_name not in self.connections:
+                                        self.connections[connection_name] = self.build_connection(
+                                            source, destination, connection_name,
+                                            output['layers'][0]['id'], deff_var.value.is_global)
+                                        output['connections'].append(self.connections[connection_name])
 
                 for component in output['components']:
                     if component['entity'] == 'Input-port':
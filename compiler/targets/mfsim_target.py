@@ -2,6 +2,7 @@ import networkx as nx
 
 from compiler.data_structures import IRInstruction
 from compiler.data_structures import RelationalOps
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
 from compiler.data_structures.ir import Conditional
 from compiler.data_structures.variable import *
 from compiler.targets.base_target import BaseTarget
@@ -43,19 +44,19 @@ class MFSimTarget(BaseTarget):
             leafs = set()
             tags = dict()
             self.dags[root] = dict()
-            self.cfg['graph'] = nx.DiGraph()
+            self.cfg['graph'] = ControlFlowGraph()
             remove_nodes = set()
             remove_edges_from = set()
             for bid, block in self.program.functions[root]['blocks'].items():
                 if not block.instructions:
                     # attach edges from pred to succ
-                    for pid in self.program.functions[root]['graph'].predecessors(bid):
-                        for sid in self.program.functions[root]['graph'].successors(bid):
+                    for pid in self.program.cfg.predecessors(bid):
+                        for sid in self.program.cfg.successors(bid):
                             self.cfg['graph'].add_edge(pid, sid)
                     # add bid to the list of nodes that must have all edges removed from final graph
                     remove_nodes.add(bid)
                     continue
-                for sid in self.program.functions[root]['graph'].successors(bid):
+                for sid in self.program.cfg.successors(bid):
                     self.cfg['graph'].add_edge(bid, sid)
                 self.cfg[bid] = dict()
                 curr = self.cfg[bid]
@@ -168,7 +169,7 @@ class MFSimTarget(BaseTarget):
                     self.dags[root][bid] = dag
 
             for remove in remove_nodes:
-                if remove in self.cfg['graph'].nodes:
+                if remove in self.cfg['graph']:
                     self.cfg['graph'].remove_node(remove)
 
             for remove in remove_edges_from:
@@ -666,8 +667,7 @@ class MFSimTarget(BaseTarget):
                     # we've made it here, we must transfer this rdef
                     if block.dag is not None:
                         # list of reachable block ids
-                        reachable = (
-                            {x for v in dict(nx.bfs_successors(self.cfg['graph'], bid)).values() for x in v})
+                        reachable = self.cfg['graph'].reachable(bid)
                         for s in reachable:
                             if transferred:
                                 break
@@ -719,7 +719,7 @@ class MFSimTarget(BaseTarget):
 
             # for each edge in bb_graph, must have corresponding in .cfg
 
-            edges_not_translated = list(nx.edges(self.cfg['graph']))
+            edges_not_translated = self.cfg['graph'].edges()
 
             conditional_groups = dict()
 
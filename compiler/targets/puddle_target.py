@@ -39,6 +39,8 @@ class PuddleTarget(BaseTarget):
                     code += '{}return {}\n'.format(tabs,instr.return_value.value)
             elif type(instr) == Store:
                 pass 
+            elif type(instr) == Copy:
+                code += '{}{} = {}\n'.format(tabs, instr.defs['name'], instr.uses[0]['name'])
             elif type(instr) == Call:
                 args = ''
                 for arg in instr.uses:
@@ -1,2 +1,3 @@
-from mix.config.cli import Cli
-from mix.config.config import Config
+# from mix.config.cli import Cli
+# from mix.config.config import Config
+from mix.config.mix_cli import MixCLI
@@ -0,0 +1,39 @@
+import json
+
+from shared.base_cli import BaseCLI
+from shared.bs_exceptions import InvalidOperation
+
+
+class MixCLI(BaseCLI):
+    """
+    A CLI visitors class.
+    Handles building the argsparser and validating the CLI arguments for the mix subsystem.
+    The input is a JSON file naming the target: either a ratio,
+    {"ratio": {"aaa": 3, "bbb": 1}}, or a dilution,
+    {"sample": "aaa", "buffer": "bbb", "concentration": 0.3}.
+    """
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.target = None
+
+        self.parser.add_argument('-a', '--accuracy', help="The most mixes from a reagent to the target; "
+                                                          "ratios are made to within 1/2^accuracy",
+                                 default=4, type=int)
+        self.parser.add_argument('-ns', '--no-sharing', help="Don't use the spare droplet of a mix where "
+                                                             "its mixture is needed again (plain Min-Mix)",
+                                 default=False, action='store_true')
+
+        self.args = self.parser.parse_args(args)
+        # Converts: /path/to/target.json => target
+        self.input_file = self.args.input.split("/")[-1].split(".")[0]
+        with open(self.args.input) as spec:
+            self.target = json.load(spec)
+        self.validate_config()
+
+    def validate_config(self):
+        if self.args.debug:
+            self.log.debug('Running in debug mode')
+        if 'ratio' not in self.target and not {'sample', 'buffer', 'concentration'} <= set(self.target):
+            raise InvalidOperation("{} needs a ratio, or a sample, a buffer and a concentration.".format(
+                self.args.input))
@@ -1,15 +1,31 @@
 import logging
+import os
 import sys
 
 import colorlog
 
-from storage.config.cli import Cli
+from mix.config.mix_cli import MixCLI
+from mix.mixing_tree import MinMix
 
 
 def main(args):
     # parse the args.
-    cli = Cli(args)
-    colorlog.log.fatal("Nothing happening in mix, yet")
+    cli = MixCLI(args)
+    min_mix = MinMix(cli.args.accuracy, share=not cli.args.no_sharing)
+    if 'ratio' in cli.target:
+        tree = min_mix.ratio(cli.target['ratio'])
+    else:
+        tree = min_mix.dilution(cli.target['sample'], cli.target['buffer'], cli.target['concentration'])
+
+    stats = "\n".join("{}:\t{}".format(key, value) for key, value in tree.stats().items())
+    colorlog.info("{} is made as {}.\n{}".format(cli.target, dict(tree.ratio), stats))
+    if cli.args.output:
+        path = os.path.join(cli.args.working_directory, cli.args.output, "{}.bs".format(cli.input_file))
+        with open(path, 'w') as out:
+            out.write(tree.bioscript())
+        colorlog.info("Wrote {}.".format(path))
+    else:
+        print(tree.bioscript())
 
 
 if __name__ == '__main__':
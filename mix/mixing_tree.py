@@ -0,0 +1,377 @@
+from collections import Counter
+from fractions import Fraction
+from typing import Dict, List, Tuple
+
+import networkx as nx
+
+from chemicals.chemtypes import ChemTypeResolver, ChemTypes
+from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import Dispense, Dispose, Label, Mix, NOP, Split
+from compiler.data_structures.program import Program
+from compiler.data_structures.symbol_table import SymbolTable
+from compiler.data_structures.variable import Dispensable, Movable, Number, Symbol
+from shared.bs_exceptions import InvalidOperation
+from shared.lazy_logger import LazyLogger
+
+
+class MixNode(object):
+    """
+    A droplet of a mixing tree: either a droplet of a reagent (a leaf),
+    or a 1:1 mix of two droplets, which is split into two droplets of the same mixture.
+    """
+
+    def __init__(self, composition: Dict[str, Fraction], reagent: str = None, children: Tuple = ()):
+        # Reagent -> its share of the droplet.
+        self.composition = composition
+        self.reagent = reagent
+        self.children = children
+        # How many of the droplets a mix makes are used (a leaf is used once).
+        self.used = 0
+        # The number of the mix, in the order the mixes are done.
+        self.number = 0
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.reagent is not None
+
+    @staticmethod
+    def key(composition: Dict[str, Fraction]) -> Tuple:
+        return tuple(sorted((reagent, share) for reagent, share in composition.items() if share))
+
+    @staticmethod
+    def mix(one: 'MixNode', two: 'MixNode') -> 'MixNode':
+        reagents = set(one.composition) | set(two.composition)
+        composition = {reagent: (one.composition.get(reagent, 0) + two.composition.get(reagent, 0)) / 2
+                       for reagent in reagents}
+        return MixNode(composition, children=(one, two))
+
+    def __repr__(self):
+        if self.is_leaf:
+            return self.reagent
+        return "mix{}({})".format(self.number, ", ".join("{}: {}".format(reagent, share)
+                                                         for reagent, share in MixNode.key(self.composition)))
+
+
+class MixingTree(object):
+    """
+    A mix/split graph preparing a target mixture from droplets of its reagents.
+    Every mix is of two unit droplets, and is split into two; the root's two droplets are the target,
+    and the droplets of the other mixes that aren't used are waste.  A mix may be used twice,
+    when two parts of the tree need the same mixture, so the graph needn't be a tree.
+    """
+
+    # The volume of a droplet, in the default units.
+    unit = 10
+
+    def __init__(self, reagents: List[str], target: Dict[str, Fraction], ratio: Dict[str, int],
+                 root: MixNode, leaves: List[MixNode], mixes: List[MixNode], depth: int):
+        self.reagents = reagents
+        # The mixture asked for, and the one made: reagent -> the number of droplets of it, out of 2^depth.
+        self.target = target
+        self.ratio = ratio
+        self.root = root
+        self.leaves = leaves
+        # The mixes, in the order they're done.
+        self.mixes = mixes
+        self.depth = depth
+
+    @property
+    def waste(self) -> int:
+        """
+        Every droplet dispensed ends up in the target or in the waste, so this is
+        the number of droplets dispensed, less the two of the target.
+        :return: The number of droplets that are disposed of.
+        """
+        return sum(2 - node.used for node in self.mixes if node is not self.root)
+
+    @property
+    def error(self) -> Fraction:
+        """
+        :return: The largest difference between the share of a reagent asked for and the share made.
+        """
+        total = sum(self.ratio.values())
+        return max(abs(self.target[reagent] - Fraction(self.ratio.get(reagent, 0), total))
+                   for reagent in self.reagents)
+
+    def usage(self) -> Counter:
+        """
+        :return: Reagent -> the number of droplets of it that are dispensed.
+        """
+        return Counter(leaf.reagent for leaf in self.leaves)
+
+    def stats(self) -> Dict[str, float]:
+        stats = {'Mixes': len(self.mixes), 'Splits': len(self.mixes), 'Depth': self.depth,
+                 'Droplets dispensed': len(self.leaves), 'Droplets wasted': self.waste,
+                 'Largest concentration error': float(self.error)}
+        for reagent, count in self.usage().items():
+            stats['Droplets of {}'.format(reagent)] = count
+        return stats
+
+    def names(self) -> Dict[str, str]:
+        """
+        :return: Reagent -> the variable its droplets are dispensed into.
+        """
+        return {reagent: "{}_drops".format(reagent) for reagent in self.usage()}
+
+    def statements(self) -> List[Tuple]:
+        """
+        The operations preparing the target, in order: the dispenses first, then each mix and its split,
+        and the waste of each split when nothing else will use it.
+        :return: (op, what's defined, the droplets used), where a droplet is (variable, index),
+            with an index of -1 for the whole of a variable; op is one of dispense, mix, split and dispose.
+        """
+        names = self.names()
+        usage = self.usage()
+        # Node -> the droplets it's in.
+        droplets = dict()
+        seen = Counter()
+        statements = list()
+        for reagent in self.reagents:
+            if reagent in usage:
+                statements.append(('dispense', (names[reagent], usage[reagent]), [(reagent, -1)]))
+        for leaf in self.leaves:
+            name = names[leaf.reagent]
+            droplets[id(leaf)] = [(name, seen[leaf.reagent] if usage[leaf.reagent] > 1 else -1)]
+            seen[leaf.reagent] += 1
+
+        # Node -> the droplets of it that haven't been used yet.
+        left = dict()
+        for node in self.mixes:
+            # The names end in a letter, so they can't be mistaken for each other's SSA versions.
+            mixed = "m{}_mix".format(node.number)
+            split = "target" if node is self.root else "m{}_split".format(node.number)
+            operands = [left[id(child)].pop(0) if id(child) in left else droplets[id(child)][0]
+                        for child in node.children]
+            statements.append(('mix', (mixed, 1), operands))
+            statements.append(('split', (split, 2), [(mixed, -1)]))
+            left[id(node)] = [(split, 0), (split, 1)]
+            # Spares nothing else uses go as soon as they're made.
+            if node is not self.root and node.used < 2:
+                statements.append(('dispose', None, [left[id(node)].pop()]))
+        return statements
+
+    def bioscript(self) -> str:
+        """
+        :return: The BioScript preparing the target.
+        """
+        lines = ["manifest {}".format(reagent) for reagent in self.reagents if reagent in self.usage()]
+        lines.extend(["", "instructions:", ""])
+        for op, deff, uses in self.statements():
+            operands = ["{}[{}]".format(name, index) if index >= 0 else name for name, index in uses]
+            if op == 'dispense':
+                name, size = deff
+                lines.append("{}{} = dispense {}".format(name, "[{}]".format(size) if size > 1 else "", operands[0]))
+            elif op == 'mix':
+                lines.append("{} = mix {} with {}".format(deff[0], operands[0], operands[1]))
+            elif op == 'split':
+                lines.append("{} = split {} into {}".format(deff[0], operands[0], deff[1]))
+            else:
+                lines.append("dispose {}".format(operands[0]))
+        return "\n".join(lines) + "\n"
+
+    def program(self, config, name: str = "mixing_tree") -> Program:
+        """
+        Builds the IR of the BioScript preparing the target, as the front end would.
+        :param config: The compiler's configuration.
+        :param name: The program's name.
+        :return: The program, ready for the pass manager.
+        """
+        table = SymbolTable()
+        for value in (0, 1):
+            constant = Symbol('CONST_{}'.format(value), table.global_scope, ChemTypeResolver.numbers())
+            constant.value = Number(constant.name, 1, value)
+            table.add_global(constant)
+        for reagent in self.reagents:
+            if reagent in self.usage():
+                manifest = Symbol(reagent, table.global_scope, {ChemTypes.MAT})
+                manifest.value = Dispensable(reagent)
+                table.add_global(manifest)
+
+        def local(name: str, size: int, volume: float = 10.0) -> Symbol:
+            symbol = Symbol(name, 'main', {ChemTypes.MAT})
+            symbol.value = Movable(name, size=size, volume=volume)
+            table.add_local_to_scope(symbol, 'main')
+            return table.get_local(name, 'main')
+
+        def use(name: str, index: int, whole: bool = False) -> Dict:
+            var = table.get_local(name, 'main')
+            offset = 0 if index == -1 and var.value.size == 1 else index
+            return {'name': name, 'offset': offset, 'size': var.value.size, 'var': var if whole else var.value}
+
+        block = BasicBlock()
+        block.label = Label("main")
+        graph = nx.DiGraph()
+        graph.add_node(block.nid, function='main', label=block.label.label)
+        for op, deff, uses in self.statements():
+            if op == 'dispense':
+                symbol = local(deff[0], deff[1], MixingTree.unit)
+                ir = Dispense({'name': deff[0], 'offset': -1, 'size': deff[1], 'var': symbol},
+                              {'name': uses[0][0], 'offset': 1, 'size': float("inf")})
+                symbol.volumes.add(ir.iid, MixingTree.unit)
+            elif op == 'mix':
+                operands = [use(*operand) for operand in uses]
+                for operand, (_, index) in zip(operands, uses):
+                    operand['offset'] = index
+                symbol = local(deff[0], 1, float(-1))
+                ir = Mix({'name': deff[0], 'offset': -1, 'size': 1, 'var': symbol}, *operands)
+                symbol.volumes[ir.iid] = [MixingTree.unit, MixingTree.unit]
+            elif op == 'split':
+                operand = use(uses[0][0], uses[0][1], whole=True)
+                symbol = local(deff[0], deff[1])
+                ir = Split({'name': deff[0], 'offset': -1, 'size': deff[1], 'var': symbol}, operand, deff[1])
+            else:
+                name, index = uses[0]
+                var = table.get_local(name, 'main').value
+                ir = Dispose({'name': name, 'offset': index, 'var': var, 'size': var.size})
+            block.add(ir)
+        block.add(NOP())
+
+        functions = {'main': {'blocks': {block.nid: block}, 'entry': block.nid, 'graph': graph}}
+        return Program(functions=functions, config=config, symbol_table=table, bb_graph=graph, name=name,
+                       calls=dict())
+
+
+class MinMix(object):
+    """
+    Synthesizes mixing trees with the Min-Mix algorithm, for the (1:1) mix-split model.
+    A ratio of reagents summing to 2^d needs a tree of depth d: a reagent whose share is n/2^d
+    has a leaf at height j for each bit j set in n, and going up from the bottom, the droplets
+    at each height are mixed in pairs, so the tree has the fewest mixes a ratio of that depth can.
+    Ratios that don't sum to a power of two, and concentrations, are approximated to within
+    1/2^accuracy.  Every mix makes two droplets, and Min-Mix only uses one of them; the other
+    is used where the tree needs the same mixture of two reagents again higher up,
+    instead of dispensing and mixing them once more, which saves a mix, and two droplets dispensed
+    (so two droplets less waste).  The spares of the other mixes are still disposed of.
+    """
+    log = LazyLogger()
+
+    def __init__(self, accuracy: int = 4, share: bool = True):
+        """
+        :param accuracy: The most mixes on the way from a reagent to the target (the tree's depth).
+        :param share: Whether to use the spare droplet of a mix where the tree needs its mixture again.
+        """
+        if accuracy < 1:
+            raise InvalidOperation("The accuracy of a mixing tree must be at least 1, not {}.".format(accuracy))
+        self.accuracy = accuracy
+        self.share = share
+
+    def dilution(self, sample: str, buffer: str, concentration: float) -> MixingTree:
+        """
+        :param sample: The reagent diluted.
+        :param buffer: What it's diluted with.
+        :param concentration: The share of the sample in the target, between 0 and 1.
+        :return: The tree diluting the sample.
+        """
+        if not 0 <= concentration <= 1:
+            raise InvalidOperation("A concentration must be between 0 and 1, not {}.".format(concentration))
+        if sample == buffer:
+            raise InvalidOperation("{} can't be diluted with itself.".format(sample))
+        concentration = Fraction(concentration).limit_denominator(2 ** 32)
+        return self.ratio({sample: concentration, buffer: 1 - concentration})
+
+    def ratio(self, ratio: Dict[str, float]) -> MixingTree:
+        """
+        :param ratio: Reagent -> its part of the target (the parts needn't sum to anything).
+        :return: The tree making the target.
+        """
+        if not ratio or any(part < 0 for part in ratio.values()) or not any(ratio.values()):
+            raise InvalidOperation("A ratio needs at least one reagent with a positive part: {}.".format(ratio))
+        reagents = list(ratio)
+        parts = {reagent: Fraction(part).limit_denominator(2 ** 32) for reagent, part in ratio.items()}
+        total = sum(parts.values())
+        target = {reagent: part / total for reagent, part in parts.items()}
+
+        counts = self.approximate(reagents, target)
+        # The depth is the fewest mixes that make the ratio.
+        depth = sum(counts.values()).bit_length() - 1
+        while depth and all(count % 2 == 0 for count in counts.values()):
+            counts = {reagent: count // 2 for reagent, count in counts.items()}
+            depth -= 1
+        root, leaves, mixes = self.build(reagents, counts, depth)
+        tree = MixingTree(reagents, target, counts, root, leaves, mixes, depth)
+        self.log.debug("{} is made as {} in {} mixes, wasting {} droplets.".format(
+            ratio, counts, len(mixes), tree.waste))
+        return tree
+
+    def approximate(self, reagents: List[str], target: Dict[str, Fraction]) -> Dict[str, int]:
+        """
+        :param reagents: The reagents, in order.
+        :param target: Reagent -> its share of the target.
+        :return: Reagent -> its share of the target, in droplets out of 2^accuracy;
+            each reagent in the target gets at least one.
+        """
+        scale = 2 ** self.accuracy
+        wanted = [reagent for reagent in reagents if target[reagent]]
+        if len(wanted) > scale:
+            raise InvalidOperation("{} reagents can't be mixed with an accuracy of {}.".format(
+                len(wanted), self.accuracy))
+        counts = {reagent: max(int(target[reagent] * scale), 1) for reagent in wanted}
+
+        def under(reagent: str) -> Tuple:
+            # How many droplets short of its share a reagent is, the first reagents first.
+            return target[reagent] * scale - counts[reagent], -reagents.index(reagent)
+
+        # The droplets left over go to the reagents furthest short of their share,
+        # and the droplets too many come from those furthest over it.
+        while sum(counts.values()) < scale:
+            counts[max(wanted, key=under)] += 1
+        while sum(counts.values()) > scale:
+            counts[min((reagent for reagent in wanted if counts[reagent] > 1), key=under)] -= 1
+        return counts
+
+    def build(self, reagents: List[str], counts: Dict[str, int], depth: int) \
+            -> Tuple[MixNode, List[MixNode], List[MixNode]]:
+        """
+        Builds the tree bottom up.
+        :param reagents: The reagents, in order.
+        :param counts: Reagent -> its share of the target, in droplets out of 2^depth.
+        :param depth: The depth of the tree.
+        :return: The root, the leaves and the mixes, in order.
+        """
+        order = [reagent for reagent in reagents if reagent in counts]
+        leaves = list()
+        mixes = list()
+        # Mixture -> the mixes with a droplet to spare.
+        spares = dict()
+        carried = list()
+        for height in range(depth + 1):
+            level = [MixNode({reagent: Fraction(1)}, reagent=reagent)
+                     for reagent in order if counts[reagent] >> height & 1]
+            if height == depth:
+                break
+            # Pairs of reagents whose mixture there's a droplet of already.
+            reused = list()
+            if self.share:
+                at = 0
+                while at < len(level):
+                    match = next((other for other in level[at + 1:]
+                                  if spares.get(MixNode.key(MixNode.mix(level[at], other).composition))), None)
+                    if match is None:
+                        at += 1
+                        continue
+                    reused.append(spares[MixNode.key(MixNode.mix(level[at], match).composition)].pop(0))
+                    level.remove(match)
+                    del level[at]
+            # Reagents are mixed with each other first, as their mixtures are the ones that can be reused.
+            nodes = level + carried
+            carried = list(reused)
+            for one, two in zip(nodes[::2], nodes[1::2]):
+                node = MixNode.mix(one, two)
+                node.number = len(mixes) + 1
+                for child in (one, two):
+                    child.used += 1
+                    if child.is_leaf:
+                        leaves.append(child)
+                mixes.append(node)
+                spares.setdefault(MixNode.key(node.composition), list()).append(node)
+                carried.append(node)
+
+        if depth == 0:
+            root = level[0]
+            root.used += 1
+            leaves.append(root)
+        else:
+            root = carried[0]
+            spares[MixNode.key(root.composition)].remove(root)
+            root.used = 2
+        return root, leaves, mixes
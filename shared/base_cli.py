@@ -1,13 +1,13 @@
 import abc
 import argparse
 
-import colorlog
+from shared.lazy_logger import LazyLogger
 
 
 class BaseCLI(metaclass=abc.ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, args):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.args = args
         self.parser = argparse.ArgumentParser()
         """
@@ -3,7 +3,7 @@ import copy
 import json
 from enum import IntEnum
 
-import colorlog
+from shared.lazy_logger import LazyLogger
 
 
 class FlowType(IntEnum):
@@ -19,9 +19,9 @@ def get_component_api(config):
 
 
 class ComponentAPI(object, metaclass=abc.ABCMeta):
+    log = LazyLogger()
 
     def __init__(self, config):
-        self.log = colorlog.getLogger(self.__class__.__name__)
         self.config = config
         self.filter = config.flow_type
 
@@ -0,0 +1,12 @@
+import colorlog
+
+
+class LazyLogger(object):
+    """
+    A class level logger.  The logger is resolved by the name
+    of the instance's class each time it's used (colorlog caches
+    it), so instances don't hold a logger and pickle cleanly.
+    """
+
+    def __get__(self, instance, owner):
+        return colorlog.getLogger(owner.__name__)
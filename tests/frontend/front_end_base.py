@@ -3,6 +3,7 @@ from abc import ABCMeta
 from chemicals.identifier import NaiveIdentifier
 from compiler.config.compiler_cli import CompilerCLI
 from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import IRInstruction
 from compiler.data_structures.program import Program
 from compiler.data_structures.symbol_table import SymbolTable
 from compiler.passes.pass_manager import PassManager
@@ -66,13 +67,31 @@ class FrontEndBase(metaclass=ABCMeta):
         target.transform()
         return target
 
-    def get_volume(self, tree, file):
+    def get_program(self, tree, file: str, *args) -> Program:
+        ir = self.get_ir(tree)
+        config = CompilerCLI(["-d", "-i", file, "-o", "output/"] + list(args)).config
+        manager = PassManager(Program(functions=ir.functions, config=config, symbol_table=ir.symbol_table,
+                                      bb_graph=ir.graph, name=file, calls=ir.calls))
+        manager.run()
+        return manager.program
+
+    @staticmethod
+    def instructions(program: Program, op: IRInstruction, root: str = 'main') -> list:
+        return [instruction for block in program.functions[root]['blocks'].values()
+                for instruction in block.instructions if instruction.op == op]
+
+    @staticmethod
+    def count(program: Program, op: IRInstruction, root: str = 'main') -> int:
+        return len(FrontEndBase.instructions(program, op, root))
+
+    def get_volume_program(self, tree, file):
         ir = self.get_ir(tree)
         ir = Program(functions=ir.functions, config=CompilerCLI(["-d", "-i", file, "-o", "output/"]).config,
                        symbol_table=ir.symbol_table, bb_graph=ir.graph, name=file, calls=ir.calls)
         pm = PassManager(ir)
         pm.run_analysis()
         pm.run_transformations()
-        prog = pm.program
+        return pm.program
 
-        return prog.analysis['volume_tracking']
\ No newline at end of file
+    def get_volume(self, tree, file):
+        return self.get_volume_program(tree, file).analysis['volume_tracking']
\ No newline at end of file
@@ -0,0 +1,51 @@
+import pytest
+
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.call_graph import CallGraph
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.call_graph
+class TestCallGraph(FrontEndBase):
+
+    def get_calls(self, get_visitor, file: str):
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        return CallGraph().analyze(program)['result']
+
+    def test_chain(self, get_visitor):
+        calls = self.get_calls(get_visitor, "test_cases/function/ir_function_chain.bs")
+
+        assert set(calls.graph.edges) == {('main', 'foo'), ('foo', 'bar'), ('bar', 'baz')}
+        assert calls.bottom_up() == ['baz', 'bar', 'foo', 'main']
+        assert [len(level) for level in calls.levels] == [1, 1, 1, 1]
+        assert calls.calls == [[], [0], [1], [2]]
+        assert not any(calls.is_recursive(function) for function in calls.graph.nodes)
+
+    def test_recursion(self, get_visitor):
+        calls = self.get_calls(get_visitor, "test_cases/function/call_graph_recursive.bs")
+
+        # Calls don't make edges back to the caller.
+        assert calls.callees('leaf') == set()
+        assert calls.callers('main') == set()
+        assert calls.component['even'] == calls.component['odd']
+        assert calls.is_recursive('even') and calls.is_recursive('odd')
+        assert not calls.is_recursive('leaf')
+        # The mutually recursive functions are one unit, in the same level as leaf, and before main.
+        assert len(calls.levels) == 2
+        assert set(calls.levels[0]) == {calls.component['leaf'], calls.component['even']}
+        assert calls.members(calls.component['even']) == ['even', 'odd']
+        assert calls.component['main'] == len(calls.components) - 1
+
+    def test_schedule(self, get_visitor):
+        calls = self.get_calls(get_visitor, "test_cases/function/call_graph_recursive.bs")
+
+        def work(component, done):
+            # Everything a component calls outside of itself is already done.
+            for function in component:
+                assert calls.callees(function) - component <= set(done)
+            return {function: len(component) for function in component}
+
+        assert calls.schedule(work) == {'even': 2, 'odd': 2, 'leaf': 1, 'main': 1}
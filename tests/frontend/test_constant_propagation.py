@@ -0,0 +1,39 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.constant_propagation
+class TestConstantPropagation(FrontEndBase):
+
+    def test_constant_propagation(self, get_visitor):
+        file = "test_cases/transforms/constant_propagation.bs"
+        program = self.get_program(get_visitor(file), file, "-sccp")
+
+        # y, the phi node merging z, which is 4 either way, and w.
+        assert program.stats['Constants folded'] == 3
+        # y > 3 always holds, and w < 3 never does; the else branch and the while loop go.
+        assert program.stats['Conditionals folded'] == 2
+        assert program.stats['Dead branch blocks removed'] == 2
+        assert self.count(program, IRInstruction.MIX) == 1
+        assert self.count(program, IRInstruction.MATH) == 1
+        # What's left is the detect's conditional, and the repeat loop's.
+        assert self.count(program, IRInstruction.CONDITIONAL) == 2
+        assert self.count(program, IRInstruction.HEAT) == 1
+
+    def test_unrolled(self, get_visitor):
+        file = "test_cases/transforms/constant_propagation.bs"
+        program = self.get_program(get_visitor(file), file, "-sccp", "-lu")
+
+        # Unrolled, the repeat counter is a constant too.
+        assert self.count(program, IRInstruction.CONDITIONAL) == 1
+        assert self.count(program, IRInstruction.HEAT) == 2
+
+    def test_disabled(self, get_visitor):
+        file = "test_cases/transforms/constant_propagation.bs"
+        program = self.get_program(get_visitor(file), file)
+
+        assert 'Constants folded' not in program.stats
+        assert self.count(program, IRInstruction.CONDITIONAL) == 4
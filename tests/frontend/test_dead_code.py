@@ -0,0 +1,38 @@
+import pytest
+
+from compiler.config.compiler_cli import CompilerCLI
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.pass_manager import PassManager
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.dead_code
+class TestDeadCode(FrontEndBase):
+
+    def test_dead_code(self, get_visitor):
+        file = "test_cases/transforms/dead_code.bs"
+        program = self.get_program(get_visitor(file), file, "-dce")
+
+        # The mix, the detect whose result isn't used, and d, which is only disposed of.
+        assert program.stats['Dead operations removed'] == 4
+        assert program.stats['Dead volume removed'] == 6
+        assert program.stats['Dead operation time removed (s)'] == 20
+        assert self.count(program, IRInstruction.MIX) == 0
+        assert self.count(program, IRInstruction.DISPOSE) == 0
+        assert self.count(program, IRInstruction.DISPENSE) == 2
+        # x decides whether b is heated, and b is stored.
+        assert self.count(program, IRInstruction.DETECT) == 1
+        assert self.count(program, IRInstruction.HEAT) == 1
+        assert self.count(program, IRInstruction.STORE) == 1
+
+    def test_disabled(self, get_visitor):
+        ir = self.get_ir(get_visitor("test_cases/transforms/dead_code.bs"))
+        config = CompilerCLI(["-d", "-i", "test_cases/transforms/dead_code.bs", "-o", "output/"]).config
+        manager = PassManager(Program(functions=ir.functions, config=config, symbol_table=ir.symbol_table,
+                                      bb_graph=ir.graph, name="dead_code", calls=ir.calls))
+        manager.run()
+
+        assert 'dead_code' not in manager.pipeline
+        assert self.count(manager.program, IRInstruction.MIX) == 1
@@ -0,0 +1,59 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.def_use import DefUseChains
+from compiler.passes.transforms.ssa import SSA
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.def_use
+class TestDefUse(FrontEndBase):
+
+    def get_chains(self, get_visitor, file: str):
+        ir = self.get_ir(get_visitor(file))
+        program = SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                          name=file, calls=ir.calls))
+        return program, DefUseChains().analyze(program)['result']
+
+    @pytest.mark.parametrize("file", ["test_cases/ssa/appel_ssa.bs",
+                                      "test_cases/ssa/gupta_ssa.bs",
+                                      "test_cases/volume/mix_repeat.bs"])
+    def test_chains(self, get_visitor, file):
+        program, chains = self.get_chains(get_visitor, file)
+
+        for nid, block in program.functions['main']['blocks'].items():
+            for instruction in block.instructions:
+                for use in instruction.uses:
+                    name = use['name'] if isinstance(use, dict) else use
+                    assert instruction.iid in chains.users(name, 'main')
+                    assert chains.last_use(nid, name) is not None
+                    definition = chains.definition(name, 'main')
+                    if definition is not None:
+                        assert instruction.iid in chains.users_of(definition)
+
+    def test_dispense_dispose(self, get_visitor):
+        file = "test_cases/volume/mix_var_double_use.bs"
+        program, chains = self.get_chains(get_visitor, file)
+        instructions = [instruction for block in program.functions['main']['blocks'].values()
+                        for instruction in block.instructions]
+        dispenses = {instruction.defs['var'].points_to.name: instruction.iid for instruction in instructions
+                     if instruction.op == IRInstruction.DISPENSE}
+        disposals = {instruction.uses[0]['name']: instruction.iid for instruction in instructions
+                     if instruction.op == IRInstruction.DISPOSE}
+
+        # a is mixed into both c and d, b only into c, and a_ only into d.
+        assert [chain.instruction for chain in chains.disposals(dispenses['a'])] == [disposals['c1'],
+                                                                                    disposals['d1']]
+        assert [chain.subsumed_by for chain in chains.disposals(dispenses['b'])] == ['c1']
+        assert [chain.subsumed_by for chain in chains.disposals(dispenses['a_'])] == ['d1']
+
+    def test_function_locals(self, get_visitor):
+        program, chains = self.get_chains(get_visitor, "test_cases/ssa/ssa_function_locals.bs")
+
+        # foo, bar and main each have an a1, with a definition and users of their own.
+        for root, function in program.functions.items():
+            iids = {instruction.iid for block in function['blocks'].values() for instruction in block.instructions}
+            assert chains.definition('a1', root) in iids
+            assert chains.users('a1', root) and set(chains.users('a1', root)) <= iids
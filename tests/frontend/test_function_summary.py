@@ -0,0 +1,48 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.function_summary
+class TestFunctionSummary(FrontEndBase):
+
+    def test_summary(self, get_visitor):
+        file = "test_cases/function/summary_mix_enough.bs"
+        tree = get_visitor(file)
+        program = self.get_volume_program(tree, file)
+        summary = program.analysis['function_summaries']['helper']
+
+        assert summary.consumed == [5]
+        assert summary.produced == 8
+        assert summary.dispensed == {'bbb': 3}
+        assert summary.max_droplets == 2
+        assert summary.ops[IRInstruction.MIX] == 1
+        assert not summary.recursive
+
+        # The callee is folded into its caller.
+        main = program.analysis['function_summaries']['main']
+        assert main.dispensed == {'aaa': 10, 'bbb': 3}
+        assert main.ops[IRInstruction.MIX] == 2
+
+    def test_call_site(self, get_visitor):
+        file = "test_cases/function/summary_mix_enough.bs"
+        tree = get_visitor(file)
+        vol = self.get_volume(tree, file)
+
+        assert not vol[0]
+        # The call took 5 units of a and returned 8.
+        after_call = next(volumes for volumes in vol[1] if 'r1' in volumes)
+        assert after_call['a1']['volumes'] == [5]
+        assert after_call['r1']['volumes'] == [8]
+        # The mix then used up both.
+        assert vol[1][-1]['r1']['volumes'] == [-1]
+        assert vol[1][-1]['a1']['volumes'] == [-1]
+
+    def test_call_site_not_enough(self, get_visitor):
+        file = "test_cases/function/summary_mix_not_enough.bs"
+        tree = get_visitor(file)
+        vol = self.get_volume(tree, file)
+
+        assert vol[0]
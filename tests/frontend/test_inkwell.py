@@ -0,0 +1,30 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.lanes import Span
+from compiler.targets.inkwell_target import InkwellTarget
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.inkwell
+class TestInkwell(FrontEndBase):
+
+    def test_simd_dag(self, get_visitor):
+        file = "test_cases/volume/mix_simd.bs"
+        program = self.get_program(get_visitor(file), file, "-t", "inkwell",
+                                   "-lib", "../resources/flow/components.json")
+        InkwellTarget(program)
+        graph = program.functions['main']['graph']
+        mixes = [mix.iid for mix in self.instructions(program, IRInstruction.MIX)]
+        split = self.instructions(program, IRInstruction.SPLIT)[0]
+
+        # The reagents feed each lane's mix, and every mix feeds the one split of c.
+        assert len(mixes) == 64
+        assert set(graph.nodes) == {'fluid_a', 'fluid_b', split.iid} | set(mixes)
+        assert set(graph.edges) == {(reagent, mix) for reagent in ('fluid_a', 'fluid_b') for mix in mixes} | \
+                                   {(mix, split.iid) for mix in mixes}
+        # The dispenses define a lane at a time; the split defines both halves of every lane at once.
+        assert len(graph.nodes['fluid_a']['defs']) == 64
+        assert all(span.width == 1 for span in graph.nodes['fluid_a']['defs'])
+        assert graph.nodes[split.iid]['defs'] == {Span(split.defs['name'], 0, 128)}
@@ -0,0 +1,61 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.inline
+class TestInline(FrontEndBase):
+
+    def test_inline(self, get_visitor):
+        file = "test_cases/function/inline_helper.bs"
+        program = self.get_program(get_visitor(file), file, "-inline")
+
+        assert program.stats['Calls inlined'] == 3
+        assert program.stats['Functions removed by inlining'] == 2
+        assert list(program.functions) == ['main']
+        assert self.count(program, IRInstruction.CALL) == 0
+        assert self.count(program, IRInstruction.MIX) == 3
+        assert self.count(program, IRInstruction.HEAT) == 3
+        # The calls no longer split main, so it is one block.
+        assert len(program.functions['main']['blocks']) == 1
+        assert not program.analysis['volume_tracking'][0]
+        assert program.stats['Schedule lower bound (s)'] == 10 + 30 + 10 + 30
+
+    def test_threshold(self, get_visitor):
+        # Inlining helper adds more than it removes; prepare is only called once, so it moves instead.
+        file = "test_cases/function/inline_helper.bs"
+        program = self.get_program(get_visitor(file), file, "-inline", "-it", "0")
+
+        assert program.stats['Calls inlined'] == 1
+        assert 'prepare' not in program.functions
+        assert 'helper' in program.functions
+        assert self.count(program, IRInstruction.CALL) == 2
+        assert self.count(program, IRInstruction.HEAT) == 1
+        assert program.stats['Schedule lower bound (s)'] == 10 + 30 + 10 + 30
+
+    def test_recursive(self, get_visitor):
+        file = "test_cases/function/call_graph_recursive.bs"
+        program = self.get_program(get_visitor(file), file, "-inline")
+
+        # Only leaf can be inlined; even and odd call each other.
+        assert program.stats['Calls inlined'] == 1
+        assert 'leaf' not in program.functions
+        assert 'even' in program.functions and 'odd' in program.functions
+        assert self.count(program, IRInstruction.CALL) == 1
+
+    def test_loops(self, get_visitor):
+        file = "test_cases/control/ir_repeat_unroll_functions.bs"
+        program = self.get_program(get_visitor(file), file, "-inline")
+        cfg = program.function_cfg('main')
+
+        assert program.stats['Calls inlined'] == 2
+        assert list(program.functions) == ['main']
+        assert self.count(program, IRInstruction.MIX) == 3 + 2
+        # The phi nodes of the callees' loops are copied along with them.
+        phis = [(nid, instruction) for nid, block in program.functions['main']['blocks'].items()
+                for instruction in block.instructions if instruction.op == IRInstruction.PHI]
+        assert len(phis) == 3 * 2
+        assert all(len(phi.uses) == len(cfg.predecessors(nid)) for nid, phi in phis)
+        assert not program.analysis['volume_tracking'][0]
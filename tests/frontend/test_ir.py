@@ -1,5 +1,8 @@
+import networkx as nx
 import pytest
 
+from compiler.data_structures.control_flow_graph import ControlFlowGraph
+from compiler.data_structures.program import Program
 from shared.bs_exceptions import InvalidOperation
 from tests.frontend.front_end_base import FrontEndBase
 
@@ -598,3 +601,73 @@ class TestFunctions(FrontEndBase):
                    "_call_ a[0] = foo(CONST_2[0], z[0])\nfoo_return_2:\n\tNOP"
 
         assert expected == ir.compiled.rstrip()
+
+
+@pytest.mark.frontend
+@pytest.mark.ir
+class TestControlFlowGraph(FrontEndBase):
+
+    def test_matches_networkx(self, get_visitor):
+        file = "test_cases/control/ir_repeat_nested_repeat.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        cfg = program.cfg
+
+        assert cfg.nodes() == list(ir.graph.nodes)
+        assert cfg.edges() == list(ir.graph.edges)
+        for nid in ir.graph.nodes:
+            assert cfg.successors(nid) == list(ir.graph.successors(nid))
+            assert cfg.predecessors(nid) == list(ir.graph.predecessors(nid))
+            assert cfg.reachable(nid) == {x for v in dict(nx.bfs_successors(ir.graph, nid)).values() for x in v}
+
+        csr = cfg.csr()
+        assert len(csr.succ_offsets) == len(cfg) + 1 and csr.succ_offsets[-1] == cfg.number_of_edges()
+        assert len(csr.pred_offsets) == len(cfg) + 1 and csr.pred_offsets[-1] == cfg.number_of_edges()
+
+    def test_views_follow_changes(self, get_visitor):
+        file = "test_cases/control/ir_if_else.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        entry = program.functions['main']['entry']
+        first = program.function_cfg('main')
+
+        assert program.function_cfg('main') is first
+        assert set(program.bb_graph.edges) == set(ir.graph.edges)
+
+        program.cfg.add_edge(entry, entry)
+
+        assert program.function_cfg('main') is not first
+        assert (entry, entry) in program.bb_graph.edges
+        assert (entry, entry) in program.function_cfg('main').edges()
+
+    def test_call_returns(self, get_visitor):
+        file = "test_cases/function/ir_function_chain.bs"
+        ir = self.get_ir(get_visitor(file))
+        edges = list(ir.graph.edges)
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        returns = program.functions['main']['returns']
+        entries = {function['entry'] for function in program.functions.values()}
+
+        # The program's graph, and so its dot output, is the front end's: calls only go to their callees.
+        assert returns
+        assert sorted(program.bb_graph.edges) == sorted(edges)
+        assert sorted(program.bb_graph.nodes) == sorted(ir.graph.nodes)
+        for call, after in returns.items():
+            assert set(program.cfg.successors(call)) <= entries
+            assert (call, after) not in program.bb_graph.edges
+            # The function's own graph goes on to the block after the call.
+            assert program.function_cfg('main').successors(call) == [after]
+            assert program.function_cfg('main').predecessors(after) == [call]
+
+    def test_subgraph_order(self):
+        cfg = ControlFlowGraph()
+        cfg.add_edges_from([(1, 2), (2, 3), (3, 1), (3, 4)])
+        sub = cfg.subgraph([3, 1, 2])
+
+        # The blocks come in the order asked for, and keep the order of their edges.
+        assert sub.nodes() == [3, 1, 2]
+        assert sub.successors(3) == [1] and sub.predecessors(1) == [3]
+        assert sub.edges() == [(3, 1), (1, 2), (2, 3)]
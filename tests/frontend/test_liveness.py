@@ -0,0 +1,67 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.analyses.liveness import Liveness
+from compiler.passes.transforms.ssa import SSA
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.liveness
+class TestLiveness(FrontEndBase):
+
+    def get_ssa(self, get_visitor, file: str) -> Program:
+        ir = self.get_ir(get_visitor(file))
+        return SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                       name=file, calls=ir.calls))
+
+    @pytest.mark.parametrize("file", ["test_cases/ssa/appel_ssa.bs",
+                                      "test_cases/ssa/gupta_ssa.bs",
+                                      "test_cases/volume/mix_repeat.bs"])
+    def test_live_in_out(self, get_visitor, file):
+        program = self.get_ssa(get_visitor, file)
+        liveness = Liveness.get(program, 'main')
+        cfg = program.function_cfg('main')
+
+        for nid, block in program.functions['main']['blocks'].items():
+            defined = set()
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    # Phi operands are live out of their own predecessor, not into the phi's block.
+                    assert not liveness.is_live_in(nid, instruction.defs['name'])
+                    for pred, use in zip(cfg.predecessors(nid), instruction.uses):
+                        assert liveness.is_live_out(pred, use)
+                    defined.add(instruction.defs['name'])
+                    continue
+                for use in instruction.uses:
+                    if use['name'] not in defined and not program.symbol_table.is_global(use['name']):
+                        assert liveness.is_live_in(nid, use['name'])
+                if instruction.defs is not None and Liveness.killed(instruction) is not None:
+                    defined.add(instruction.defs['name'])
+            for successor in cfg.successors(nid):
+                assert liveness.live_in_names(successor) <= liveness.live_out_names(nid)
+
+    def test_cached(self, get_visitor):
+        program = self.get_ssa(get_visitor, "test_cases/volume/mix_repeat.bs")
+        liveness = Liveness.get(program, 'main')
+
+        assert Liveness.get(program, 'main') is liveness
+        Liveness.invalidate(program, 'main')
+        assert Liveness.get(program, 'main') is not liveness
+
+    def test_live_range(self, get_visitor):
+        program = self.get_ssa(get_visitor, "test_cases/volume/mix_repeat.bs")
+        liveness = Liveness.get(program, 'main')
+        blocks = program.functions['main']['blocks']
+        mix = next(instruction for block in blocks.values() for instruction in block.instructions
+                   if instruction.op == IRInstruction.MIX)
+        body = next(nid for nid, block in blocks.items() if mix in block.instructions)
+
+        # Each b is dispensed and mixed away inside the loop body.
+        droplet = mix.uses[1]['name']
+        assert list(liveness.live_range(droplet)) == [body]
+        first, last = liveness.live_range(droplet)[body]
+        assert blocks[body].instructions[last] is mix
+        assert blocks[body].instructions[first].op == IRInstruction.DISPENSE
+        assert liveness.pressure(body) >= 2
@@ -0,0 +1,67 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.variable import RenamedSymbol
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.loop_unroll
+class TestLoopUnroll(FrontEndBase):
+
+    def test_full(self, get_visitor):
+        file = "test_cases/control/ir_repeat_unroll.bs"
+        program = self.get_program(get_visitor(file), file, "-lu")
+
+        assert program.stats['Loops fully unrolled'] == 1
+        assert self.count(program, IRInstruction.CONDITIONAL) == 0
+        assert self.count(program, IRInstruction.PHI) == 0
+        assert self.count(program, IRInstruction.MIX) == 4
+        # The copies are merged into straight line code.
+        assert len(program.functions['main']['blocks']) == 1
+        assert not program.analysis['volume_tracking'][0]
+        assert program.stats['Schedule lower bound (s)'] == 4 * 40
+
+    def test_partial(self, get_visitor):
+        # A copy of the body is 3 instructions, so only 2 of them fit.
+        file = "test_cases/control/ir_repeat_unroll.bs"
+        program = self.get_program(get_visitor(file), file, "-lu", "-ub", "6")
+
+        assert program.stats['Loops partially unrolled'] == 1
+        assert self.count(program, IRInstruction.MIX) == 2
+        schedule = program.analysis['schedule_length']['main']
+        assert list(schedule.trip_counts.values()) == [2]
+        assert schedule.lower_bound == 4 * 40
+
+    def test_over_budget(self, get_visitor):
+        file = "test_cases/control/ir_repeat_unroll.bs"
+        program = self.get_program(get_visitor(file), file, "-lu", "-ub", "2")
+
+        assert program.stats['Loops fully unrolled'] == 0
+        assert program.stats['Loops partially unrolled'] == 0
+        assert self.count(program, IRInstruction.MIX) == 1
+
+    def test_nested(self, get_visitor):
+        file = "test_cases/control/ir_repeat_nested_repeat.bs"
+        program = self.get_program(get_visitor(file), file, "-lu")
+
+        assert program.stats['Loops fully unrolled'] == 3
+        assert self.count(program, IRInstruction.CONDITIONAL) == 0
+        assert self.count(program, IRInstruction.DISPENSE) == 3 + 3 * 3 + 3 * 3 * 3
+
+    def test_function_locals(self, get_visitor):
+        file = "test_cases/control/ir_repeat_unroll_functions.bs"
+        program = self.get_program(get_visitor(file), file, "-lu")
+        table = program.symbol_table
+
+        assert program.stats['Loops fully unrolled'] == 3
+        # Each function has an a1; the copies use their own function's.
+        for root, function in program.functions.items():
+            assert self.count(program, IRInstruction.PHI, root) == 0
+            scope = table.scope_map[root]
+            for block in function['blocks'].values():
+                for instruction in block.instructions:
+                    for operand in list(instruction.uses) + [instruction.defs]:
+                        if isinstance(operand, dict) and isinstance(operand.get('var'), RenamedSymbol):
+                            var = operand['var']
+                            assert scope.locals.get(var.name) is var or table.is_global(var.points_to.name)
@@ -0,0 +1,60 @@
+import pytest
+
+from compiler.config.compiler_cli import CompilerCLI
+from compiler.data_structures.ir import IRInstruction
+from compiler.passes.pass_manager import PassManager
+from mix.mixing_tree import MinMix
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.mixing_tree
+class TestMixingTree(FrontEndBase):
+
+    def test_min_mix(self):
+        tree = MinMix(share=False).ratio({'aaa': 3, 'bbb': 3, 'ccc': 1, 'ddd': 1})
+
+        # A mix for every leaf but one, and a spare droplet from every mix but the root.
+        assert tree.depth == 3
+        assert len(tree.mixes) == 5
+        assert len(tree.leaves) == 6
+        assert tree.waste == 4
+
+    def test_sharing(self):
+        tree = MinMix().ratio({'aaa': 3, 'bbb': 3, 'ccc': 1, 'ddd': 1})
+
+        # The 1:1 mix of aaa and bbb is needed twice, and its spare droplet is used the second time;
+        # the spares of the mix of ccc and ddd, and of the mix of those two mixtures, are waste.
+        assert tree.depth == 3
+        assert len(tree.mixes) == 4
+        assert tree.usage() == {'aaa': 1, 'bbb': 1, 'ccc': 1, 'ddd': 1}
+        assert tree.waste == 2
+        assert tree.error == 0
+
+    def test_dilution(self):
+        tree = MinMix(accuracy=4).dilution('aaa', 'bbb', 0.3)
+
+        assert tree.ratio == {'aaa': 5, 'bbb': 11}
+        assert tree.depth == 4
+        assert tree.error <= 1 / 2 ** 5
+        assert MinMix(accuracy=4).dilution('aaa', 'bbb', 0.25).ratio == {'aaa': 1, 'bbb': 3}
+
+    def test_bioscript(self, get_visitor, tmp_path):
+        tree = MinMix().ratio({'aaa': 3, 'bbb': 3, 'ccc': 1, 'ddd': 1})
+        file = tmp_path / "mixing_tree.bs"
+        file.write_text(tree.bioscript())
+        program = self.get_program(get_visitor(str(file)), str(file))
+
+        assert self.count(program, IRInstruction.DISPENSE) == 4
+        assert self.count(program, IRInstruction.MIX) == 4
+        assert self.count(program, IRInstruction.SPLIT) == 4
+        assert self.count(program, IRInstruction.DISPOSE) == 1
+
+    def test_program(self):
+        tree = MinMix().ratio({'aaa': 1, 'bbb': 3})
+        manager = PassManager(tree.program(CompilerCLI(["-d", "-i", "mixing_tree", "-o", "output/"]).config))
+        manager.run()
+
+        assert self.count(manager.program, IRInstruction.MIX) == 2
+        assert self.count(manager.program, IRInstruction.DISPOSE) == 2
+        assert manager.program.stats['Timing constraints violated'] == 0
@@ -0,0 +1,54 @@
+import pytest
+
+from compiler.config.compiler_cli import CompilerCLI
+from compiler.data_structures.ir import IRInstruction
+from compiler.data_structures.program import Program
+from compiler.passes.pass_manager import PassManager
+from shared.bs_exceptions import UnsupportedOperation
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.pass_manager
+class TestPassManager(FrontEndBase):
+
+    def get_manager(self, get_visitor, file: str, *args) -> PassManager:
+        ir = self.get_ir(get_visitor(file))
+        config = CompilerCLI(["-d", "-i", file, "-o", "output/"] + list(args)).config
+        return PassManager(Program(functions=ir.functions, config=config, symbol_table=ir.symbol_table,
+                                   bb_graph=ir.graph, name=file, calls=ir.calls))
+
+    def test_pipeline_from_cli(self, get_visitor):
+        manager = self.get_manager(get_visitor, "test_cases/ssa/appel_ssa.bs",
+                                   "-passes", "liveness, split_edges,out_of_ssa")
+        assert manager.pipeline == ['liveness', 'split_edges', 'out_of_ssa']
+        manager.run()
+
+        # Only what the pipeline asked for is computed.
+        assert set(manager.program.analysis) == {'call_graph', 'dominators', 'liveness'}
+        assert not manager.program.ssa_form
+        for block in manager.program.functions['main']['blocks'].values():
+            assert all(instruction.op != IRInstruction.PHI for instruction in block.instructions)
+        assert 'Out of SSA time' in manager.program.stats
+
+    def test_unknown_pass(self, get_visitor):
+        with pytest.raises(UnsupportedOperation):
+            self.get_manager(get_visitor, "test_cases/ssa/appel_ssa.bs", "-passes", "liveness,unknown")
+
+    def test_cached_analysis(self, get_visitor):
+        manager = self.get_manager(get_visitor, "test_cases/volume/mix_repeat.bs", "-passes", "liveness")
+        manager.run()
+        liveness = manager.program.analysis['liveness']
+        assert manager.require('liveness') is liveness
+
+    def test_invalidation(self, get_visitor):
+        manager = self.get_manager(get_visitor, "test_cases/ssa/appel_ssa.bs",
+                                   "-passes", "call_graph,liveness,split_edges,out_of_ssa")
+        manager.run()
+
+        # Out of SSA changes the instructions, but not the calls or the control flow graph.
+        assert 'call_graph' in manager.valid
+        assert 'liveness' not in manager.valid
+        assert 'liveness' not in manager.program.functions['main']
+        liveness = manager.require('liveness')
+        assert manager.program.functions['main']['liveness'] is liveness['main']
@@ -0,0 +1,45 @@
+import pickle
+from timeit import default_timer as timer
+
+import pytest
+
+from compiler.config.compiler_cli import CompilerCLI
+from compiler.data_structures.options import Options
+from compiler.data_structures.program import Program
+from compiler.passes.pass_manager import PassManager
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.benchmark
+class TestPickle(FrontEndBase):
+
+    def get_program(self, tree, file):
+        ir = self.get_ir(tree)
+        program = Program(functions=ir.functions, config=CompilerCLI(["-d", "-i", file, "-o", "output/"]).config,
+                          symbol_table=ir.symbol_table, bb_graph=ir.graph, name=file, calls=ir.calls)
+        pm = PassManager(program)
+        pm.run_transformations()
+        return pm.program
+
+    def test_loc_1024(self, get_visitor, record_property):
+        file = "../resources/assays/loc_1024.bs"
+        program = self.get_program(get_visitor(file), file)
+
+        start = timer()
+        data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        dump_time = timer() - start
+        start = timer()
+        copy = pickle.loads(data)
+        load_time = timer() - start
+        record_property('pickled_bytes', len(data))
+        record_property('dump_seconds', round(dump_time, 4))
+        record_property('load_seconds', round(load_time, 4))
+
+        assert isinstance(copy.config, Options)
+        assert copy.cfg.edges() == program.cfg.edges()
+        assert len(copy.symbol_table.symbols) == len(program.symbol_table.symbols)
+        for root in program.functions:
+            for nid, block in program.functions[root]['blocks'].items():
+                assert [str(i) for i in copy.functions[root]['blocks'][nid].instructions] == \
+                       [str(i) for i in block.instructions]
@@ -0,0 +1,34 @@
+import pytest
+
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.schedule_length
+class TestScheduleLength(FrontEndBase):
+
+    def test_repeat(self, get_visitor):
+        file = "test_cases/schedule/schedule_repeat.bs"
+        tree = get_visitor(file)
+        program = self.get_volume_program(tree, file)
+        schedule = program.analysis['schedule_length']['main']
+
+        assert list(schedule.trip_counts.values()) == [3]
+        # Each iteration heats for 30s and then mixes for 10s.
+        assert schedule.lower_bound == 120
+        assert program.stats['Schedule lower bound (s)'] == 120
+        assert program.stats['Longest block critical path (s)'] == 40
+        assert 'schedule' in program.write
+
+    def test_slack(self, get_visitor):
+        file = "test_cases/schedule/schedule_repeat.bs"
+        tree = get_visitor(file)
+        program = self.get_volume_program(tree, file)
+        schedule = program.analysis['schedule_length']['main']
+        body = schedule.blocks[schedule.longest_block()]
+
+        # The heat, then the mix.
+        assert [body.duration[iid] for iid in body.critical] == [30, 10]
+        assert [body.asap[iid] for iid in body.critical] == [0, 30]
+        # The dispense can wait until the heat is done.
+        assert 30 in [body.slack(iid) for iid in body.asap if body.duration[iid] == 0]
@@ -0,0 +1,307 @@
+import sys
+
+import networkx as nx
+import pytest
+
+from chemicals.chemtypes import ChemTypeResolver, ChemTypes
+from compiler.data_structures.basic_block import BasicBlock
+from compiler.data_structures.ir import BinaryOps, Conditional, Dispense, IRInstruction, Label, Math, Mix, NOP, \
+    RelationalOps
+from compiler.data_structures.program import Program
+from compiler.data_structures.symbol_table import SymbolTable
+from compiler.data_structures.variable import Dispensable, Movable, Number, RenamedSymbol, Symbol
+from compiler.passes.analyses.dominators import Dominators
+from compiler.passes.transforms.out_of_ssa import OutOfSSA
+from compiler.passes.transforms.split_edges import SplitEdges
+from compiler.passes.transforms.ssa import SSA
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.ssa
+class TestDominators(FrontEndBase):
+
+    @pytest.mark.parametrize("file", ["test_cases/ssa/appel_ssa.bs",
+                                      "test_cases/ssa/gupta_ssa.bs",
+                                      "test_cases/control/ir_repeat_nested_repeat.bs"])
+    def test_matches_networkx(self, get_visitor, file):
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        entry = program.functions['main']['entry']
+        graph = program.function_cfg('main').to_networkx()
+        info = Dominators.get(program, 'main')
+
+        # Newer networkx versions leave the entry out of the immediate dominators.
+        idoms = {nid: idom for nid, idom in nx.immediate_dominators(graph, entry).items() if nid != entry}
+        assert info.idoms[entry] == entry
+        assert {nid: idom for nid, idom in info.idoms.items() if nid != entry} == idoms
+        assert info.frontier == nx.dominance_frontiers(graph, entry)
+        for nid, idom in info.idoms.items():
+            assert nid == entry or nid in info.tree[idom]
+            assert info.dominates(entry, nid) and info.dominates(idom, nid)
+
+    def test_cached_per_version(self, get_visitor):
+        file = "test_cases/control/ir_if_else.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        entry = program.functions['main']['entry']
+        info = Dominators.get(program, 'main')
+
+        assert Dominators.get(program, 'main') is info
+
+        program.cfg.remove_edge(entry, program.cfg.successors(entry)[0])
+        assert Dominators.get(program, 'main') is not info
+
+    def test_cached_per_function(self, get_visitor):
+        file = "test_cases/function/ir_function_chain.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                          name=file, calls=ir.calls)
+        main, foo = Dominators.get(program, 'main'), Dominators.get(program, 'foo')
+        foo_cfg = program.function_cfg('foo')
+
+        entry = program.functions['main']['entry']
+        program.cfg.add_edge(entry, entry)
+
+        # Only main changed, so foo keeps its graph and dominators.
+        assert Dominators.get(program, 'main') is not main
+        assert program.function_cfg('foo') is foo_cfg
+        assert Dominators.get(program, 'foo') is foo
+
+
+@pytest.mark.frontend
+@pytest.mark.ssa
+class TestDeepNesting(object):
+    """
+    The grammar can't parse nesting this deep, so these
+    programs are built the way the IR visitor would build them.
+    """
+
+    @staticmethod
+    def nested_program(depth: int) -> Program:
+        """
+        Builds depth levels of alternating if and repeat statements,
+        each of which mixes a into itself before and after the next level.
+        :param depth: The nesting depth.
+        :return: The program.
+        """
+        BasicBlock.id_counter = 1
+        table = SymbolTable()
+        table.new_scope('main')
+        graph = nx.DiGraph()
+        blocks = dict()
+
+        def constant(value):
+            symbol = Symbol(f"CONST_{value}", 'global', ChemTypeResolver.numbers())
+            symbol.value = Number(symbol.name, 1, value)
+            table.add_global(symbol)
+            return {'name': symbol.name, 'offset': 0, 'size': 1, 'var': symbol}
+
+        def new_block(label):
+            block = BasicBlock()
+            block.add(Label(label.format(block.nid)))
+            graph.add_node(block.nid, function='main', label=block.label.label)
+            blocks[block.nid] = block
+            return block
+
+        def mix(block):
+            block.add(Mix(dict(a), dict(a), dict(a)))
+
+        aaa = Symbol('aaa', 'global', {ChemTypes.MAT})
+        aaa.value = Dispensable('aaa')
+        table.add_global(aaa)
+        zero, one = constant(0), constant(1)
+        symbol = Symbol('a', 'main', {ChemTypes.MAT})
+        symbol.value = Movable('a')
+        table.add_local_to_scope(symbol, 'main')
+        a = {'name': 'a', 'offset': -1, 'size': 1, 'var': table.get_local('a', 'main')}
+        counter = Symbol('REPEAT_2', 'global', ChemTypeResolver.numbers())
+        counter.value = Number(counter.name, 1, 2)
+        table.add_local_to_scope(counter, 'main')
+        repeat = {'name': counter.name, 'offset': 0, 'size': 1, 'var': table.get_local(counter.name, 'main')}
+
+        current = new_block('main')
+        entry = current.nid
+        current.add(Dispense(dict(a), {'name': 'aaa', 'offset': 1, 'size': float('inf')}))
+        opened = list()
+        for level in range(depth):
+            if level % 2:
+                header = new_block("bsbbr_{}_h")
+                graph.add_edge(current.nid, header.nid)
+                header.add(Conditional(RelationalOps.GT, dict(repeat), zero))
+                current = new_block("bsbbr_{}_t")
+                graph.add_edge(header.nid, current.nid)
+                opened.append(header)
+            else:
+                current.add(Conditional(RelationalOps.GT, one, zero))
+                true_block = new_block("bsbbif_{}_t")
+                false_block = new_block("bsbbif_{}_f")
+                graph.add_edge(current.nid, true_block.nid)
+                graph.add_edge(current.nid, false_block.nid)
+                current = true_block
+                opened.append(false_block)
+            mix(current)
+        for level in reversed(range(depth)):
+            if level % 2:
+                header = opened.pop()
+                current.add(Math(dict(repeat), dict(repeat), one, BinaryOps.SUBTRACT))
+                graph.add_edge(current.nid, header.nid)
+                current = new_block("bsbbr_{}_f")
+                graph.add_edge(header.nid, current.nid)
+            else:
+                false_block = opened.pop()
+                graph.add_edge(current.nid, false_block.nid)
+                current = false_block
+            mix(current)
+        current.add(NOP())
+
+        return Program(functions={'main': {'blocks': blocks, 'entry': entry, 'graph': graph}},
+                       symbol_table=table, bb_graph=graph, name="nested", calls=dict())
+
+    def test_deep_nesting(self):
+        depth = 3000
+        program = SSA().transform(self.nested_program(depth))
+        cfg = program.function_cfg('main')
+        info = Dominators.get(program, 'main')
+
+        # The dominator tree is deeper than the recursion limit.
+        height = {info.entry: 0}
+        for nid in info.order[1:]:
+            height[nid] = height[info.idoms[nid]] + 1
+        assert max(height.values()) > sys.getrecursionlimit()
+
+        phis = 0
+        for nid, block in program.functions['main']['blocks'].items():
+            for instruction in block.instructions:
+                if instruction.op == IRInstruction.PHI:
+                    phis += 1
+                    assert len(instruction.uses) == cfg.in_degree(nid)
+                    assert 'a' not in instruction.uses
+                else:
+                    assert all(use['name'] != 'a' for use in instruction.uses)
+        assert phis >= depth
+
+
+@pytest.mark.frontend
+@pytest.mark.ssa
+class TestPrunedSSA(FrontEndBase):
+
+    def get_ssa(self, get_visitor, file: str) -> Program:
+        ir = self.get_ir(get_visitor(file))
+        return SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                       name=file, calls=ir.calls))
+
+    @pytest.mark.parametrize("file", ["test_cases/ssa/appel_ssa.bs",
+                                      "test_cases/ssa/gupta_ssa.bs",
+                                      "test_cases/ssa/ssa_trivial_phi.bs"])
+    def test_no_trivial_phis(self, get_visitor, file):
+        program = self.get_ssa(get_visitor, file)
+
+        for nid, block in program.functions['main']['blocks'].items():
+            for phi in block.phis:
+                values = set(phi.uses) - {phi.defs['name'], phi.defs['var'].points_to.name}
+                assert len(values) > 1
+                assert len(phi.uses) == program.cfg.in_degree(nid)
+
+    def test_trivial_phi(self, get_visitor):
+        file = "test_cases/ssa/ssa_trivial_phi.bs"
+        program = self.get_ssa(get_visitor, file)
+        blocks = program.functions['main']['blocks']
+        phis = [phi for block in blocks.values() for phi in block.phis]
+
+        # Heating doesn't define a new x, so only the repeat needs phi nodes for x.
+        # The mix and split redefine y and z before any use, so they need none.
+        assert sorted(phi.defs['var'].points_to.name for phi in phis) == ['REPEAT_3', 'x']
+        assert program.stats['SSA trivial phi nodes removed'] > 0
+        assert program.stats['SSA phi nodes pruned'] > 0
+
+        # The empty join of the if statement is gone.
+        assert program.stats['SSA empty blocks removed'] == 1
+        assert set(program.cfg) == set(blocks)
+        assert not any(block.label.label.endswith('_j') for block in blocks.values())
+
+    def get_function_locals(self, get_visitor) -> Program:
+        file = "test_cases/ssa/ssa_function_locals.bs"
+        ir = self.get_ir(get_visitor(file))
+        table = ir.symbol_table
+        # Name main's first versions before foo and bar name theirs, as a pass could.
+        for name in ('a', 'b'):
+            table.version_name(table.get_local(name, 'main').sid, 1)
+        return SSA().transform(Program(functions=ir.functions, symbol_table=table, bb_graph=ir.graph,
+                                       name=file, calls=ir.calls))
+
+    @staticmethod
+    def assert_function_versions(program: Program):
+        """
+        Every version a function names is one of its own, or a global's.
+        """
+        table = program.symbol_table
+        for root, function in program.functions.items():
+            scope = table.scope_map[root]
+            for block in function['blocks'].values():
+                for instruction in block.instructions:
+                    for operand in list(instruction.uses) + [instruction.defs]:
+                        if isinstance(operand, dict) and isinstance(operand.get('var'), RenamedSymbol):
+                            var = operand['var']
+                            assert scope.locals.get(var.name) is var or table.is_global(var.points_to.name)
+
+    def test_function_locals(self, get_visitor):
+        program = self.get_function_locals(get_visitor)
+        table = program.symbol_table
+
+        # Each function has an a1, and the phi nodes of a in the loops are trivial.
+        assert program.stats['SSA trivial phi nodes removed'] >= 3
+        assert len({table.scope_versions(root)['a1'] for root in ('foo', 'bar', 'main')}) == 3
+        # The per-scope index only holds versions of the globals and of the function's own locals.
+        for root in ('foo', 'bar', 'main'):
+            scope = table.scope_map[root]
+            for name, (base, version) in table.scope_versions(root).items():
+                symbol = table.get_symbol_by_id(base)
+                assert table.version_name(base, version) == name
+                assert table.globals.get(symbol.name) is symbol or scope.locals.get(symbol.name) is symbol or \
+                    scope.locals.get(name) is not None
+        self.assert_function_versions(program)
+
+
+@pytest.mark.frontend
+@pytest.mark.ssa
+class TestOutOfSSA(FrontEndBase):
+
+    get_ssa = TestPrunedSSA.get_ssa
+    get_function_locals = TestPrunedSSA.get_function_locals
+    assert_function_versions = TestPrunedSSA.assert_function_versions
+
+    @pytest.mark.parametrize("file", ["test_cases/ssa/appel_ssa.bs",
+                                      "test_cases/ssa/gupta_ssa.bs",
+                                      "test_cases/ssa/ssa_trivial_phi.bs"])
+    def test_out_of_ssa(self, get_visitor, file):
+        program = OutOfSSA().transform(SplitEdges().transform(self.get_ssa(get_visitor, file)))
+        blocks = program.functions['main']['blocks']
+        instructions = [instruction for block in blocks.values() for instruction in block.instructions]
+
+        assert not program.ssa_form
+        assert not any(instruction.op == IRInstruction.PHI for instruction in instructions)
+        assert not any(block.phis for block in blocks.values())
+        copies = [instruction for instruction in instructions if instruction.op == IRInstruction.COPY]
+        assert all(copy.defs['name'] != copy.uses[0]['name'] for copy in copies)
+        assert len(copies) == program.stats['Out of SSA copies inserted'] - \
+            program.stats['Out of SSA copies coalesced']
+
+    def test_function_locals(self, get_visitor):
+        program = OutOfSSA().transform(SplitEdges().transform(self.get_function_locals(get_visitor)))
+
+        # The phi nodes of b in the loops need copies; they, and the names coalesced,
+        # are versions of their own function's b.
+        assert program.stats['Out of SSA copies inserted'] >= 3
+        self.assert_function_versions(program)
+
+    def test_no_critical_edges(self, get_visitor):
+        program = SplitEdges().transform(self.get_ssa(get_visitor, "test_cases/ssa/ssa_trivial_phi.bs"))
+        blocks = program.functions['main']['blocks']
+
+        for nid, block in blocks.items():
+            if block.phis:
+                for pred in program.cfg.predecessors(nid):
+                    assert program.cfg.out_degree(pred) == 1
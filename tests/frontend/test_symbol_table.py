@@ -1,7 +1,11 @@
 import pytest
 
 from chemicals.chemtypes import ChemTypes, ChemTypeResolver
+from compiler.data_structures.function import Function
+from compiler.data_structures.program import Program
 from compiler.data_structures.symbol_table import SymbolTable
+from compiler.data_structures.variable import RenamedSymbol, Symbol, VolumeMap
+from compiler.passes.transforms.ssa import SSA
 from shared.bs_exceptions import UndefinedVariable, UndefinedFunction, UnsupportedOperation
 from tests.frontend.front_end_base import FrontEndBase
 
@@ -422,6 +426,21 @@ class TestFunction(FrontEndBase):
             file = "test_cases/function/symbol_table_redeclare.bs"
             st = self.get_symbols(get_visitor(file))
 
+    def test_arg_is_own_symbol(self, get_visitor):
+        st = SymbolTable()
+        caller = Symbol('a', 'main', {ChemTypes.MAT})
+        caller.volumes.add(1, 10.0)
+        st.add_local(caller)
+        func = Function('foo', {ChemTypes.MAT}, ['x'])
+        func.args = {'var': caller}
+        arg = func.args[-1]
+
+        assert arg.scope == 'foo' and arg.sid == -1
+        arg.types.add(ChemTypes.NAT)
+        arg.volumes.add(1, 5.0)
+        assert caller.types == {ChemTypes.MAT}
+        assert caller.volumes[1] == [10.0]
+
 
 @pytest.mark.frontend
 @pytest.mark.symbol_table
@@ -472,3 +491,81 @@ class TestGradient(FrontEndBase):
         with pytest.raises(UndefinedVariable):
             file = "test_cases/gradient/symbol_table_one_undefined.bs"
             st = self.get_symbols(get_visitor(file))
+
+
+@pytest.mark.frontend
+@pytest.mark.symbol_table
+class TestInterning(FrontEndBase):
+
+    def test_symbol_ids(self, get_visitor):
+        file = "test_cases/dispense/symbol_table_defined.bs"
+        st = self.get_symbols(get_visitor(file))
+
+        mani = st.get_global('aaa')
+        output = st.get_local('a', 'main')
+
+        assert mani.sid >= 0 and output.sid >= 0 and mani.sid != output.sid
+        assert st.get_symbol_by_id(mani.sid) is mani
+        assert st.get_symbol_by_id(output.sid) is output
+        assert st.get_symbol_id('a', 'main') == output.sid
+
+    def test_ssa_versions(self, get_visitor):
+        file = "test_cases/ssa/ssa_1.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                          name=file, calls=ir.calls))
+        st = program.symbol_table
+
+        x = st.get_local('x', 'main')
+        x1 = st.get_version(x.sid, 1)
+
+        assert x1 is st.get_local('x1', 'main')
+        assert x1.points_to is x and x1.base == x.sid
+        assert st.get_versioned(x1.sid) == (x.sid, 1)
+        assert st.version_name(x.sid, 1) == 'x1'
+
+    def test_versions_share_volumes(self, get_visitor):
+        file = "test_cases/ssa/ssa_1.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                          name=file, calls=ir.calls))
+        st = program.symbol_table
+
+        x = st.get_local('x', 'main')
+        x1 = st.get_version(x.sid, 1)
+        before = dict(x.volumes.items())
+
+        assert x1.volumes == x.volumes
+        x1.volumes.add(-1, 10.0)
+        assert dict(x.volumes.items()) == before
+        assert x1.volumes[-1] == [10.0]
+
+    def test_last_owner_writes_in_place(self):
+        VolumeMap.reset_stats()
+        volumes = VolumeMap({1: [10.0]})
+        forks = [volumes.fork(), volumes.fork()]
+
+        forks[0].add(1, 5.0)
+        volumes.add(1, 2.0)
+        # Only forks[1] is left with the original data, so it doesn't copy it.
+        forks[1].add(2, 1.0)
+
+        assert (volumes[1], forks[0][1], forks[1][1]) == ([10.0, 2.0], [10.0, 5.0], [10.0])
+        assert VolumeMap.shared == 2 and VolumeMap.copied == 2
+
+    def test_versions_created_once(self, get_visitor):
+        file = "test_cases/ssa/appel_ssa.bs"
+        ir = self.get_ir(get_visitor(file))
+        program = SSA().transform(Program(functions=ir.functions, symbol_table=ir.symbol_table, bb_graph=ir.graph,
+                                          name=file, calls=ir.calls))
+        st = program.symbol_table
+
+        versions = dict()
+        for block in program.functions['main']['blocks'].values():
+            for instruction in block.instructions:
+                for operand in list(instruction.uses) + [instruction.defs]:
+                    if isinstance(operand, dict) and isinstance(operand.get('var'), RenamedSymbol):
+                        assert versions.setdefault(operand['name'], operand['var']) is operand['var']
+
+        assert program.stats['SSA versions created'] == len(st.versions)
+        assert program.stats['SSA versions reused'] > 0
@@ -0,0 +1,59 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction, UseBy
+from compiler.data_structures.properties import BSTime
+from compiler.passes.analyses.timing_constraints import TimingConstraints
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.timing_constraints
+class TestTimingConstraints(FrontEndBase):
+
+    def get_mixes(self, get_visitor, file: str, deadline: float):
+        tree = get_visitor(file)
+        program = self.get_volume_program(tree, file)
+        mixes = [instruction for block in program.functions['main']['blocks'].values()
+                 for instruction in block.instructions if instruction.op == IRInstruction.MIX]
+        # The first mix's result has to be used within the deadline.
+        mixes[0].meta.append(UseBy(deadline, BSTime.SECOND))
+        return program, mixes
+
+    def test_deadline_met(self, get_visitor):
+        program, mixes = self.get_mixes(get_visitor, "test_cases/schedule/timing_heat.bs", 30)
+        timing = TimingConstraints().analyze(program)['result']['main']
+
+        assert timing.feasible and timing.checked
+        starts = {iid: start for block in timing.starts.values() for iid, start in block.items()}
+        assert starts[mixes[0].iid] == 0
+        # The second mix waits for the first, and for the heat.
+        assert starts[mixes[1].iid] == 40
+        assert program.stats['Timing constraints violated'] == 0
+
+    def test_deadline_violated(self, get_visitor):
+        program, mixes = self.get_mixes(get_visitor, "test_cases/schedule/timing_heat.bs", 20)
+        timing = TimingConstraints().analyze(program)['result']['main']
+
+        assert not timing.feasible
+        violations = [violation for block in timing.violations.values() for violation in block]
+        assert len(violations) == 1
+        # The heat comes between the two mixes.
+        assert violations[0].chain[0] == mixes[0].iid
+        assert violations[0].chain[-1] == mixes[1].iid
+        assert violations[0].deadline == 20
+        assert violations[0].needed == 30
+        assert program.stats['Timing constraints violated'] == 1
+
+    def test_deadline_across_blocks(self, get_visitor):
+        file = "test_cases/schedule/schedule_repeat.bs"
+        program = self.get_volume_program(get_visitor(file), file)
+        entry = program.functions['main']['blocks'][program.functions['main']['entry']]
+        dispense = next(instruction for instruction in entry.instructions if instruction.op == IRInstruction.DISPENSE)
+        # a is used in the loop, so its deadline is out of the block's reach.
+        dispense.meta.append(UseBy(1, BSTime.SECOND))
+        timing = TimingConstraints().analyze(program)['result']['main']
+
+        assert not timing.checked
+        assert timing.unchecked[entry.nid] == [dispense.iid]
+        assert program.stats['Timing constraints unchecked'] == 1
+        assert program.stats['Timing constraints violated'] == 0
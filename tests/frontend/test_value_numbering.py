@@ -0,0 +1,48 @@
+import pytest
+
+from compiler.data_structures.ir import IRInstruction
+from tests.frontend.front_end_base import FrontEndBase
+
+
+@pytest.mark.frontend
+@pytest.mark.value_numbering
+class TestValueNumbering(FrontEndBase):
+
+    def test_value_numbering(self, get_visitor):
+        file = "test_cases/transforms/value_numbering.bs"
+        program = self.get_program(get_visitor(file), file, "-gvn")
+
+        # j is k, so q is p.
+        assert program.stats['Redundant values removed'] == 2
+        assert program.stats['Dispenses coalesced'] == 0
+        assert len(self.instructions(program, IRInstruction.CONSTANT)) == 1
+        maths = self.instructions(program, IRInstruction.MATH)
+        assert len(maths) == 2
+        assert maths[1].uses[0]['name'] == maths[1].uses[1]['name'] == maths[0].defs['name']
+
+    def test_coalesce_dispenses(self, get_visitor):
+        file = "test_cases/transforms/value_numbering.bs"
+        program = self.get_program(get_visitor(file), file, "-gvn", "-cd")
+
+        assert program.stats['Dispenses coalesced'] == 1
+        # a and b are the lanes of one array; c is another reagent.
+        arrays = [instruction.defs for instruction in self.instructions(program, IRInstruction.DISPENSE)
+                  if instruction.defs['size'] == 2]
+        assert arrays and len({deff['name'] for deff in arrays}) == 1
+        mix = self.instructions(program, IRInstruction.MIX)[0]
+        assert [(use['name'], use['offset']) for use in mix.uses] == [(arrays[0]['name'], 0), (arrays[0]['name'], 1)]
+        assert not program.analysis['volume_tracking'][0]
+
+    def test_coalesced_dispense_placement(self, get_visitor):
+        file = "test_cases/transforms/value_numbering_spread.bs"
+        program = self.get_program(get_visitor(file), file, "-gvn", "-cd")
+
+        # a, b and d are one array; e comes after d is heated, so it stays on its own.
+        assert program.stats['Dispenses coalesced'] == 2
+        block = next(block for block in program.functions['main']['blocks'].values()
+                     if any(instruction.op == IRInstruction.HEAT for instruction in block.instructions))
+        ops = [(instruction.op, instruction.defs['size'] if instruction.op == IRInstruction.DISPENSE else None)
+               for instruction in block.instructions if instruction.op in {IRInstruction.DISPENSE, IRInstruction.HEAT}]
+        # The array is dispensed where d was: after c, and before the heat.
+        assert ops == [(IRInstruction.DISPENSE, 1), (IRInstruction.DISPENSE, 3), (IRInstruction.HEAT, None),
+                       (IRInstruction.DISPENSE, 1)]
@@ -205,3 +205,61 @@ class TestSplit(FrontEndBase):
         vol = self.get_volume(tree, file)
 
         assert vol[0]  # == True
+
+
+@pytest.mark.frontend
+@pytest.mark.volume
+@pytest.mark.mix
+class TestSIMD(FrontEndBase):
+
+    def test_mix_split(self, get_visitor):
+        file = "test_cases/volume/mix_simd.bs"
+
+        tree = get_visitor(file)
+
+        vol = self.get_volume(tree, file)
+
+        assert not vol[0]  # == False
+
+        # Each lane is mixed with the same lane of the other array.
+        assert vol[1][-1]['a1']['volumes'] == [10] * 64
+        assert vol[1][-1]['b1']['volumes'] == [-1] * 64
+        assert sum(vol[1][-1]['c1']['volumes']) == -1
+
+        # Each lane of c is split in two.
+        assert vol[1][-1]['d1']['size'] == 128
+        assert vol[1][-1]['d1']['volumes'] == [10] * 128
+
+    def test_not_enough(self, get_visitor):
+        file = "test_cases/volume/mix_simd_not_enough.bs"
+
+        tree = get_visitor(file)
+
+        vol = self.get_volume(tree, file)
+
+        assert vol[0]  # == True
+
+
+@pytest.mark.frontend
+@pytest.mark.volume
+class TestControlFlow(FrontEndBase):
+
+    def test_if_else_join(self, get_visitor):
+        file = "test_cases/volume/mix_if_else.bs"
+
+        tree = get_visitor(file)
+
+        vol = self.get_volume(tree, file)
+
+        # Only the smaller of the two a's is guaranteed after the if.
+        assert vol[0]  # == True
+
+    def test_repeat(self, get_visitor):
+        file = "test_cases/volume/mix_repeat.bs"
+
+        tree = get_visitor(file)
+
+        vol = self.get_volume(tree, file)
+
+        assert not vol[0]  # == False
+        assert sum(vol[1][-1]['b1']['volumes']) == -1